@@ -1,77 +1,31 @@
 import pygame
 import math
 import sys
-import socket
 import json
+import os
 import random
-import struct
 
-# --- NETWORK HELPER CLASS (DIRECT LOCAL CALLS) ---
-# --- NETWORK CLIENT (CONNECTS TO SERVER.PY) ---
-class NetworkClient:
-    def __init__(self):
-        self.server_ip = "127.0.0.1"
-        self.port = 65432
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connected = False
-        try:
-            self.client.connect((self.server_ip, self.port))
-            self.connected = True
-            print("[NETWORK] Connected to server.")
-        except Exception as e:
-            print(f"[NETWORK] Could not connect to server: {e}")
-
-    def recv_all(self, n):
-        """Helper function to receive exactly n bytes."""
-        data = bytearray()
-        while len(data) < n:
-            packet = self.client.recv(n - len(data))
-            if not packet:
-                return None
-            data.extend(packet)
-        return data
-
-    def send(self, command, payload={}):
-        if not self.connected:
-            return {'status': 'error', 'message': 'Not connected to server'}
+# --- NETWORK CLIENT (CONNECTS TO SERVER.PY, see network.py) ---
+from network import NetworkClient
 
-        try:
-            # 1. SENDING
-            req = {"command": command, "payload": payload}
-            data = json.dumps(req).encode('utf-8')
-            # Send message length + message
-            # (If you want the server to also read variable length input from client, 
-            #  server.py's receiving logic needs a similar update. 
-            #  BUT for now, your client sends small requests, so standard send is usually fine.
-            #  For safety, simply sending the data is okay for small commands.)
-            self.client.sendall(data) 
-            
-            # 2. RECEIVING (The Fix)
-            # A. Read the first 4 bytes to get the message length
-            raw_msglen = self.recv_all(4)
-            if not raw_msglen:
-                return {'status': 'error', 'message': 'Connection closed'}
-            
-            msglen = struct.unpack('>I', raw_msglen)[0]
-            
-            # B. Read exactly that many bytes
-            response_data = self.recv_all(msglen)
-            
-            if not response_data:
-                return {'status': 'error', 'message': 'Empty response body'}
-                
-            return json.loads(response_data.decode('utf-8'))
-            
-        except Exception as e:
-            print(f"[NETWORK] Error: {e}")
-            return {'status': 'error', 'message': str(e)}
+# --- INITIALIZE NETWORK ---
+# The session token is kept on disk so a restarted game skips the login screen
+SESSION_FILE = os.path.join(os.path.expanduser("~"), ".poolgame_session")
+# POOL_TRACE_FILE=client.trace records every round trip (see tracing.py)
+net = NetworkClient(session_file=SESSION_FILE, trace_file=os.environ.get("POOL_TRACE_FILE"))
 
-# Initialize
-net = NetworkClient()
+# --- SERVER PUSHES (see net.poll) ---
+# Achievements unlocked by the server, shown by whichever screen is open
+pushed_achievements = []
+# Set when an admin bans us or changes our role: the session is over
+session_ended = {}
 
-# --- INITIALIZE NETWORK ---
-# net = DirectClient()
-net = NetworkClient() 
+def on_achievement(data):
+    pushed_achievements.extend(data.get('achievements', []))
+
+net.on("achievement", on_achievement)
+net.on("banned", lambda data: session_ended.update(reason="banned"))
+net.on("role_changed", lambda data: session_ended.update(reason="role_changed", role=data.get('role')))
 
 # --- Pygame Setup ---
 pygame.init()
@@ -522,6 +476,9 @@ def post_login_menu(player_id, username, role):
         draw_neon_button(pass_btn, "CHANGE CREDENTIALS", NEON_PURPLE, pass_btn.collidepoint((mx, my)))
         draw_neon_button(logout_btn, "LOGOUT", NEON_MAGENTA, logout_btn.collidepoint((mx, my)))
 
+        net.poll()
+        if session_ended: return "logout"
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
 
@@ -549,10 +506,12 @@ def history_screen(target_id, target_name):
     # NETWORK CALL
     res = net.send("GET_HISTORY", {"player_id": target_id})
     games = res.get('data', [])
+    next_page = res.get('next') # cursor for the next (older) page, None on the last one
     
     scroll_y = 0; scroll_speed = 30
     start_x = 100; content_start_y = 120
     return_btn = pygame.Rect(20, 20, 150, 50)
+    more_btn = None
 
     while running:
         canvas.fill((20, 20, 20))
@@ -591,6 +550,14 @@ def history_screen(target_id, target_name):
                     draw_text(f"  > {details}", pygame.font.SysFont("Consolas", 18), txt_color, start_x + 20, current_y)
                 current_y += 25
             current_y += 40
+
+        more_btn = None
+        if next_page:
+            more_btn = pygame.Rect(start_x + 350, current_y, 300, 50)
+            if -50 < current_y < V_HEIGHT:
+                mx, my = get_virtual_mouse_pos()
+                draw_neon_button(more_btn, "LOAD MORE", NEON_CYAN, more_btn.collidepoint((mx, my)))
+            current_y += 70
         
         total_content_height = (current_y - scroll_y) - content_start_y
         min_scroll = min(0, -total_content_height + (V_HEIGHT - 150))
@@ -602,6 +569,12 @@ def history_screen(target_id, target_name):
             if event.type == pygame.MOUSEBUTTONDOWN:
                 mx, my = get_virtual_mouse_pos()
                 if return_btn.collidepoint((mx, my)): return
+                if more_btn and more_btn.collidepoint((mx, my)):
+                    # NETWORK CALL: next page, appended below what is shown
+                    res = net.send("GET_HISTORY", {"player_id": target_id, "before": next_page})
+                    if res.get('status') == 'success':
+                        games.extend(res.get('data', []))
+                        next_page = res.get('next')
             if event.type == pygame.MOUSEWHEEL: scroll_y += event.y * scroll_speed
         
         scaled_surf = pygame.transform.smoothscale(canvas, screen.get_size())
@@ -662,9 +635,15 @@ def personal_high_scores_screen(player_id):
 def achievements_screen(player_id, username):
     running = True
     # NETWORK CALLS
-    res_earned = net.send("GET_ACHIEVEMENTS", {"player_id": player_id})
+    # Both requests in one round trip
+    # The catalog is cached: after the first visit the server just says "not_modified"
+    _, results = net.batch([
+        ("GET_ACHIEVEMENTS", {"player_id": player_id}),
+        ("GET_ALL_ACHIEVEMENTS", net.versioned("GET_ALL_ACHIEVEMENTS")),
+    ], mode="best_effort")
+    res_earned, res_all = (results + [{}, {}])[:2]
+    res_all = net.unwrap("GET_ALL_ACHIEVEMENTS", res_all)
     earned = set(res_earned.get('data', [])) # Convert list back to set
-    res_all = net.send("GET_ALL_ACHIEVEMENTS", {})
     all_achievements = res_all.get('data', [])
 
     box_width, box_height = 1000, 80;
@@ -679,6 +658,11 @@ def achievements_screen(player_id, username):
         starfield.update_and_draw(canvas)
 
         draw_text(f"ACHIEVEMENTS", title_font, NEON_PURPLE, 450, 70)
+
+        # Unlocked elsewhere while this screen is open
+        net.poll()
+        while pushed_achievements:
+            earned.add(int(pushed_achievements.pop()["AchievementID"]))
         
         mx, my = get_virtual_mouse_pos()
         draw_neon_button(return_btn, "RETURN", NEON_MAGENTA, return_btn.collidepoint((mx, my)))
@@ -942,156 +926,280 @@ def change_password_screen(player_id, username):
         pygame.display.update()
 
 
+class UserDirectory:
+    """
+    The admin screen's user list. Pages of GET_USERS are fetched in the
+    background (net.submit, one at a time) as the list scrolls near the end
+    of what is loaded; changing the search, role or sort starts over.
+    """
+    PAGE = 50
+    TYPING_DELAY = 300 # ms of no typing before the search is sent
+
+    def __init__(self):
+        self.search = ""
+        self.role = None # None = everyone, "PLAYER" or "ADMIN"
+        self.sort = "name"
+        self.reset()
+        self.pending = None # (request id, query it was for)
+
+    def query(self):
+        return (self.search.strip(), self.role, self.sort)
+
+    def reset(self, typed=False):
+        self.users = []
+        self.next = None
+        self.done = False
+        self.error = None
+        self.wait_until = pygame.time.get_ticks() + self.TYPING_DELAY if typed else 0
+
+    def update(self, wanted):
+        """Collects a finished page, and asks for the next one while fewer than `wanted` rows are loaded."""
+        if self.pending:
+            req_id, query = self.pending
+            if not net.ready(req_id):
+                return
+            self.pending = None
+            try:
+                res = net.result(req_id)
+            except OSError as e:
+                net.connected = False
+                res = {'status': 'error', 'message': str(e)}
+            if query != self.query():
+                pass # the search changed while it was in flight
+            elif res.get('status') == 'success':
+                self.users.extend(res.get('data', []))
+                self.next = res.get('next')
+                self.done = not self.next
+            else:
+                self.error = res.get('message', "Error")
+                self.done = True
+
+        if self.done or len(self.users) >= wanted or pygame.time.get_ticks() < self.wait_until:
+            return
+        search, role, sort = self.query()
+        payload = {"sort": sort, "limit": self.PAGE}
+        if search: payload['search'] = search
+        if role: payload['role'] = role
+        if self.next: payload['after'] = self.next
+        if not net.connected and not net.reconnect():
+            self.error = "Not connected to server"; self.done = True
+            return
+        try:
+            # NETWORK CALL (reply collected by a later update)
+            self.pending = (net.submit("GET_USERS", payload), (search, role, sort))
+        except OSError as e:
+            net.connected = False
+            self.error = str(e); self.done = True
+
+    def loading(self):
+        return self.pending is not None or (not self.done and not self.error)
+
+    def remove(self, user):
+        self.users = [u for u in self.users if u is not user]
+
+
 def admin_screen(admin_id, admin_username):
-    running = True
-    
-    # 1. Fetch Data
-    res = net.send("GET_ALL_USERS", {})
-    users = res.get('data', [])
-    current_idx = 0
-    
-    # UI Layout
-    panel_rect = pygame.Rect(V_WIDTH//2 - 300, 100, 600, 450)
-    
-    # Navigation Buttons
-    prev_btn = pygame.Rect(panel_rect.x + 20, panel_rect.y + 100, 50, 50)
-    next_btn = pygame.Rect(panel_rect.right - 70, panel_rect.y + 100, 50, 50)
-    
-    # Action Buttons (Positions defined relative to panel)
-    # Button A: Used for Promote OR Revoke
-    action_btn_main = pygame.Rect(panel_rect.x + 50, panel_rect.y + 350, 240, 60)
-    # Button B: Used for Ban (Only shows for Players)
-    ban_btn = pygame.Rect(panel_rect.x + 310, panel_rect.y + 350, 240, 60)
-    history_btn = pygame.Rect(panel_rect.x + 50, panel_rect.y + 290, 240, 50)
+    users = UserDirectory()
+    selected = None # the user shown on the right
+    search_active = True
 
-    
+    # UI Layout
     return_btn = pygame.Rect(20, 20, 150, 50)
-    
+    search_box = pygame.Rect(20, 135, 340, 44)
+    role_btns = [(None, "ALL"), ("PLAYER", "PLAYERS"), ("ADMIN", "ADMINS")]
+    role_btns = [(role, label, pygame.Rect(380 + i * 115, 135, 105, 44)) for i, (role, label) in enumerate(role_btns)]
+    sort_btns = [("name", "NAME"), ("newest", "NEWEST"), ("games", "GAMES"), ("wins", "WINS")]
+    sort_btns = [(sort, label, pygame.Rect(740 + i * 110, 135, 100, 44)) for i, (sort, label) in enumerate(sort_btns)]
+
+    # Only the rows inside list_rect are drawn; more are fetched as it scrolls
+    list_rect = pygame.Rect(20, 230, 700, 360)
+    row_h = 36
+    prefetch = 20 # rows loaded beyond the bottom of the view
+    scroll = 0
+
+    panel_rect = pygame.Rect(740, 195, 440, 395)
+    # Button A: Used for Promote OR Revoke, Button B: Ban (only shows for Players)
+    action_btn_main = pygame.Rect(panel_rect.x + 20, panel_rect.y + 255, 190, 55)
+    ban_btn = pygame.Rect(panel_rect.x + 230, panel_rect.y + 255, 190, 55)
+    history_btn = pygame.Rect(panel_rect.x + 20, panel_rect.y + 320, 400, 50)
+
     status_msg = "Ready"
     msg_color = WHITE
+    small_font = pygame.font.SysFont("Arial", 20)
+
+    while True:
+        mx, my = get_virtual_mouse_pos()
+        visible_rows = list_rect.height // row_h
+        users.update((scroll // row_h) + visible_rows + prefetch)
+        net.poll()
 
-    while running:
         canvas.fill((10, 10, 10))
         draw_text(f"Admin Panel: {admin_username}", title_font, GOLD, 20, 80)
-        
+
         # Return Button
         pygame.draw.rect(canvas, RED, return_btn, border_radius=8)
         draw_text("RETURN", main_font, WHITE, return_btn.x + 25, return_btn.y + 10)
 
-        # Draw Main Panel
+        # --- SEARCH / FILTER / SORT ---
+        draw_neon_input(search_box, users.search, search_active)
+        if not users.search and not search_active:
+            draw_text("Search username...", small_font, (120, 120, 120), search_box.x + 10, search_box.y + 12)
+        for role, label, rect in role_btns:
+            draw_neon_button(rect, label, NEON_PURPLE if users.role == role else ACCENT_WHITE, rect.collidepoint((mx, my)))
+        for sort, label, rect in sort_btns:
+            draw_neon_button(rect, label, NEON_CYAN if users.sort == sort else ACCENT_WHITE, rect.collidepoint((mx, my)))
+
+        # --- USER LIST ---
+        header_y = list_rect.y - 30
+        draw_text("USERNAME", achievement_font, NEON_CYAN, list_rect.x + 10, header_y)
+        draw_text("ROLE", achievement_font, NEON_CYAN, list_rect.x + 330, header_y)
+        draw_text("GAMES", achievement_font, NEON_CYAN, list_rect.x + 460, header_y)
+        draw_text("WINS", achievement_font, NEON_CYAN, list_rect.x + 580, header_y)
+        pygame.draw.rect(canvas, (30, 30, 30), list_rect)
+
+        footer = "Loading..." if users.loading() else users.error # last row of the list
+        content_height = len(users.users) * row_h + (row_h if footer else 0)
+        scroll = max(0, min(scroll, content_height - list_rect.height))
+        first = scroll // row_h
+        canvas.set_clip(list_rect)
+        for i in range(first, min(len(users.users), first + visible_rows + 2)):
+            user = users.users[i]
+            y = list_rect.y + i * row_h - scroll
+            row = pygame.Rect(list_rect.x, y, list_rect.width, row_h)
+            if user is selected:
+                pygame.draw.rect(canvas, (40, 60, 90), row)
+            elif row.collidepoint((mx, my)):
+                pygame.draw.rect(canvas, (45, 45, 45), row)
+            role_color = GREEN if user['Role'] == 'ADMIN' else YELLOW
+            draw_text(user['Username'], small_font, WHITE, row.x + 10, y + 7)
+            draw_text(user['Role'], small_font, role_color, row.x + 330, y + 7)
+            draw_text(str(user['GamesPlayed']), small_font, WHITE, row.x + 460, y + 7)
+            draw_text(str(user['Wins']), small_font, WHITE, row.x + 580, y + 7)
+        if footer:
+            y = list_rect.y + len(users.users) * row_h - scroll
+            draw_text(footer, small_font, (150, 150, 150) if users.loading() else RED, list_rect.x + 10, y + 7)
+        elif not users.users:
+            draw_text("No users found.", main_font, RED, list_rect.x + 20, list_rect.y + 20)
+        canvas.set_clip(None)
+        pygame.draw.rect(canvas, WHITE, list_rect, 1)
+
+        # Scrollbar (sized by what is loaded so far)
+        if content_height > list_rect.height:
+            bar_h = max(30, list_rect.height * list_rect.height // content_height)
+            bar_y = list_rect.y + (list_rect.height - bar_h) * scroll // (content_height - list_rect.height)
+            pygame.draw.rect(canvas, NEON_CYAN, (list_rect.right - 8, bar_y, 6, bar_h), border_radius=3)
+
+        # --- SELECTED USER ---
         pygame.draw.rect(canvas, (30, 30, 30), panel_rect, border_radius=15)
         pygame.draw.rect(canvas, WHITE, panel_rect, 2, border_radius=15)
-
-        if users:
-            # Safety check for index
-            if current_idx >= len(users): current_idx = 0
-            user = users[current_idx]
-            
-            
-            
-            # --- NAV ARROWS ---
-            pygame.draw.rect(canvas, BLUE, prev_btn)
-            draw_text("<", title_font, WHITE, prev_btn.x + 15, prev_btn.y + 5)
-            pygame.draw.rect(canvas, BLUE, next_btn)
-            draw_text(">", title_font, WHITE, next_btn.x + 15, next_btn.y + 5)
-            
-            # --- DATA DISPLAY ---
-            cx = panel_rect.centerx
-            draw_text(f"User: {user['Username']}", title_font, WHITE, cx - 100, panel_rect.y + 40)
-            draw_text(f"ID: {user['UserID']}", main_font, (150,150,150), cx - 100, panel_rect.y + 110)
-            
-            role_color = GREEN if user['Role'] == 'ADMIN' else YELLOW
-            draw_text(f"Role: {user['Role']}", main_font, role_color, cx - 100, panel_rect.y + 150)
-            
-            draw_text(f"Games Played: {user['GamesPlayed']}", main_font, WHITE, cx - 100, panel_rect.y + 200)
-            draw_text(f"Wins: {user['Wins']}", main_font, WHITE, cx - 100, panel_rect.y + 240)
+        if selected:
+            px = panel_rect.x + 20
+            draw_text(f"User: {selected['Username']}", title_font, WHITE, px, panel_rect.y + 20)
+            draw_text(f"ID: {selected['UserID']}", main_font, (150,150,150), px, panel_rect.y + 75)
+            role_color = GREEN if selected['Role'] == 'ADMIN' else YELLOW
+            draw_text(f"Role: {selected['Role']}", main_font, role_color, px, panel_rect.y + 115)
+            draw_text(f"Games Played: {selected['GamesPlayed']}", main_font, WHITE, px, panel_rect.y + 155)
+            draw_text(f"Wins: {selected['Wins']}", main_font, WHITE, px, panel_rect.y + 195)
 
             # --- DYNAMIC ACTION BUTTONS ---
-            
             # Check if viewing self (Cannot ban/demote self)
-            if user['UserID'] == admin_id:
-                draw_text("Current User (You)", main_font, SKYBLUE, cx - 80, panel_rect.y + 360)
+            if selected['UserID'] == admin_id:
+                draw_text("Current User (You)", main_font, SKYBLUE, px, panel_rect.y + 270)
+            elif selected['Role'] == 'ADMIN':
+                # CASE 1: TARGET IS ADMIN -> Show Revoke Only
+                pygame.draw.rect(canvas, ORANGE, action_btn_main, border_radius=10)
+                draw_text("REVOKE ADMIN", main_font, BLACK, action_btn_main.x + 12, action_btn_main.y + 13)
             else:
-                if user['Role'] == 'ADMIN':
-                    # CASE 1: TARGET IS ADMIN -> Show Revoke Only
-                    pygame.draw.rect(canvas, ORANGE, action_btn_main, border_radius=10)
-                    draw_text("REVOKE ADMIN", main_font, BLACK, action_btn_main.x + 35, action_btn_main.y + 15)
-                else:
-                    # CASE 2: TARGET IS PLAYER -> Show Promote AND Ban
-                    # Promote
-                    pygame.draw.rect(canvas, GREEN, action_btn_main, border_radius=10)
-                    draw_text("MAKE ADMIN", main_font, BLACK, action_btn_main.x + 45, action_btn_main.y + 15)
-                    # Ban
-                    pygame.draw.rect(canvas, RED, ban_btn, border_radius=10)
-                    draw_text("BAN USER", main_font, WHITE, ban_btn.x + 60, ban_btn.y + 15)
-
-                    pygame.draw.rect(canvas, SKYBLUE, history_btn, border_radius=10)
-                    draw_text("VIEW HISTORY", main_font, BLACK, history_btn.x + 45, history_btn.y + 15)
-
+                # CASE 2: TARGET IS PLAYER -> Show Promote, Ban and History
+                pygame.draw.rect(canvas, GREEN, action_btn_main, border_radius=10)
+                draw_text("MAKE ADMIN", main_font, BLACK, action_btn_main.x + 25, action_btn_main.y + 13)
+                pygame.draw.rect(canvas, RED, ban_btn, border_radius=10)
+                draw_text("BAN USER", main_font, WHITE, ban_btn.x + 40, ban_btn.y + 13)
+                pygame.draw.rect(canvas, SKYBLUE, history_btn, border_radius=10)
+                draw_text("VIEW HISTORY", main_font, BLACK, history_btn.x + 125, history_btn.y + 12)
         else:
-            draw_text("No users found.", title_font, RED, panel_rect.x + 200, panel_rect.y + 200)
+            draw_text("Select a user", main_font, (150, 150, 150), panel_rect.x + 140, panel_rect.y + 170)
 
-        draw_text(status_msg, main_font, msg_color, panel_rect.x + 20, panel_rect.bottom + 20)
+        draw_text(status_msg, main_font, msg_color, 20, list_rect.bottom + 15)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
-            
-        # Open history screen passing the SELECTED user's ID
-            
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mx, my = get_virtual_mouse_pos()
-                
+
+            if event.type == pygame.MOUSEWHEEL:
+                scroll -= event.y * row_h
+
+            if event.type == pygame.KEYDOWN:
+                if event.key in (pygame.K_UP, pygame.K_DOWN) and users.users:
+                    # Move the selection, keeping it in view
+                    i = users.users.index(selected) if selected in users.users else -1
+                    i = max(0, min(len(users.users) - 1, i + (1 if event.key == pygame.K_DOWN else -1)))
+                    selected = users.users[i]
+                    scroll = min(scroll, i * row_h)
+                    scroll = max(scroll, (i + 1) * row_h - list_rect.height)
+                elif search_active:
+                    if event.key == pygame.K_BACKSPACE: users.search = users.search[:-1]
+                    elif event.unicode and event.unicode.isprintable() and len(users.search) < 50: users.search += event.unicode
+                    else: continue
+                    users.reset(typed=True); scroll = 0
+
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if return_btn.collidepoint((mx, my)): return
-                
-                if users:
-                    if prev_btn.collidepoint((mx, my)):
-                        current_idx = (current_idx - 1) % len(users)
-                        status_msg = "Ready"; msg_color = WHITE
-                    
-                    if next_btn.collidepoint((mx, my)):
-                        current_idx = (current_idx + 1) % len(users)
+                search_active = search_box.collidepoint((mx, my))
+
+                for role, label, rect in role_btns:
+                    if rect.collidepoint((mx, my)) and users.role != role:
+                        users.role = role; users.reset(); scroll = 0
+                for sort, label, rect in sort_btns:
+                    if rect.collidepoint((mx, my)) and users.sort != sort:
+                        users.sort = sort; users.reset(); scroll = 0
+
+                if list_rect.collidepoint((mx, my)):
+                    i = (my - list_rect.y + scroll) // row_h
+                    if 0 <= i < len(users.users):
+                        selected = users.users[int(i)]
                         status_msg = "Ready"; msg_color = WHITE
 
-                    if history_btn.collidepoint((mx, my)): history_screen(user['UserID'], user['Username'])
-                    
-                    user = users[current_idx]
-                    
-                    # Prevent actions on self
-                    if user['UserID'] != admin_id:
-                        
-                        # --- LOGIC FOR ADMIN TARGET ---
-                        if user['Role'] == 'ADMIN':
-                            if action_btn_main.collidepoint((mx, my)): # Revoke Button
-                                print(f"Clicking Revoke for UserID: {user['UserID']}")
-                                res = net.send("REVOKE_ADMIN", {"target_id": user['UserID']})
-                                if res.get('status') == 'success':
-                                    user['Role'] = 'PLAYER' # Update local
-                                    status_msg = "Admin Revoked"; msg_color = ORANGE
-                                else:
-                                    status_msg = "Error"; msg_color = RED
-
-                        # --- LOGIC FOR PLAYER TARGET ---
-                        else:
-                            if action_btn_main.collidepoint((mx, my)): # Promote Button
-                                res = net.send("PROMOTE_USER", {"target_id": user['UserID']})
-                                if res.get('status') == 'success':
-                                    user['Role'] = 'ADMIN' # Update local
-                                    status_msg = "User Promoted"; msg_color = GREEN
-                                else:
-                                    status_msg = "Error"; msg_color = RED
-                            
-                            elif ban_btn.collidepoint((mx, my)): # Ban Button
-                                res = net.send("BAN_USER", {"target_id": user['UserID']})
-                                if res.get('status') == 'success':
-                                    users.pop(current_idx) # Remove from list
-                                    if current_idx >= len(users) and current_idx > 0: current_idx -= 1
-                                    status_msg = "User Banned"; msg_color = RED
-                                else:
-                                    status_msg = "Error banning"; msg_color = RED
+                # Prevent actions on self
+                if selected and selected['UserID'] != admin_id:
+                    user = selected
+                    # --- LOGIC FOR ADMIN TARGET ---
+                    if user['Role'] == 'ADMIN':
+                        if action_btn_main.collidepoint((mx, my)): # Revoke Button
+                            res = net.send("REVOKE_ADMIN", {"target_id": user['UserID']})
+                            if res.get('status') == 'success':
+                                user['Role'] = 'PLAYER' # Update local
+                                status_msg = "Admin Revoked"; msg_color = ORANGE
+                            else:
+                                status_msg = "Error"; msg_color = RED
+
+                    # --- LOGIC FOR PLAYER TARGET ---
+                    else:
+                        if action_btn_main.collidepoint((mx, my)): # Promote Button
+                            res = net.send("PROMOTE_USER", {"target_id": user['UserID']})
+                            if res.get('status') == 'success':
+                                user['Role'] = 'ADMIN' # Update local
+                                user['GamesPlayed'] = user['Wins'] = 0 # player stats go with the Player row
+                                status_msg = "User Promoted"; msg_color = GREEN
+                            else:
+                                status_msg = "Error"; msg_color = RED
+
+                        elif ban_btn.collidepoint((mx, my)): # Ban Button
+                            res = net.send("BAN_USER", {"target_id": user['UserID']})
+                            if res.get('status') == 'success':
+                                users.remove(user) # Remove from list
+                                selected = None
+                                status_msg = "User Banned"; msg_color = RED
+                            else:
+                                status_msg = "Error banning"; msg_color = RED
+
+                        # Open history screen for the SELECTED user
+                        elif history_btn.collidepoint((mx, my)):
+                            history_screen(user['UserID'], user['Username'])
 
         scaled_surf = pygame.transform.smoothscale(canvas, screen.get_size())
         screen.blit(scaled_surf, (0, 0))
         pygame.display.update()
+        clock.tick(60)
 
 
 def main_game(player_id, username, difficulty_id):
@@ -1102,6 +1210,7 @@ def main_game(player_id, username, difficulty_id):
     # NETWORK CALL: Cache achievements
     res = net.send("GET_ACHIEVEMENTS", {"player_id": player_id})
     earned_achievements_cache = set(res.get('data', []))
+    pushed_achievements.clear() # already in the cache
     
     achievement_popup_queue = []
     FIRST_POT_ID = 8; COMBO_ACHIEVEMENT_ID = 7
@@ -1167,6 +1276,14 @@ def main_game(player_id, username, difficulty_id):
 
         col_snd = False; pot_snd = False
 
+        # Achievements the server pushed that we have not shown yet
+        net.poll()
+        while pushed_achievements:
+            ach = pushed_achievements.pop(0)
+            if ach["AchievementID"] not in earned_achievements_cache:
+                earned_achievements_cache.add(ach["AchievementID"])
+                achievement_popup_queue.append({"text": ach["Name"], "timer": 0})
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT: running = False
             if not cue.is_moving and not game_over and not foul_waiting_for_stop:
@@ -1296,20 +1413,32 @@ def main_game(player_id, username, difficulty_id):
             if score < 0: score = 0
 
         if game_over and not game_over_saved:
-            # 1. Save Session (Get ID)
-            res_sess = net.send("SAVE_SESSION", {"pid": player_id, "diff": difficulty_id, "score": score, "win": did_win})
-            sid = res_sess.get('session_id')
-            
-            if sid:
-                # 2. Save Events
-                net.send("SAVE_EVENTS", {"session_id": sid, "events": game_events})
-                
-                # 3. Check End Game Achievements
-                res_ach = net.send("CHECK_ACHIEVEMENTS", {
-                    "pid": player_id, "diff": difficulty_id, "timer": timer, 
-                    "shots": shots, "fouls": fouls, "win": did_win
-                })
-                for ach in res_ach.get('data', []):
+            # Save Session -> Save Events -> Check End Game Achievements,
+            # one round trip and one DB transaction
+            session = {"pid": player_id, "diff": difficulty_id, "score": score, "win": did_win}
+            check = ("CHECK_ACHIEVEMENTS", {
+                "pid": player_id, "diff": difficulty_id, "timer": timer, 
+                "shots": shots, "fouls": fouls, "win": did_win
+            })
+            ok, results = net.batch([
+                ("SAVE_SESSION", session),
+                ("SAVE_EVENTS", {"session_id": net.ref(0, "session_id"), "events": game_events}),
+                check,
+            ])
+            if not ok and results:
+                # The server rolled the batch back (e.g. on a bad event row).
+                # Still keep the game itself, as before batching.
+                res_sess = net.send("SAVE_SESSION", session)
+                sid = res_sess.get('session_id')
+                results = []
+                if sid:
+                    results = [res_sess] + net.send_many([
+                        ("SAVE_EVENTS", {"session_id": sid, "events": game_events}),
+                        check,
+                    ])
+            if len(results) == 3:
+                for ach in results[2].get('data', []):
+                    earned_achievements_cache.add(ach["AchievementID"]) # its push is a duplicate
                     achievement_popup_queue.append({"text": ach["Name"], "timer": 0})
             
             game_over_saved = True
@@ -1429,11 +1558,18 @@ def main_game(player_id, username, difficulty_id):
     pygame.quit(); sys.exit()
 
 while True:
-    pid_data = login_register_screen() # Returns tuple or None
+    # Saved session from the last run? Then no login (and no password hashing) needed
+    res = net.resume() if net.token else {}
+    if res.get('success'):
+        pid_data = (res['player_id'], res['username'], res['role'])
+    else:
+        pid_data = login_register_screen() # Returns tuple or None
     if pid_data is None: break
     
     # 1. Unpack Data
     player_id, username, role = pid_data 
+    session_ended.clear()
+    net.subscribe(["user"]) # achievement / ban / role pushes
     
     # 2. Check Role IMMEDIATELY
     if role == 'ADMIN':
@@ -1463,4 +1599,7 @@ while True:
             elif choice == "logout": 
                 break
 
+    # Leaving either flow means logging out: forget the saved session
+    net.logout()
+
 pygame.quit(); sys.exit()
\ No newline at end of file
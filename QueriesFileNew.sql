@@ -17,7 +17,10 @@ CREATE TABLE User (
   Salt VARCHAR(128) NOT NULL,
   Role ENUM('PLAYER', 'ADMIN') NOT NULL,
   DateCreated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  PRIMARY KEY (UserID)
+  PRIMARY KEY (UserID),
+  -- Admin user directory (auth.get_users_page): role filter with each sort
+  INDEX idx_user_role_name (Role, Username),
+  INDEX idx_user_role_id (Role, UserID)
 );
 
 -- -----------------------------------------------------
@@ -128,6 +131,51 @@ CREATE TABLE PlayerAchievement (
   FOREIGN KEY (AchievementID) REFERENCES Achievement(AchievementID) ON DELETE CASCADE
 );
 
+-- -----------------------------------------------------
+-- Table: SpoolCheckpoint
+-- Write-behind event spool (spool.py): last spool record per
+-- server process that is already in GameEvent. Moved in the
+-- same transaction as the inserted events.
+-- -----------------------------------------------------
+CREATE TABLE SpoolCheckpoint (
+  SpoolID VARCHAR(100) NOT NULL,
+  LastSeq BIGINT NOT NULL DEFAULT 0,
+  UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (SpoolID)
+);
+
+-- -----------------------------------------------------
+-- Tables: PlayerStats, PlayerDifficultyStats
+-- Running totals per player, updated in the same transaction
+-- as the game or events they count (auth.save_game_session,
+-- save_event_log, flush_spooled_events), so the admin list and
+-- the achievement checks need no scans of GameParticipant.
+-- Check or rebuild them with: python playerstats.py verify|rebuild
+-- -----------------------------------------------------
+CREATE TABLE PlayerStats (
+  PlayerID INT NOT NULL,
+  GamesPlayed INT NOT NULL DEFAULT 0,
+  Wins INT NOT NULL DEFAULT 0,
+  TotalPots INT NOT NULL DEFAULT 0,   -- POTTED events
+  TotalFouls INT NOT NULL DEFAULT 0,  -- FOUL events
+  LastPlayed TIMESTAMP NULL,
+  PRIMARY KEY (PlayerID),
+  -- "most games" / "most wins" orders of the admin user directory
+  INDEX idx_ps_games (GamesPlayed, PlayerID),
+  INDEX idx_ps_wins (Wins, PlayerID),
+  FOREIGN KEY (PlayerID) REFERENCES Player(PlayerID) ON DELETE CASCADE
+);
+
+CREATE TABLE PlayerDifficultyStats (
+  PlayerID INT NOT NULL,
+  DifficultyID INT NOT NULL,
+  GamesPlayed INT NOT NULL DEFAULT 0,
+  BestScore INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (PlayerID, DifficultyID),
+  FOREIGN KEY (PlayerID) REFERENCES Player(PlayerID) ON DELETE CASCADE,
+  FOREIGN KEY (DifficultyID) REFERENCES DifficultyLevel(DifficultyID)
+);
+
 -- =====================================================
 -- DATA POPULATION
 -- =====================================================
@@ -184,7 +232,8 @@ BEGIN
         Name VARCHAR(100)
     );
     
-    TRUNCATE TABLE NewAchievements;
+    -- DELETE, not TRUNCATE: TRUNCATE commits implicitly, which would end a BATCH transaction
+    DELETE FROM NewAchievements;
 
     -- 2. Check "Win-Only" Achievements
     IF p_DidWin THEN
@@ -229,10 +278,10 @@ BEGIN
             END IF;
         END IF;
         
-        -- Achievement ID 5: "First Victory"
-        SELECT COUNT(*) INTO total_wins
-        FROM GameParticipant
-        WHERE PlayerID = p_PlayerID AND IsWinner = 1;
+        -- Achievement ID 5: "First Victory" (PlayerStats already counts this game)
+        SELECT Wins INTO total_wins
+        FROM PlayerStats
+        WHERE PlayerID = p_PlayerID;
         
         IF total_wins = 1 THEN
             INSERT IGNORE INTO PlayerAchievement (PlayerID, AchievementID, DateEarned)
@@ -248,8 +297,8 @@ BEGIN
     -- 3. Check "Any Game" Achievements (Win or Lose)
     
     -- Achievement ID 6: "On the Board"
-    SELECT COUNT(*) INTO total_games
-    FROM GameParticipant
+    SELECT GamesPlayed INTO total_games
+    FROM PlayerStats
     WHERE PlayerID = p_PlayerID;
     
     IF total_games = 1 THEN
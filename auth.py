@@ -1,9 +1,14 @@
 import mysql
 from mysql.connector import *
-import hashlib
-import os
+import threading
+import time
+from contextlib import contextmanager
 
-from hmac import compare_digest
+import dbpool
+import kdf
+import logger
+import metrics
+import tracing
 
 # --- 1. Connection Details ---
 DB_HOST = "localhost"
@@ -11,19 +16,305 @@ DB_NAME = "pool_game_db"
 DB_USER = "root"
 DB_PASS = "roo123" # !!! UPDATE THIS !!!
 
+log = logger.get("auth")
+
+# Set while a transaction() block is active on this thread
+_tx = threading.local()
+
+def _connect():
+    return mysql.connector.connect(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASS
+    )
+
+# Connections are borrowed from here and handed back by conn.close() (see dbpool.py)
+POOL = dbpool.ConnectionPool(_connect)
+POOL.register_gauges()
+
+def configure_pool(min_size=dbpool.POOL_MIN, max_size=dbpool.POOL_MAX, timeout=dbpool.POOL_TIMEOUT,
+                   max_lifetime=dbpool.MAX_LIFETIME, max_statements=dbpool.MAX_STATEMENTS):
+    """Sizes the pool. Call before the first query."""
+    POOL.min_size = min_size
+    POOL.max_size = max_size
+    POOL.timeout = timeout
+    POOL.max_lifetime = max_lifetime
+    POOL.max_statements = max_statements
+
 def get_db_connection():
+    shared = getattr(_tx, 'conn', None)
+    if shared is not None:
+        return shared
     try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS
-        )
-        return conn
+        started = time.perf_counter()
+        conn = POOL.acquire()
+        elapsed = time.perf_counter() - started
+        metrics.add_db_time(elapsed)
+        tracing.record("checkout", elapsed, cat="db")
+        return _TimedConnection(conn)
+    except dbpool.PoolTimeout as e:
+        log.warn("no free database connection", error=str(e))
+        return None
     except Error as e:
-        print(f"Error connecting to MySQL: {e}")
+        log.error("could not connect to MySQL", error=str(e))
         return None
 
+# --- DB TIMING ---
+# Every connection handed out above is wrapped so the time spent waiting on
+# MySQL is added to the current request's DB time (see metrics.py), and
+# recorded as a span when the request is traced (see tracing.py).
+
+def _timed(name, fn, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.add_db_time(elapsed)
+        if tracing.current() is not None:
+            tracing.record(name, elapsed, cat="db", sql=tracing.sql_text(args))
+
+class _TimedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        return _timed("execute", self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return _timed("executemany", self._cursor.executemany, *args, **kwargs)
+
+    def fetchone(self):
+        return _timed("fetchone", self._cursor.fetchone)
+
+    def fetchall(self):
+        return _timed("fetchall", self._cursor.fetchall)
+
+    def nextset(self):
+        return _timed("nextset", self._cursor.nextset)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _TimedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        if USE_PREPARED and not args and set(kwargs) <= {"dictionary"}:
+            return _TimedCursor(_StatementCursor(self._conn, kwargs.get("dictionary", False)))
+        return _TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        _timed("commit", self._conn.commit)
+
+    def rollback(self):
+        _timed("rollback", self._conn.rollback)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+# --- PREPARED STATEMENTS ---
+# Cursors handed out by conn.cursor() / conn.cursor(dictionary=True) run
+# SELECT/INSERT/UPDATE/DELETE as server-side prepared statements, cached on
+# the pooled connection by SQL text (see dbpool.statement), so MySQL parses
+# each statement once per connection instead of once per call.
+# Rows are read off the prepared cursor straight away, which frees it for
+# the next call and lets us hand out dicts.
+# Everything else (CALL, SET, executemany, which the driver turns into one
+# multi-row INSERT) goes through a plain text cursor as before.
+
+USE_PREPARED = True
+_PREPARABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE")
+_unpreparable = set() # SQL MySQL refused to prepare; sent as text from then on
+
+class _StatementCursor:
+    def __init__(self, conn, dictionary):
+        self._conn = conn
+        self._dictionary = dictionary
+        self._text = None # plain cursor, created when needed
+        self._rows = None # buffered result of the last prepared execute
+        self._pos = 0
+        self.rowcount = -1
+        self.lastrowid = None
+        self.column_names = ()
+        self._description = None
+
+    @property
+    def description(self):
+        if self._rows is None:
+            return self._plain().description
+        return self._description
+
+    def _plain(self):
+        if self._text is None:
+            self._text = self._conn.cursor(dictionary=self._dictionary)
+        return self._text
+
+    def _text_cursor(self):
+        self._rows = None # the text cursor runs (and answers for) the next statement
+        return self._plain()
+
+    def execute(self, operation, params=()):
+        if (operation in _unpreparable
+                or not operation.lstrip()[:7].upper().startswith(_PREPARABLE)):
+            return self._text_cursor().execute(operation, params)
+        sql, stmt = self._conn.statement(operation)
+        try:
+            stmt.execute(sql, params or ())
+        except Error as e:
+            if e.errno != 1295: # ER_UNSUPPORTED_PS
+                raise
+            _unpreparable.add(operation)
+            return self._text_cursor().execute(operation, params)
+        rows = []
+        self._description = stmt.description
+        if stmt.description:
+            self.column_names = tuple(stmt.column_names)
+            rows = stmt.fetchall()
+            if self._dictionary:
+                rows = [dict(zip(self.column_names, row)) for row in rows]
+        self._rows, self._pos = rows, 0
+        self.rowcount = stmt.rowcount
+        self.lastrowid = stmt.lastrowid
+
+    def executemany(self, operation, seq_params):
+        cursor = self._text_cursor()
+        result = cursor.executemany(operation, seq_params)
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+        return result
+
+    def fetchone(self):
+        if self._rows is None:
+            return self._plain().fetchone()
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchall(self):
+        if self._rows is None:
+            return self._plain().fetchall()
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def nextset(self):
+        if self._rows is None:
+            return self._plain().nextset()
+        return None
+
+    def __getattr__(self, name): # anything else: from the text cursor
+        return getattr(self._plain(), name)
+
+    def close(self):
+        # Prepared cursors stay with the connection
+        if self._text is not None:
+            self._text.close()
+
+# --- SHARED TRANSACTIONS (used by the BATCH command) ---
+
+class _SharedCursor:
+    """Cursor proxy that remembers if any statement failed inside the transaction."""
+    def __init__(self, cursor, owner):
+        self._cursor = cursor
+        self._owner = owner
+
+    def execute(self, *args, **kwargs):
+        try:
+            return self._cursor.execute(*args, **kwargs)
+        except Error:
+            self._owner.failed = True
+            raise
+
+    def executemany(self, *args, **kwargs):
+        try:
+            return self._cursor.executemany(*args, **kwargs)
+        except Error:
+            self._owner.failed = True
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _SharedConnection:
+    """
+    Handed out by get_db_connection() inside transaction().
+    The auth.* functions keep calling commit/rollback/close as usual, but
+    those only take effect when the outer transaction ends.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self.failed = False
+        self.after_commit = [] # callables run once the transaction has committed
+
+    def cursor(self, *args, **kwargs):
+        return _SharedCursor(self._conn.cursor(*args, **kwargs), self)
+
+    def start_transaction(self, *args, **kwargs):
+        pass # Already inside one
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.failed = True # The whole transaction is rolled back at the end
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@contextmanager
+def transaction():
+    """
+    Runs every auth.* call in the block on one connection and one transaction.
+    Commits at the end, or rolls everything back if the block raises or any
+    statement failed. Yields the shared connection (None if the DB is down).
+    Functions in shared.after_commit run after a successful commit; one that
+    raises is logged and skipped.
+    """
+    if getattr(_tx, 'conn', None) is not None:
+        raise RuntimeError("Nested auth.transaction() is not supported")
+    conn = get_db_connection()
+    if conn is None:
+        yield None
+        return
+    shared = _SharedConnection(conn)
+    _tx.conn = shared
+    committed = False
+    try:
+        conn.start_transaction()
+        yield shared
+        if shared.failed:
+            conn.rollback()
+        else:
+            conn.commit()
+            committed = True
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _tx.conn = None
+        conn.close()
+    if committed:
+        # The data is in; a failing callback is logged, the caller still succeeds
+        for fn in shared.after_commit:
+            try:
+                fn()
+            except Exception as e:
+                log.error("after-commit callback failed", callback=getattr(fn, '__qualname__', str(fn)), error=str(e))
+
+def current_transaction():
+    """The shared connection of the enclosing transaction() on this thread, or None."""
+    return getattr(_tx, 'conn', None)
+
 # --- AUTHENTICATION FUNCTIONS (UPDATED FOR USER/PLAYER SPLIT) ---
 
 def register_player(username, password):
@@ -35,11 +326,8 @@ def register_player(username, password):
     if not username or not password:
         return {'success': False, 'message': 'Username and password cannot be empty.'}
 
-    # Generate Hash
-    salt = os.urandom(16)
-    password_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100000)
-    salt_hex = salt.hex()
-    hash_hex = password_hash.hex()
+    # Generate Hash (on the KDF pool, raises kdf.KdfBusy when it is full)
+    salt_hex, hash_hex = kdf.hash_password(password)
 
     conn = get_db_connection()
     if conn is None:
@@ -107,11 +395,8 @@ def login_player(username, password):
         user_id = user_data['UserID']
         role = user_data['Role']
 
-        # 2. Verify Password
-        salt = bytes.fromhex(stored_salt_hex)
-        new_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100000)
-
-        if not compare_digest(new_hash, bytes.fromhex(stored_hash_hex)):
+        # 2. Verify Password (on the KDF pool, raises kdf.KdfBusy when it is full)
+        if not kdf.verify_password(password, stored_salt_hex, stored_hash_hex):
             return {'success': False, 'message': 'Login failed: Invalid username or password.'}
 
         # 3. CONDITIONAL SELF-HEALING
@@ -121,7 +406,7 @@ def login_player(username, password):
             sql_check = "SELECT PlayerID FROM Player WHERE PlayerID = %s"
             cursor.execute(sql_check, (user_id,))
             if not cursor.fetchone():
-                print(f"Self-healed Player record for UserID {user_id}")
+                log.warn("self-healed Player record", user_id=user_id)
                 cursor.execute("INSERT INTO Player (PlayerID) VALUES (%s)", (user_id,))
                 conn.commit()
 
@@ -146,27 +431,132 @@ def get_all_users_for_admin():
     if conn is None: return []
     cursor = conn.cursor(dictionary=True)
     try:
-        # Left join to get stats even if they haven't played
+        # Running totals from PlayerStats; left join for users who haven't played
         sql = """
             SELECT u.UserID, u.Username, u.Role,
-                   COUNT(gp.GameSessionID) as GamesPlayed,
-                   SUM(CASE WHEN gp.IsWinner = 1 THEN 1 ELSE 0 END) as Wins
+                   COALESCE(ps.GamesPlayed, 0) as GamesPlayed,
+                   COALESCE(ps.Wins, 0) as Wins
             FROM User u
-            LEFT JOIN Player p ON u.UserID = p.PlayerID
-            LEFT JOIN GameParticipant gp ON p.PlayerID = gp.PlayerID
-            GROUP BY u.UserID
+            LEFT JOIN PlayerStats ps ON ps.PlayerID = u.UserID
             ORDER BY u.Username ASC
         """
         cursor.execute(sql)
         return cursor.fetchall()
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="get_all_users_for_admin", error=str(e))
         return []
     finally:
         cursor.close(); conn.close()
 
-
-
+# --- USER DIRECTORY (GET_USERS) ---
+# One page of users at a time, keyset paged so page N costs what page 1
+# does. Each sort walks an index (see QueriesFileNew.sql):
+#   name    - Username A-Z           User.Username (UNIQUE), idx_user_role_name
+#   newest  - UserID descending      PRIMARY, idx_user_role_id
+#   games   - GamesPlayed descending idx_ps_games, then users with no games
+#   wins    - Wins descending        idx_ps_wins, then users with no games
+# The games/wins sorts read PlayerStats first and then, newest first, the
+# users without a PlayerStats row (admins and players who never finished a
+# game), so `after` carries which of the two it stopped in.
+
+USER_SORTS = ("name", "newest", "games", "wins")
+_USER_COLUMNS = """u.UserID, u.Username, u.Role,
+                   COALESCE(ps.GamesPlayed, 0) as GamesPlayed,
+                   COALESCE(ps.Wins, 0) as Wins"""
+
+def _user_filters(search, role):
+    """WHERE terms and parameters for the username prefix and role filters."""
+    where, params = [], []
+    if search:
+        # '!' escapes LIKE wildcards typed into the search box
+        prefix = search.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+        where.append("u.Username LIKE %s ESCAPE '!'")
+        params.append(prefix + "%")
+    if role:
+        where.append("u.Role = %s")
+        params.append(role)
+    return where, params
+
+def _where(terms):
+    return "WHERE " + " AND ".join(terms) if terms else ""
+
+def get_users_page(search=None, role=None, sort="name", after=None, limit=50):
+    """
+    (users, next_after) for one page of the directory. `after` is the
+    next_after of the previous page, None for the first; next_after is None
+    on the last page. Returns (None, None) if the DB is unreachable.
+    """
+    conn = get_db_connection()
+    if conn is None: return None, None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        if sort in ("games", "wins"):
+            column = "GamesPlayed" if sort == "games" else "Wins"
+            rows = []
+            # Admins have no Player row, so no PlayerStats row either
+            if (after is None or after[0] == "stats") and role != "ADMIN":
+                where, params = _user_filters(search, role)
+                if after is not None:
+                    where.append(f"(ps.{column} < %s OR (ps.{column} = %s AND ps.PlayerID < %s))")
+                    params += [after[1], after[1], after[2]]
+                cursor.execute(f"""
+                    SELECT {_USER_COLUMNS}
+                    FROM PlayerStats ps
+                    JOIN User u ON u.UserID = ps.PlayerID
+                    {_where(where)}
+                    ORDER BY ps.{column} DESC, ps.PlayerID DESC LIMIT %s
+                """, params + [limit + 1])
+                rows = cursor.fetchall()
+                after = None
+            from_stats = len(rows)
+            if len(rows) <= limit:
+                where, params = _user_filters(search, role)
+                where.append("ps.PlayerID IS NULL")
+                if after is not None:
+                    where.append("u.UserID < %s")
+                    params.append(after[1])
+                cursor.execute(f"""
+                    SELECT {_USER_COLUMNS}
+                    FROM User u
+                    LEFT JOIN PlayerStats ps ON ps.PlayerID = u.UserID
+                    {_where(where)}
+                    ORDER BY u.UserID DESC LIMIT %s
+                """, params + [limit + 1 - len(rows)])
+                rows += cursor.fetchall()
+            if len(rows) <= limit:
+                return rows, None
+            last = rows[limit - 1]
+            if limit <= from_stats:
+                return rows[:limit], ("stats", last[column], last['UserID'])
+            return rows[:limit], ("rest", last['UserID'])
+
+        where, params = _user_filters(search, role)
+        if sort == "newest":
+            order, key = "u.UserID DESC", "UserID"
+            if after is not None:
+                where.append("u.UserID < %s")
+        else:
+            order, key = "u.Username ASC", "Username"
+            if after is not None:
+                where.append("u.Username > %s")
+        if after is not None:
+            params.append(after[0])
+        cursor.execute(f"""
+            SELECT {_USER_COLUMNS}
+            FROM User u
+            LEFT JOIN PlayerStats ps ON ps.PlayerID = u.UserID
+            {_where(where)}
+            ORDER BY {order} LIMIT %s
+        """, params + [limit + 1])
+        rows = cursor.fetchall()
+        if len(rows) <= limit:
+            return rows, None
+        return rows[:limit], (rows[limit - 1][key],)
+    except Error as e:
+        log.error("db error", op="get_users_page", error=str(e))
+        return None, None
+    finally:
+        cursor.close(); conn.close()
 
 
 def ban_user(target_user_id):
@@ -181,7 +571,7 @@ def ban_user(target_user_id):
         conn.commit()
         return True
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="ban_user", error=str(e))
         return False
     finally:
         cursor.close(); conn.close()
@@ -212,12 +602,12 @@ def promote_user(target_user_id):
         cursor.execute(sql_delete_player, (target_user_id,))
 
         conn.commit()
-        print(f"User {target_user_id} promoted to Admin (Player stats wiped).")
+        log.info("user promoted to admin (player stats wiped)", user_id=target_user_id)
         return True
 
     except Error as e:
         conn.rollback()
-        print(f"DB Error during promote: {e}")
+        log.error("db error", op="promote_user", error=str(e))
         return False
     finally:
         cursor.close(); conn.close()
@@ -231,14 +621,13 @@ def revoke_admin(target_user_id):
     try:
         t_id = int(target_user_id)
     except ValueError:
-        print(f"[ERROR] Invalid User ID format: {target_user_id}")
+        log.warn("invalid user id", op="revoke_admin", user_id=target_user_id)
         return False
 
-    print(f"[DEBUG] Revoking Admin ID: {t_id}")
+    log.debug("revoking admin", user_id=t_id)
     
     conn = get_db_connection()
     if conn is None: 
-        print("[DEBUG] DB Connection failed")
         return False
         
     cursor = conn.cursor()
@@ -251,7 +640,7 @@ def revoke_admin(target_user_id):
         # 3. Add to Player Table
         # We use ON DUPLICATE KEY UPDATE as a safer alternative to INSERT IGNORE
         # This ensures the record exists in Player table no matter what.
-        print(f"[DEBUG] Moving User {t_id} to Player Table...")
+        log.debug("revoke admin: ensuring Player row", user_id=t_id)
         sql_ensure_player = """
             INSERT INTO Player (PlayerID) VALUES (%s) 
             ON DUPLICATE KEY UPDATE PlayerID = PlayerID
@@ -259,22 +648,22 @@ def revoke_admin(target_user_id):
         cursor.execute(sql_ensure_player, (t_id,))
 
         # 4. Update Role in User Table
-        print(f"[DEBUG] Updating User Role to PLAYER...")
+        log.debug("revoke admin: setting role PLAYER", user_id=t_id)
         sql_update_role = "UPDATE User SET Role = 'PLAYER' WHERE UserID = %s"
         cursor.execute(sql_update_role, (t_id,))
 
         # 5. Remove from Admin Table
-        print(f"[DEBUG] Removing from Admin Table...")
+        log.debug("revoke admin: removing Admin row", user_id=t_id)
         sql_delete_admin = "DELETE FROM Admin WHERE AdminID = %s"
         cursor.execute(sql_delete_admin, (t_id,))
 
         conn.commit()
-        print(f"[SUCCESS] User {t_id} is now a Player.")
+        log.info("admin revoked", user_id=t_id)
         return True
 
     except Error as e:
         conn.rollback()
-        print(f"[CRITICAL DB ERROR] Revoke Failed: {e}")
+        log.error("db error", op="revoke_admin", error=str(e))
         return False
     finally:
         cursor.close()
@@ -286,11 +675,11 @@ def get_player_high_scores(player_id):
     if conn is None: return []
     cursor = conn.cursor(dictionary=True)
     try:
+        # LevelName is added from the reference cache (refcache.py)
         sql = """
-            SELECT gs.StartTime, dl.LevelName, gp.Score, gp.IsWinner
+            SELECT gs.StartTime, gs.DifficultyID, gp.Score, gp.IsWinner
             FROM GameParticipant gp
             JOIN GameSession gs ON gs.GameSessionID = gp.GameSessionID
-            JOIN DifficultyLevel dl ON gs.DifficultyID = dl.DifficultyID
             WHERE gp.PlayerID = %s
             ORDER BY gp.Score DESC
             LIMIT 10
@@ -298,7 +687,7 @@ def get_player_high_scores(player_id):
         cursor.execute(sql, (player_id,))
         return cursor.fetchall()
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="get_player_high_scores", error=str(e))
         return []
     finally:
         cursor.close(); conn.close()
@@ -312,10 +701,7 @@ def update_password(player_id, new_password):
     if not new_password:
         return {'success': False, 'message': "Password cannot be empty."}
 
-    salt = os.urandom(16)
-    password_hash = hashlib.pbkdf2_hmac('sha256', new_password.encode('utf-8'), salt, 100000)
-    salt_hex = salt.hex()
-    hash_hex = password_hash.hex()
+    salt_hex, hash_hex = kdf.hash_password(new_password)
 
     conn = get_db_connection()
     if conn is None:
@@ -356,7 +742,7 @@ def get_top_scores():
         cursor.execute(sql)
         top_scores = cursor.fetchall()
     except mysql.connector.Error as e:
-        print(f"Database error getting top scores: {e}")
+        log.error("db error", op="get_top_scores", error=str(e))
     finally:
         cursor.close()
         conn.close()
@@ -364,6 +750,36 @@ def get_top_scores():
 
 # --- GAMEPLAY FUNCTIONS (These remain mostly the same) ---
 
+# PlayerStats / PlayerDifficultyStats are running totals, changed in the
+# same transaction as the rows they count (see QueriesFileNew.sql and
+# playerstats.py, which checks and rebuilds them).
+_GAME_STATS_SQL = """
+    INSERT INTO PlayerStats (PlayerID, GamesPlayed, Wins, LastPlayed)
+    SELECT %s, 1, %s, StartTime FROM GameSession WHERE GameSessionID = %s
+    ON DUPLICATE KEY UPDATE GamesPlayed = GamesPlayed + 1, Wins = Wins + VALUES(Wins),
+                            LastPlayed = VALUES(LastPlayed)
+"""
+_DIFFICULTY_STATS_SQL = """
+    INSERT INTO PlayerDifficultyStats (PlayerID, DifficultyID, GamesPlayed, BestScore)
+    VALUES (%s, %s, 1, %s)
+    ON DUPLICATE KEY UPDATE GamesPlayed = GamesPlayed + 1, BestScore = GREATEST(BestScore, VALUES(BestScore))
+"""
+_EVENT_STATS_SQL = """
+    INSERT INTO PlayerStats (PlayerID, TotalPots, TotalFouls) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE TotalPots = TotalPots + VALUES(TotalPots), TotalFouls = TotalFouls + VALUES(TotalFouls)
+"""
+
+def _add_event_stats(cursor, rows):
+    """Adds POTTED/FOUL counts of GameEvent rows (GameSessionID, PlayerID, PocketID, BallPotted, EventType, ...)."""
+    counts = {}
+    for row in rows:
+        kind = row[4]
+        if kind == "POTTED" or kind == "FOUL":
+            pots, fouls = counts.get(row[1], (0, 0))
+            counts[row[1]] = (pots + 1, fouls) if kind == "POTTED" else (pots, fouls + 1)
+    for player_id, (pots, fouls) in counts.items():
+        cursor.execute(_EVENT_STATS_SQL, (player_id, pots, fouls))
+
 def get_player_achievements(player_id):
     conn = get_db_connection()
     if conn is None: return set()
@@ -375,7 +791,7 @@ def get_player_achievements(player_id):
         results = cursor.fetchall()
         earned_set = {row[0] for row in results}
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="get_player_achievements", error=str(e))
     finally:
         cursor.close(); conn.close()
     return earned_set
@@ -389,7 +805,7 @@ def grant_achievement(player_id, achievement_id):
         cursor.execute(sql, (player_id, achievement_id))
         conn.commit()
     except Error as e:
-        print(f"DB Error: {e}"); conn.rollback()
+        log.error("db error", op="grant_achievement", error=str(e)); conn.rollback()
     finally:
         cursor.close(); conn.close()
 
@@ -405,7 +821,7 @@ def check_all_achievements(player_id, difficulty_id, timer, shots, fouls, did_wi
         while cursor.nextset(): pass # Consume results
         conn.commit()
     except Error as e:
-        print("DB Error:", e); conn.rollback()
+        log.error("db error", op="check_all_achievements", error=str(e)); conn.rollback()
     finally:
         cursor.close(); conn.close()
     return newly_earned
@@ -419,11 +835,33 @@ def get_all_achievements_list():
         cursor.execute("SELECT AchievementID, Name, Description FROM Achievement ORDER BY AchievementID")
         results = cursor.fetchall()
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="get_all_achievements_list", error=str(e))
     finally:
         cursor.close(); conn.close()
     return results
 
+def get_reference_tables():
+    """
+    The small lookup tables in full, for refcache.py:
+    {"achievements": [...], "difficulties": [...], "pockets": [...]}. None on error.
+    """
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT AchievementID, Name, Description FROM Achievement ORDER BY AchievementID")
+        achievements = cursor.fetchall()
+        cursor.execute("SELECT DifficultyID, LevelName FROM DifficultyLevel ORDER BY DifficultyID")
+        difficulties = cursor.fetchall()
+        cursor.execute("SELECT PocketID, PocketName FROM Pocket ORDER BY PocketID")
+        pockets = cursor.fetchall()
+        return {"achievements": achievements, "difficulties": difficulties, "pockets": pockets}
+    except Error as e:
+        log.error("db error", op="get_reference_tables", error=str(e))
+        return None
+    finally:
+        cursor.close(); conn.close()
+
 def save_game_session(player_id, difficulty_id, score, did_win):
     conn = get_db_connection()
     if conn is None: return None
@@ -434,9 +872,12 @@ def save_game_session(player_id, difficulty_id, score, did_win):
         sid = cursor.lastrowid
         cursor.execute("INSERT INTO GameParticipant (GameSessionID, PlayerID, Score, IsWinner) VALUES (%s, %s, %s, %s)", 
                        (sid, player_id, int(score), did_win))
+        cursor.execute(_GAME_STATS_SQL, (player_id, 1 if did_win else 0, sid))
+        cursor.execute(_DIFFICULTY_STATS_SQL, (player_id, difficulty_id, int(score)))
         conn.commit()
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="save_game_session", error=str(e))
+        sid = None # nothing was committed, so there is no session
     finally:
         cursor.close(); conn.close()
     return sid
@@ -450,36 +891,242 @@ def save_event_log(game_session_id, event_list):
         sql = "INSERT INTO GameEvent (GameSessionID, PlayerID, PocketID, BallPotted, EventType) VALUES (%s, %s, %s, %s, %s)"
         data = [(game_session_id,) + tuple(e) for e in event_list]
         cursor.executemany(sql, data)
+        _add_event_stats(cursor, data)
         conn.commit()
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="save_event_log", error=str(e))
     finally:
         cursor.close(); conn.close()
 
-def get_full_game_history(player_id):
-    # This remains the same because it queries GameSession/Participant which still link to PlayerID
+def get_full_game_history(player_id, before=None, limit=10):
+    """
+    The player's games, newest first, each as {"info": session, "events": [...]}.
+    before=(StartTime, GameSessionID) of the last game of the previous page
+    continues from there. Two queries per page: the sessions, then all of
+    their events at once.
+    """
     conn = get_db_connection()
     if conn is None: return []
     cursor = conn.cursor(dictionary=True)
     history_data = []
     try:
-        sql_sessions = """
-            SELECT gs.GameSessionID, gs.StartTime, gp.Score, gp.IsWinner, dl.LevelName
-            FROM GameSession gs
-            JOIN GameParticipant gp ON gs.GameSessionID = gp.GameSessionID
-            JOIN DifficultyLevel dl ON gs.DifficultyID = dl.DifficultyID
-            WHERE gp.PlayerID = %s
-            ORDER BY gs.StartTime DESC LIMIT 10
-        """
-        cursor.execute(sql_sessions, (player_id,))
+        # LevelName is added from the reference cache (refcache.py)
+        if before is None:
+            sql_sessions = """
+                SELECT gs.GameSessionID, gs.StartTime, gp.Score, gp.IsWinner, gs.DifficultyID
+                FROM GameSession gs
+                JOIN GameParticipant gp ON gs.GameSessionID = gp.GameSessionID
+                WHERE gp.PlayerID = %s
+                ORDER BY gs.StartTime DESC, gs.GameSessionID DESC LIMIT %s
+            """
+            cursor.execute(sql_sessions, (player_id, limit))
+        else:
+            # Keyset paging: no OFFSET, so page N costs the same as page 1
+            sql_sessions = """
+                SELECT gs.GameSessionID, gs.StartTime, gp.Score, gp.IsWinner, gs.DifficultyID
+                FROM GameSession gs
+                JOIN GameParticipant gp ON gs.GameSessionID = gp.GameSessionID
+                WHERE gp.PlayerID = %s
+                  AND (gs.StartTime < %s OR (gs.StartTime = %s AND gs.GameSessionID < %s))
+                ORDER BY gs.StartTime DESC, gs.GameSessionID DESC LIMIT %s
+            """
+            cursor.execute(sql_sessions, (player_id, before[0], before[0], before[1], limit))
         sessions = cursor.fetchall()
+        if not sessions:
+            return []
+
+        by_session = {}
         for session in sessions:
-            sid = session['GameSessionID']
-            cursor.execute("SELECT EventType, BallPotted, PocketID, EventTime FROM GameEvent WHERE GameSessionID = %s ORDER BY EventTime ASC", (sid,))
-            events = cursor.fetchall()
+            events = by_session[session['GameSessionID']] = []
             history_data.append({"info": session, "events": events})
+        # Padded to `limit` ids (repeating the last) so every page is the same prepared statement
+        ids = list(by_session) + [sessions[-1]['GameSessionID']] * (limit - len(sessions))
+        sql_events = f"""
+            SELECT GameSessionID, EventType, BallPotted, PocketID, EventTime
+            FROM GameEvent
+            WHERE GameSessionID IN ({", ".join(["%s"] * len(ids))})
+            ORDER BY GameSessionID, EventTime ASC, EventID ASC
+        """
+        cursor.execute(sql_events, ids)
+        for event in cursor.fetchall():
+            by_session[event.pop('GameSessionID')].append(event)
     except Error as e:
-        print(f"DB Error: {e}")
+        log.error("db error", op="get_full_game_history", error=str(e))
+        return []
+    finally:
+        cursor.close(); conn.close()
+    return history_data
+
+# --- LEADERBOARDS (used by leaderboard.py) ---
+
+def get_best_scores(since=None):
+    """
+    Each player's best score per difficulty, from games started at or after
+    `since` (all games if None): rows of PlayerID, Username, DifficultyID,
+    Best, LastSession. None if the DB is unreachable or the query fails.
+    """
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        sql = """
+            SELECT gp.PlayerID, u.Username, gs.DifficultyID,
+                   MAX(gp.Score) AS Best, MAX(gs.GameSessionID) AS LastSession
+            FROM GameParticipant gp
+            JOIN GameSession gs ON gs.GameSessionID = gp.GameSessionID
+            JOIN User u ON u.UserID = gp.PlayerID
+        """
+        if since is None:
+            cursor.execute(sql + " GROUP BY gp.PlayerID, u.Username, gs.DifficultyID")
+        else:
+            cursor.execute(sql + " WHERE gs.StartTime >= %s GROUP BY gp.PlayerID, u.Username, gs.DifficultyID",
+                           (since,))
+        return cursor.fetchall()
+    except Error as e:
+        log.error("db error", op="get_best_scores", error=str(e))
+        return None
+    finally:
+        cursor.close(); conn.close()
+
+def get_scores_after(session_id):
+    """Scores of games with GameSessionID > session_id, oldest first. None on error."""
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        sql = """
+            SELECT gs.GameSessionID, gs.StartTime, gs.DifficultyID, gp.PlayerID, u.Username, gp.Score
+            FROM GameSession gs
+            JOIN GameParticipant gp ON gp.GameSessionID = gs.GameSessionID
+            JOIN User u ON u.UserID = gp.PlayerID
+            WHERE gs.GameSessionID > %s
+            ORDER BY gs.GameSessionID
+        """
+        cursor.execute(sql, (session_id,))
+        return cursor.fetchall()
+    except Error as e:
+        log.error("db error", op="get_scores_after", error=str(e))
+        return None
+    finally:
+        cursor.close(); conn.close()
+
+# --- PLAYER STATS CHECKS (used by playerstats.py) ---
+
+_PLAYER_STATS_SELECT = """
+    SELECT p.PlayerID,
+           (SELECT COUNT(*) FROM GameParticipant gp WHERE gp.PlayerID = p.PlayerID) AS GamesPlayed,
+           (SELECT COUNT(*) FROM GameParticipant gp WHERE gp.PlayerID = p.PlayerID AND gp.IsWinner = 1) AS Wins,
+           (SELECT COUNT(*) FROM GameEvent ge WHERE ge.PlayerID = p.PlayerID AND ge.EventType = 'POTTED') AS TotalPots,
+           (SELECT COUNT(*) FROM GameEvent ge WHERE ge.PlayerID = p.PlayerID AND ge.EventType = 'FOUL') AS TotalFouls,
+           (SELECT MAX(gs.StartTime) FROM GameParticipant gp
+            JOIN GameSession gs ON gs.GameSessionID = gp.GameSessionID
+            WHERE gp.PlayerID = p.PlayerID) AS LastPlayed
+    FROM Player p
+"""
+_DIFFICULTY_STATS_SELECT = """
+    SELECT gp.PlayerID, gs.DifficultyID, COUNT(*) AS GamesPlayed, MAX(gp.Score) AS BestScore
+    FROM GameParticipant gp
+    JOIN GameSession gs ON gs.GameSessionID = gp.GameSessionID
+    GROUP BY gp.PlayerID, gs.DifficultyID
+"""
+
+def _read_player_stats(players_sql, difficulties_sql, op):
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(players_sql)
+        players = cursor.fetchall()
+        cursor.execute(difficulties_sql)
+        return {"players": players, "difficulties": cursor.fetchall()}
+    except Error as e:
+        log.error("db error", op=op, error=str(e))
+        return None
+    finally:
+        cursor.close(); conn.close()
+
+def get_player_stats():
+    """The stored running totals: {"players": [...], "difficulties": [...]}, or None."""
+    return _read_player_stats("SELECT PlayerID, GamesPlayed, Wins, TotalPots, TotalFouls, LastPlayed FROM PlayerStats",
+                              "SELECT PlayerID, DifficultyID, GamesPlayed, BestScore FROM PlayerDifficultyStats",
+                              "get_player_stats")
+
+def compute_player_stats():
+    """The same totals counted from GameParticipant/GameEvent (full scans), or None."""
+    return _read_player_stats(_PLAYER_STATS_SELECT, _DIFFICULTY_STATS_SELECT, "compute_player_stats")
+
+def rebuild_player_stats():
+    """Recounts both tables from scratch in one transaction. Returns the row counts, or None."""
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("DELETE FROM PlayerDifficultyStats")
+        cursor.execute("DELETE FROM PlayerStats")
+        cursor.execute("INSERT INTO PlayerStats (PlayerID, GamesPlayed, Wins, TotalPots, TotalFouls, LastPlayed)"
+                       + _PLAYER_STATS_SELECT)
+        players = cursor.rowcount
+        cursor.execute("INSERT INTO PlayerDifficultyStats (PlayerID, DifficultyID, GamesPlayed, BestScore)"
+                       + _DIFFICULTY_STATS_SELECT)
+        difficulties = cursor.rowcount
+        conn.commit()
+        return {"players": players, "difficulties": difficulties}
+    except Error as e:
+        conn.rollback()
+        log.error("db error", op="rebuild_player_stats", error=str(e))
+        return None
+    finally:
+        cursor.close(); conn.close()
+
+# --- WRITE-BEHIND EVENTS (used by spool.py) ---
+
+def get_spool_checkpoint(spool_id):
+    """Last spool record already in GameEvent (creates the row), or None if the DB is down."""
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("INSERT IGNORE INTO SpoolCheckpoint (SpoolID, LastSeq) VALUES (%s, 0)", (spool_id,))
+        cursor.execute("SELECT LastSeq FROM SpoolCheckpoint WHERE SpoolID = %s", (spool_id,))
+        last_seq = cursor.fetchone()[0]
+        conn.commit()
+        return last_seq
+    except Error as e:
+        log.error("db error", op="get_spool_checkpoint", error=str(e))
+        return None
+    finally:
+        cursor.close(); conn.close()
+
+def flush_spooled_events(spool_id, rows, last_seq, chunk=500):
+    """
+    Inserts spooled events with multi-row INSERTs and moves the spool's
+    checkpoint to last_seq, in one transaction. rows are
+    (GameSessionID, PlayerID, PocketID, BallPotted, EventType, EventTime).
+    Returns False if the DB is unreachable; raises Error if MySQL rejects the rows.
+    """
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        # Checkpoint first: if it is already past last_seq these rows went in before
+        cursor.execute("UPDATE SpoolCheckpoint SET LastSeq = %s WHERE SpoolID = %s AND LastSeq < %s",
+                       (last_seq, spool_id, last_seq))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return True
+        # executemany: the driver sends each chunk as one multi-row INSERT on
+        # the text protocol, so the chunk sizes never become cached statements
+        sql = ("INSERT INTO GameEvent (GameSessionID, PlayerID, PocketID, BallPotted, EventType, EventTime) "
+               "VALUES (%s, %s, %s, %s, %s, %s)")
+        for i in range(0, len(rows), chunk):
+            cursor.executemany(sql, rows[i:i + chunk])
+        _add_event_stats(cursor, rows)
+        conn.commit()
+        return True
+    except Error:
+        conn.rollback()
+        raise
     finally:
         cursor.close(); conn.close()
-    return history_data
\ No newline at end of file
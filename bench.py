@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# --- PROTOCOL LOAD GENERATOR ---
+# Runs N simulated game clients (the real NetworkClient, real wire protocol)
+# against server.py and reports throughput and latency percentiles per command.
+#
+#   python bench.py --clients 50 --duration 20 --mix mixed
+#   python bench.py --clients 200 --mix login_storm --server-mode thread
+#   python bench.py --clients 500 --server-workers 0   (prefork, one worker per CPU)
+#   python bench.py --host 10.0.0.5 --port 65432 --users 0 --mix history   (existing server)
+#
+# Without --host the harness starts its own server.py in a subprocess on a
+# local stand-in database (standin_db.py), seeded with --users players, so
+# it runs offline and every run starts from the same data. Use --json to
+# keep the numbers for before/after comparisons.
+
+BENCH_PASSWORD = "benchpass"
+BENCH_PREFIX = "bench"
+BENCH_ADMINS = 2 # bench0, bench1 are admins, the rest are players
+
+
+# --- SCENARIOS ---
+# Each one runs a single iteration for one client and records
+# (label, seconds, ok) through `timed`.
+
+def scenario_login_storm(client, me, rng, timed):
+    n = rng.randrange(me['users'])
+    timed("LOGIN", {"username": f"{BENCH_PREFIX}{n}", "password": BENCH_PASSWORD})
+
+def scenario_resume(client, me, rng, timed):
+    """Reconnect path: the token from the setup login instead of the password."""
+    timed("RESUME", {"token": client.token or ""})
+
+def _game_events(me, rng, count=40):
+    return [[me['player_id'], rng.randint(1, 6), str(rng.randint(1, 8)), rng.choice(("SHOT", "POTTED", "FOUL"))]
+            for _ in range(count)]
+
+def _end_of_game(me, rng):
+    did_win = rng.random() < 0.4
+    session = {"pid": me['player_id'], "diff": rng.randint(1, 3), "score": rng.randint(0, 2000), "win": did_win}
+    check = {"pid": me['player_id'], "diff": session['diff'], "timer": rng.uniform(30, 300),
+             "shots": rng.randint(5, 40), "fouls": rng.randint(0, 5), "win": did_win}
+    return session, check
+
+def scenario_game_over(client, me, rng, timed):
+    """What Game.py sends when a game ends: one atomic BATCH."""
+    session, check = _end_of_game(me, rng)
+    timed("BATCH", {"mode": "atomic", "requests": [
+        {"command": "SAVE_SESSION", "payload": session},
+        {"command": "SAVE_EVENTS", "payload": {"session_id": client.ref(0, "session_id"),
+                                               "events": _game_events(me, rng)}},
+        {"command": "CHECK_ACHIEVEMENTS", "payload": check},
+    ]}, label="BATCH(game_over)")
+
+def scenario_game_over_serial(client, me, rng, timed):
+    """The same save as three separate round trips, for comparison."""
+    session, check = _end_of_game(me, rng)
+    res = timed("SAVE_SESSION", session)
+    if res.get('session_id'):
+        timed("SAVE_EVENTS", {"session_id": res['session_id'], "events": _game_events(me, rng)})
+        timed("CHECK_ACHIEVEMENTS", check)
+
+def scenario_history(client, me, rng, timed):
+    res = timed("GET_HISTORY", {"player_id": me['player_id']})
+    if res.get('next') and rng.random() < 0.3: # some players press LOAD MORE
+        timed("GET_HISTORY", {"player_id": me['player_id'], "before": res['next']}, label="GET_HISTORY(page 2)")
+    timed("GET_PLAYER_HIGH_SCORES", {"player_id": me['player_id']})
+
+def scenario_achievements(client, me, rng, timed):
+    timed("BATCH", {"mode": "best_effort", "requests": [
+        {"command": "GET_ACHIEVEMENTS", "payload": {"player_id": me['player_id']}},
+        {"command": "GET_ALL_ACHIEVEMENTS", "payload": client.versioned("GET_ALL_ACHIEVEMENTS")},
+    ]}, label="BATCH(achievements)", keep=lambda res: client.unwrap("GET_ALL_ACHIEVEMENTS", (res.get('results') or [{}, {}])[-1]))
+
+def scenario_leaderboard(client, me, rng, timed):
+    window = rng.choice(("all", "weekly", "daily"))
+    timed("GET_LEADERBOARD", {"window": window, "limit": 20})
+    timed("GET_MY_RANK", {"player_id": me['player_id'], "window": window})
+
+def scenario_admin(client, me, rng, timed):
+    """The admin screen: a first page, scrolling on, then a username search."""
+    sort = rng.choice(("name", "newest", "games", "wins"))
+    res = timed("GET_USERS", {"sort": sort})
+    if res.get('next') and rng.random() < 0.5:
+        timed("GET_USERS", {"sort": sort, "after": res['next']}, label="GET_USERS(page 2)")
+    timed("GET_USERS", {"search": f"{BENCH_PREFIX}{rng.randrange(10, 100)}"}, label="GET_USERS(search)")
+
+SCENARIOS = {
+    "login_storm": scenario_login_storm,
+    "resume": scenario_resume,
+    "game_over": scenario_game_over,
+    "game_over_serial": scenario_game_over_serial,
+    "history": scenario_history,
+    "achievements": scenario_achievements,
+    "leaderboard": scenario_leaderboard,
+    "admin": scenario_admin,
+}
+
+# Weighted blend, roughly what a busy evening looks like
+MIXES = {
+    "mixed": {"game_over": 5, "achievements": 3, "history": 3, "login_storm": 1, "admin": 0.2},
+}
+MIXES.update({name: {name: 1} for name in SCENARIOS})
+
+
+# --- CLIENT WORKER ---
+
+class Worker(threading.Thread):
+    def __init__(self, index, args, start_barrier, deadline_box):
+        super().__init__(name=f"client-{index}", daemon=True)
+        self.index = index
+        self.args = args
+        self.start_barrier = start_barrier
+        self.deadline_box = deadline_box
+        self.samples = [] # (label, seconds, ok)
+        self.failed_setup = None
+
+    def run(self):
+        from network import NetworkClient
+        args = self.args
+        rng = random.Random(args.seed + self.index)
+        codecs = tuple(args.codecs.split(",")) if args.codecs else ()
+        compression = ("zlib",) if args.compress else ()
+        client = NetworkClient(args.host, args.port, codecs=codecs, compression=compression)
+        me = {"users": max(args.users, 1), "player_id": None}
+
+        if client.connected and args.users > BENCH_ADMINS:
+            # Log in as one of the seeded players (not timed)
+            n = BENCH_ADMINS + self.index % (args.users - BENCH_ADMINS)
+            for _ in range(20):
+                res = client.send("LOGIN", {"username": f"{BENCH_PREFIX}{n}", "password": BENCH_PASSWORD})
+                if res.get('code') != "busy":
+                    break
+                time.sleep(res.get('retry_after', 1.0))
+            me['player_id'] = res.get('player_id')
+        if me['player_id'] is None:
+            me['player_id'] = args.player_id
+        if not client.connected:
+            self.failed_setup = "could not connect"
+
+        def timed(command, payload, label=None, keep=None):
+            started = time.perf_counter()
+            res = client.send(command, payload)
+            if keep is not None:
+                keep(res)
+            elapsed = time.perf_counter() - started
+            ok = res.get('status') != 'error' and res.get('success') is not False
+            self.samples.append((label or command, elapsed, ok))
+            return res
+
+        mix = MIXES[args.mix]
+        names = list(mix)
+        weights = [mix[n] for n in names]
+        self.start_barrier.wait()
+        if self.failed_setup:
+            return
+        deadline = self.deadline_box[0]
+        iterations = 0
+        while time.perf_counter() < deadline:
+            if args.iterations and iterations >= args.iterations:
+                break
+            SCENARIOS[rng.choices(names, weights)[0]](client, me, rng, timed)
+            iterations += 1
+            if args.think_ms:
+                time.sleep(rng.uniform(0, 2 * args.think_ms) / 1000.0)
+        client.client.close()
+
+
+# --- REPORTING ---
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[i]
+
+def summarize(samples, elapsed):
+    by_label = {}
+    for label, seconds, ok in samples:
+        entry = by_label.setdefault(label, {"latencies": [], "errors": 0})
+        entry["latencies"].append(seconds)
+        if not ok:
+            entry["errors"] += 1
+    report = {}
+    for label, entry in sorted(by_label.items()):
+        lat = sorted(entry["latencies"])
+        report[label] = {
+            "count": len(lat),
+            "errors": entry["errors"],
+            "rps": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(lat, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 0.99) * 1000, 2),
+            "max_ms": round(lat[-1] * 1000, 2),
+        }
+    return report
+
+def print_report(report, elapsed, clients):
+    total = sum(r["count"] for r in report.values())
+    errors = sum(r["errors"] for r in report.values())
+    print(f"\n{clients} clients, {elapsed:.1f}s, {total} requests "
+          f"({total / elapsed if elapsed else 0:.1f}/s), {errors} errors\n")
+    print(f"{'command':<24}{'count':>8}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for label, r in report.items():
+        print(f"{label:<24}{r['count']:>8}{r['errors']:>6}{r['rps']:>9}{r['p50_ms']:>9}"
+              f"{r['p95_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+
+
+# --- LOCAL SERVER ---
+
+def serve(args):
+    """Child process: server.py on the stand-in database."""
+    import standin_db
+    standin_db.install(args.db, latency=args.db_latency_ms / 1000.0)
+    import server
+    server.main(server.parse_args(["--mode", args.server_mode, "--host", args.host, "--port", str(args.port),
+                                   "--workers", str(args.server_workers), "--metrics-port", "0",
+                                   "--max-per-ip", "0"] # every bench client is 127.0.0.1
+                                  + shlex.split(args.server_args)))
+
+def wait_for_port(host, port, timeout=15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def start_local_server(args):
+    import standin_db
+    db = args.db or os.path.join(tempfile.mkdtemp(prefix="poolbench"), "standin.db")
+    args.db = db
+    standin_db.create(db)
+    if args.users:
+        print(f"[BENCH] Seeding {args.users} users into {db} ...")
+        standin_db.seed(db, users=args.users, password=BENCH_PASSWORD, prefix=BENCH_PREFIX, admins=BENCH_ADMINS)
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--db", db,
+           "--host", args.host, "--port", str(args.port), "--server-mode", args.server_mode,
+           "--server-workers", str(args.server_workers), "--server-args", args.server_args,
+           "--db-latency-ms", str(args.db_latency_ms)]
+    out = None if args.server_output else subprocess.DEVNULL
+    proc = subprocess.Popen(cmd, stdout=out, stderr=out, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if not wait_for_port(args.host, args.port):
+        proc.kill()
+        raise SystemExit("[BENCH] Local server did not start")
+    return proc
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the Pool Game server")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--iterations", type=int, default=0, help="stop each client after this many (0 = no limit)")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between iterations per client")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="existing server to target (default: start a local one)")
+    parser.add_argument("--server-mode", choices=["async", "thread"], default="async")
+    parser.add_argument("--server-workers", type=int, default=1, help="local server processes (0 = one per CPU)")
+    parser.add_argument("--server-args", default="", help="extra server.py options, e.g. \"--spool-dir /tmp/spool\"")
+    parser.add_argument("--server-output", action="store_true", help="show the local server's log")
+    parser.add_argument("--db", help="stand-in database file (default: a temp file)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0,
+                        help="stand-in: delay per SQL statement, stands in for the MySQL round trip")
+    parser.add_argument("--users", type=int, default=200, help="seeded users (stand-in) / users to log in as")
+    parser.add_argument("--player-id", type=int, default=3, help="player id to use if login fails")
+    parser.add_argument("--codecs", default="binary,json", help="HELLO codec preference ('' for plain JSON)")
+    parser.add_argument("--no-compress", dest="compress", action="store_false")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--server-stats", action="store_true", help="print the server's STATS at the end")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        serve(args)
+        return
+
+    proc = None
+    if not args.port:
+        with socket.socket() as s: # pick a free port
+            s.bind((args.host, 0))
+            args.port = s.getsockname()[1]
+        proc = start_local_server(args)
+    try:
+        deadline_box = [0.0]
+        def go(): # runs once, when every client is connected and logged in
+            deadline_box[0] = time.perf_counter() + args.duration
+        barrier = threading.Barrier(args.clients + 1, action=go)
+        workers = [Worker(i, args, barrier, deadline_box) for i in range(args.clients)]
+        for w in workers:
+            w.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - started
+
+        failed = [w for w in workers if w.failed_setup]
+        if failed:
+            print(f"[BENCH] {len(failed)} clients failed to start: {failed[0].failed_setup}")
+        samples = [s for w in workers for s in w.samples]
+        report = summarize(samples, elapsed)
+        print_report(report, elapsed, args.clients)
+
+        if args.server_stats:
+            from network import NetworkClient
+            stats = NetworkClient(args.host, args.port).send("STATS").get('data', {})
+            print("\nServer STATS:")
+            print(json.dumps(stats, indent=1, default=str))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"config": {k: v for k, v in vars(args).items() if k != "serve"},
+                           "elapsed_s": elapsed, "report": report}, f, indent=1)
+            print(f"\n[BENCH] Report written to {args.json}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import struct
+import datetime
+from decimal import Decimal
+
+# --- COMPACT BINARY CODEC ---
+# Type-tagged encoding for the same values we send as JSON (dicts, lists,
+# strings, numbers, None/bools) plus native datetime and date, so rows from
+# MySQL go out without the json_serial hook and come back as real objects.
+#
+#   tag   value
+#   0x00  None          0x01 False        0x02 True
+#   0x10  int8          0x11 int32        0x12 int64       0x13 big int (as text)
+#   0x20  float64
+#   0x30  str  (u8 len) 0x31 str (u32 len)
+#   0x38  bytes (u32 len)
+#   0x40  list (u32 count)                0x48 dict (u32 count, key/value pairs)
+#   0x50  datetime (u16 year, u8 month/day/hour/minute/second, u32 microsecond;
+#         naive, aware values are converted to UTC first)
+#   0x51  date (i32 proleptic ordinal)
+#
+# Decimals are sent as ints, the same as json_serial does. Decoding
+# refuses lists/dicts nested deeper than MAX_DEPTH and dict keys that are
+# lists or dicts, so a hostile frame gets a CodecError like any other.
+
+_B = struct.Struct('>b')
+_I32 = struct.Struct('>i')
+_I64 = struct.Struct('>q')
+_U32 = struct.Struct('>I')
+_F64 = struct.Struct('>d')
+
+_DT = struct.Struct('>HBBBBBI')
+
+MAX_DEPTH = 64
+
+
+class CodecError(ValueError):
+    pass
+
+
+# Short strings (dict keys, level names, event types) repeat all the time,
+# so their encoded form is memoised. Bounded so user data cannot grow it forever.
+_STR_CACHE = {}
+_STR_CACHE_MAX = 4096
+
+def _str_bytes(v):
+    raw = _STR_CACHE.get(v)
+    if raw is not None:
+        return raw
+    data = v.encode('utf-8')
+    if len(data) < 256:
+        raw = bytes((0x30, len(data))) + data
+        if len(v) <= 32 and len(_STR_CACHE) < _STR_CACHE_MAX:
+            _STR_CACHE[v] = raw
+    else:
+        raw = b'\x31' + _U32.pack(len(data)) + data
+    return raw
+
+def _int_bytes(v):
+    if -128 <= v <= 127:
+        return b'\x10' + _B.pack(v)
+    if -2147483648 <= v <= 2147483647:
+        return b'\x11' + _I32.pack(v)
+    if -9223372036854775808 <= v <= 9223372036854775807:
+        return b'\x12' + _I64.pack(v)
+    raw = str(v).encode('ascii')
+    return b'\x13' + _U32.pack(len(raw)) + raw
+
+def _datetime_bytes(v):
+    if v.tzinfo is not None:
+        v = v.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return b'\x50' + _DT.pack(v.year, v.month, v.day, v.hour, v.minute, v.second, v.microsecond)
+
+def _encode(out, v):
+    # Ordered by how often each type shows up in our replies
+    t = type(v)
+    if t is dict:
+        out += b'\x48' + _U32.pack(len(v))
+        cache_get = _STR_CACHE.get
+        for key, item in v.items():
+            raw = cache_get(key) if type(key) is str else None
+            if raw is None:
+                _encode(out, key)
+            else:
+                out += raw
+            # Scalars inline: a call per row field is most of the cost
+            ti = type(item)
+            if ti is str:
+                raw = cache_get(item)
+                if raw is not None:
+                    out += raw
+                else:
+                    raw = item.encode('utf-8')
+                    if len(raw) < 256:
+                        out.append(0x30); out.append(len(raw)); out += raw
+                    else:
+                        out += _str_bytes(item)
+            elif ti is int and -128 <= item <= 127:
+                out.append(0x10); out.append(item & 0xFF)
+            elif item is None:
+                out.append(0x00)
+            else:
+                _encode(out, item)
+    elif t is str:
+        raw = _STR_CACHE.get(v)
+        out += raw if raw is not None else _str_bytes(v)
+    elif t is int:
+        if -128 <= v <= 127:
+            out.append(0x10); out.append(v & 0xFF)
+        else:
+            out += _int_bytes(v)
+    elif t is list or t is tuple or t is set:
+        out += b'\x40' + _U32.pack(len(v))
+        for item in v:
+            _encode(out, item)
+    elif v is None:
+        out.append(0x00)
+    elif t is bool:
+        out.append(0x02 if v else 0x01)
+    elif t is float:
+        out += b'\x20' + _F64.pack(v)
+    elif t is datetime.datetime:
+        out += _datetime_bytes(v)
+    elif t is datetime.date:
+        out += b'\x51' + _I32.pack(v.toordinal())
+    elif t is Decimal:
+        out += _int_bytes(int(v))
+    elif t is bytes or t is bytearray:
+        out += b'\x38' + _U32.pack(len(v)) + v
+    else:
+        _encode_subclass(out, v)
+
+def _encode_subclass(out, v):
+    """Slow path for subclasses of the basic types (e.g. rows from the DB driver)."""
+    for base, convert in ((bool, bool), (int, int), (float, float), (str, str),
+                          (dict, dict), ((list, tuple, set), list), ((bytes, bytearray), bytes),
+                          (datetime.datetime, None), (datetime.date, None), (Decimal, int)):
+        if isinstance(v, base):
+            if convert is None: # datetime/date subclasses: encode as the base type
+                out += _datetime_bytes(v) if isinstance(v, datetime.datetime) \
+                    else b'\x51' + _I32.pack(v.toordinal())
+            else:
+                _encode(out, convert(v))
+            return
+    raise TypeError(f"Type {type(v)} not serializable")
+
+
+def encode(value):
+    out = bytearray()
+    _encode(out, value)
+    return bytes(out)
+
+
+def decode(data):
+    buf = bytes(data)
+    value, pos = _decode(buf, 0)
+    if pos != len(buf):
+        raise CodecError(f"{len(buf) - pos} trailing bytes")
+    return value
+
+
+def _take(buf, pos, n):
+    if pos + n > len(buf):
+        raise IndexError("length runs past end of data")
+    return buf[pos:pos + n]
+
+
+def _decode(buf, pos, depth=0):
+    try:
+        tag = buf[pos]
+        pos += 1
+        if tag == 0x30:
+            n = buf[pos]; pos += 1
+            return _take(buf, pos, n).decode('utf-8'), pos + n
+        if tag == 0x10:
+            return _B.unpack_from(buf, pos)[0], pos + 1
+        if tag == 0x11:
+            return _I32.unpack_from(buf, pos)[0], pos + 4
+        if tag == 0x48:
+            if depth >= MAX_DEPTH:
+                raise CodecError(f"Nested deeper than {MAX_DEPTH} at byte {pos - 1}")
+            n = _U32.unpack_from(buf, pos)[0]; pos += 4
+            result = {}
+            for _ in range(n):
+                key_at = pos
+                key, pos = _decode(buf, pos, depth + 1)
+                if type(key) is list or type(key) is dict:
+                    raise CodecError(f"Dict key at byte {key_at} is a {type(key).__name__}")
+                result[key], pos = _decode(buf, pos, depth + 1)
+            return result, pos
+        if tag == 0x40:
+            if depth >= MAX_DEPTH:
+                raise CodecError(f"Nested deeper than {MAX_DEPTH} at byte {pos - 1}")
+            n = _U32.unpack_from(buf, pos)[0]; pos += 4
+            result = []
+            for _ in range(n):
+                item, pos = _decode(buf, pos, depth + 1)
+                result.append(item)
+            return result, pos
+        if tag == 0x00:
+            return None, pos
+        if tag == 0x01:
+            return False, pos
+        if tag == 0x02:
+            return True, pos
+        if tag == 0x20:
+            return _F64.unpack_from(buf, pos)[0], pos + 8
+        if tag == 0x50:
+            return datetime.datetime(*_DT.unpack_from(buf, pos)), pos + _DT.size
+        if tag == 0x51:
+            return datetime.date.fromordinal(_I32.unpack_from(buf, pos)[0]), pos + 4
+        if tag == 0x12:
+            return _I64.unpack_from(buf, pos)[0], pos + 8
+        if tag == 0x31:
+            n = _U32.unpack_from(buf, pos)[0]; pos += 4
+            return _take(buf, pos, n).decode('utf-8'), pos + n
+        if tag == 0x38:
+            n = _U32.unpack_from(buf, pos)[0]; pos += 4
+            return bytes(_take(buf, pos, n)), pos + n
+        if tag == 0x13:
+            n = _U32.unpack_from(buf, pos)[0]; pos += 4
+            return int(_take(buf, pos, n)), pos + n
+    except CodecError:
+        raise
+    except (IndexError, struct.error, ValueError, OverflowError) as e: # ValueError: bad date, int text, UTF-8
+        raise CodecError(f"Truncated or corrupt value at byte {pos}: {e}")
+    raise CodecError(f"Unknown tag 0x{tag:02x} at byte {pos - 1}")
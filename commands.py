@@ -0,0 +1,672 @@
+import time
+
+import auth
+import kdf
+import leaderboard
+import logger
+import metrics
+import profiler
+import protocol
+import push
+import refcache
+import scheduler
+import sessions
+import spool
+import tracing
+
+# --- COMMAND REGISTRY ---
+# Every wire command is registered here with:
+#   handler   - fn(payload, ctx) -> response dict
+#   validate  - compiled payload check, run before the handler
+#   kind      - "read" or "write" (writes are never cached or retried)
+#   cost      - "light" (single indexed query), "heavy" (scans / many rows)
+#               or "kdf" (runs PBKDF2)
+#   priority  - scheduling class (see scheduler.py); by default "auth" for
+#               kdf commands, "bulk" for heavy reads, else "interactive"
+# server.py only calls dispatch(); lookups are a single dict get.
+
+COMMANDS = {}
+
+log = logger.get("commands")
+
+NUMBER = (int, float)
+
+
+class ValidationError(Exception):
+    """Payload does not match the command's schema."""
+
+
+class Command:
+    __slots__ = ("name", "handler", "validate", "kind", "cost", "schema", "priority")
+
+    def __init__(self, name, handler, validate, kind, cost, schema, priority):
+        self.name = name
+        self.handler = handler
+        self.validate = validate
+        self.kind = kind
+        self.cost = cost
+        self.schema = schema
+        self.priority = priority
+
+    def __repr__(self):
+        return f"<Command {self.name} {self.kind}/{self.cost} {self.priority}>"
+
+
+class ClientContext:
+    """Per-connection state handed to every handler."""
+    def __init__(self, addr=None):
+        self.addr = addr
+        self.codec = protocol.DEFAULT_CODEC # reply encoding, set by HELLO
+        self.compress = False # zlib large replies, set by HELLO
+        # Who is logged in on this connection, set by LOGIN / RESUME
+        self.user_id = None
+        self.username = None
+        self.role = None
+        self.session_id = None
+        # fn((header, body)) -> bool that queues a push frame without
+        # blocking; set by server.py, None where pushes are impossible
+        self.push = None
+
+    def bind(self, session):
+        self.user_id = session.user_id
+        self.username = session.username
+        self.role = session.role
+        self.session_id = session.sid
+
+
+def compile_schema(schema):
+    """
+    Turns {"field": type_or_tuple, "field?": ...} into a validator function.
+    A trailing "?" marks the field optional (None is then allowed too).
+    Checks are flattened into a tuple up front so validation is one loop.
+    """
+    checks = []
+    for key, types in (schema or {}).items():
+        optional = key.endswith("?")
+        name = key[:-1] if optional else key
+        if not isinstance(types, tuple):
+            types = (types,)
+        # bool is a subclass of int, only accept it where asked for
+        allow_bool = bool in types
+        checks.append((name, types, optional, allow_bool))
+    checks = tuple(checks)
+
+    def validate(payload):
+        if not isinstance(payload, dict):
+            raise ValidationError("payload must be an object")
+        for name, types, optional, allow_bool in checks:
+            if name not in payload or payload[name] is None:
+                if optional:
+                    continue
+                raise ValidationError(f"missing field '{name}'")
+            value = payload[name]
+            if not isinstance(value, types) or (isinstance(value, bool) and not allow_bool):
+                expected = "/".join(t.__name__ for t in types)
+                raise ValidationError(f"field '{name}' must be {expected}, got {type(value).__name__}")
+    return validate
+
+
+def command(name, schema=None, kind="read", cost="light", priority=None):
+    """Decorator: registers fn(payload, ctx) as the handler for `name`."""
+    if priority is None:
+        priority = "auth" if cost == "kdf" else "bulk" if (kind, cost) == ("read", "heavy") else "interactive"
+    if priority not in scheduler.CLASSES:
+        raise ValueError(f"Unknown priority {priority} for {name}")
+    def register(fn):
+        if name in COMMANDS:
+            raise ValueError(f"Command {name} registered twice")
+        COMMANDS[name] = Command(name, fn, compile_schema(schema), kind, cost, schema, priority)
+        return fn
+    return register
+
+
+def priority_of(cmd, payload=None):
+    """Scheduling class of a request. A BATCH gets the least urgent class among its commands."""
+    entry = COMMANDS.get(cmd)
+    if entry is None:
+        return "interactive" # answered "Unknown command" straight away
+    if cmd == "BATCH" and isinstance(payload, dict) and isinstance(payload.get('requests'), list):
+        classes = [entry.priority] + [priority_of(sub.get('command')) for sub in payload['requests']
+                                      if isinstance(sub, dict)]
+        return max(classes, key=scheduler.CLASSES.index)
+    return entry.priority
+
+
+def busy_response(retry_after, what="Server"):
+    """Fast rejection when a bounded resource is full; the client may retry later."""
+    return {"status": "error", "success": False, "code": "busy", "retry_after": retry_after,
+            "message": f"{what} busy, try again in {retry_after}s."}
+
+
+def dispatch(cmd, payload, ctx=None):
+    """Validates the payload and runs the handler for cmd."""
+    entry = COMMANDS.get(cmd)
+    if entry is None:
+        return {"status": "error", "message": "Unknown command"}
+    try:
+        entry.validate(payload)
+    except ValidationError as e:
+        return {"status": "error", "message": f"Invalid {cmd} payload: {e}"}
+    try:
+        return entry.handler(payload, ctx)
+    except kdf.KdfBusy as e:
+        return busy_response(e.retry_after, "Login server")
+
+
+# --- CONNECTION SETUP ---
+
+@command("HELLO", {"codecs?": list, "compression?": list})
+def cmd_hello(p, ctx):
+    """Negotiates the reply codec and compression for this connection (see protocol.py)."""
+    codec = protocol.choose_codec(p.get('codecs'))
+    compression = protocol.choose_compression(p.get('compression'))
+    if ctx is not None:
+        ctx.codec = codec
+        ctx.compress = compression is not None
+    return {"status": "success", "codec": codec.name, "codecs": list(protocol.CODECS),
+            "compression": compression, "compress_threshold": protocol.COMPRESS_THRESHOLD}
+
+@command("SUBSCRIBE", {"topics": list})
+def cmd_subscribe(p, ctx):
+    """Starts server pushes on this connection (see push.py)."""
+    if ctx is None or ctx.push is None:
+        return {"status": "error", "message": "Push is not available on this connection"}
+    topics = p['topics']
+    unknown = [t for t in topics if t not in push.TOPICS]
+    if unknown:
+        return {"status": "error", "message": f"Unknown topics: {unknown}"}
+    if "user" in topics and ctx.user_id is None:
+        return {"status": "error", "message": "Log in before subscribing to user events"}
+    push.BROKER.subscribe(ctx, topics)
+    return {"status": "success", "topics": push.BROKER.subscriptions(ctx)}
+
+@command("UNSUBSCRIBE", {"topics?": list})
+def cmd_unsubscribe(p, ctx):
+    if ctx is not None:
+        push.BROKER.unsubscribe(ctx, [t for t in p.get('topics') or push.TOPICS if t in push.TOPICS])
+    return {"status": "success", "topics": push.BROKER.subscriptions(ctx) if ctx is not None else []}
+
+def after_commit(fn):
+    """
+    Runs fn now, or once the enclosing atomic BATCH has committed.
+    The write is already done by then, so a failing fn is logged, not raised.
+    """
+    tx = auth.current_transaction()
+    if tx is not None:
+        tx.after_commit.append(fn) # auth.transaction() guards these the same way
+        return
+    try:
+        fn()
+    except Exception as e:
+        log.error("after-commit callback failed", callback=getattr(fn, '__qualname__', str(fn)), error=str(e))
+
+def push_achievements(player_id, achievement_ids):
+    version, tables = refcache.CACHE.current()
+    names = {a['AchievementID']: a['Name'] for a in (tables or {}).get('achievements', ())}
+    achievements = [{"AchievementID": a, "Name": names.get(a)} for a in achievement_ids]
+    push.BROKER.publish_user(player_id, "achievement", {"player_id": player_id, "achievements": achievements})
+
+@command("STATS")
+def cmd_stats(p, ctx):
+    """Per-command counters and latency percentiles (see metrics.py)."""
+    return {"status": "success", "data": metrics.METRICS.snapshot()}
+
+@command("PROFILE", {"seconds": NUMBER, "interval_ms?": NUMBER, "all_threads?": bool}, cost="heavy")
+def cmd_profile(p, ctx):
+    """
+    Admin only. Samples this server process for `seconds` (max 60) and
+    returns collapsed stacks rooted at the command name (see profiler.py).
+    Holds one request thread for the duration.
+    """
+    if ctx is None or ctx.role != 'ADMIN':
+        return {"status": "error", "message": "PROFILE needs an admin login"}
+    try:
+        prof = profiler.profile(p['seconds'], p.get('interval_ms', profiler.DEFAULT_INTERVAL * 1000) / 1000,
+                                bool(p.get('all_threads')))
+    except profiler.ProfilerBusy as e:
+        return {"status": "error", "code": "busy", "message": str(e)}
+    return dict(prof.summary(), status="success", data=prof.collapsed())
+
+# --- AUTHENTICATION ---
+
+def start_session(ctx, user_id, username, role):
+    """Issues a session token (see sessions.py) and ties it to this connection."""
+    token, session = sessions.STORE.issue(user_id, username, role)
+    if ctx is not None:
+        ctx.bind(session)
+    return {"token": token, "expires": session.expires}
+
+def revoke_sessions(target_id):
+    """Logs a user out everywhere after a ban, role change or password change."""
+    try:
+        sessions.STORE.revoke_user(int(target_id))
+    except (TypeError, ValueError):
+        pass
+
+@command("LOGIN", {"username": str, "password": str}, kind="write", cost="kdf")
+def cmd_login(p, ctx):
+    res = auth.login_player(p['username'], p['password'])
+    if res.get('success'):
+        res.update(start_session(ctx, res['player_id'], p['username'], res['role']))
+    return res
+
+@command("RESUME", {"token": str})
+def cmd_resume(p, ctx):
+    """Logs in again with a token from LOGIN: no password, no PBKDF2, no DB query."""
+    session = sessions.STORE.validate(p['token'])
+    if session is None:
+        metrics.METRICS.incr("sessions_rejected")
+        return {"status": "error", "success": False, "message": "Session expired, please log in."}
+    metrics.METRICS.incr("sessions_resumed")
+    res = {"status": "success", "success": True, "player_id": session.user_id,
+           "username": session.username, "role": session.role, "expires": session.expires}
+    if ctx is not None:
+        ctx.bind(session)
+    # Swap old tokens for fresh ones so regular players never hit the expiry
+    if time.time() - session.issued > sessions.ROTATE_AFTER:
+        sessions.STORE.revoke(session.sid)
+        res.update(start_session(ctx, session.user_id, session.username, session.role))
+    return res
+
+@command("LOGOUT", {"token?": str}, kind="write")
+def cmd_logout(p, ctx):
+    """Ends the given session, or this connection's one."""
+    session = sessions.STORE.validate(p['token']) if p.get('token') else None
+    sid = session.sid if session is not None else getattr(ctx, 'session_id', None)
+    if sid:
+        sessions.STORE.revoke(sid)
+    if ctx is not None and ctx.session_id in (sid, None):
+        ctx.user_id = ctx.username = ctx.role = ctx.session_id = None
+        push.BROKER.unsubscribe(ctx, ["user"])
+    return {"status": "success", "success": True}
+
+@command("REGISTER", {"username": str, "password": str}, kind="write", cost="kdf")
+def cmd_register(p, ctx):
+    return auth.register_player(p['username'], p['password'])
+
+@command("CHANGE_PASSWORD", {"player_id": int, "new_password": str}, kind="write", cost="kdf")
+def cmd_change_password(p, ctx):
+    res = auth.update_password(p['player_id'], p['new_password'])
+    if res.get('success'):
+        revoke_sessions(p['player_id'])
+        # Keep the player who changed it logged in, with a new token
+        if ctx is not None and ctx.user_id == p['player_id']:
+            res.update(start_session(ctx, ctx.user_id, ctx.username, ctx.role))
+    return res
+
+# --- ACHIEVEMENTS ---
+
+@command("GET_ACHIEVEMENTS", {"player_id": int})
+def cmd_get_achievements(p, ctx):
+    # Convert SET to LIST for JSON
+    ach_set = auth.get_player_achievements(p['player_id'])
+    return {"status": "success", "data": list(ach_set)}
+
+@command("GET_ALL_ACHIEVEMENTS", {"version?": str})
+def cmd_get_all_achievements(p, ctx):
+    """Served from the reference cache; send back "version" to get not_modified."""
+    res = refcache.versioned_reply(p.get('version'), lambda t: t['achievements'])
+    if res is None: # cache never loaded (DB down at startup)
+        return {"status": "success", "data": auth.get_all_achievements_list()}
+    return res
+
+@command("GET_REFERENCE_DATA", {"version?": str})
+def cmd_get_reference_data(p, ctx):
+    """Achievements, difficulty levels and pockets in one versioned reply."""
+    res = refcache.versioned_reply(p.get('version'), lambda t: t)
+    if res is None:
+        return {"status": "error", "message": "Database connection failed."}
+    return res
+
+@command("GRANT_ACHIEVEMENT", {"player_id": int, "achievement_id": int}, kind="write")
+def cmd_grant_achievement(p, ctx):
+    auth.grant_achievement(p['player_id'], p['achievement_id'])
+    after_commit(lambda: push_achievements(p['player_id'], [p['achievement_id']]))
+    return {"status": "success"}
+
+@command("CHECK_ACHIEVEMENTS", {"pid": int, "diff": int, "timer": NUMBER, "shots": int,
+                                "fouls": int, "win": (bool, int)}, kind="write")
+def cmd_check_achievements(p, ctx):
+    new_achs = auth.check_all_achievements(
+        p['pid'], p['diff'], p['timer'], p['shots'], p['fouls'], p['win']
+    )
+    if new_achs:
+        ids = [ach['AchievementID'] for ach in new_achs]
+        after_commit(lambda: push_achievements(p['pid'], ids))
+    return {"status": "success", "data": new_achs}
+
+# --- GAMEPLAY ---
+
+@command("SAVE_SESSION", {"pid": int, "diff": int, "score": NUMBER, "win": (bool, int)}, kind="write")
+def cmd_save_session(p, ctx):
+    if not 0 <= p['score'] <= leaderboard.MAX_SCORE: # also refuses NaN
+        return {"status": "error", "message": "Invalid score", "session_id": None}
+    sid = auth.save_game_session(p['pid'], p['diff'], p['score'], p['win'])
+    if sid is None:
+        return {"status": "error", "message": "Could not save session", "session_id": None}
+    username = ctx.username if ctx is not None and ctx.user_id == p['pid'] else None
+    score = {"player_id": p['pid'], "difficulty": p['diff'], "score": p['score'], "win": bool(p['win'])}
+    def committed():
+        leaderboard.BOARDS.record(p['pid'], p['diff'], p['score'], username)
+        rank = leaderboard.BOARDS.rank(p['pid'])['rank'] # all-time, all levels
+        push.BROKER.publish("leaderboard", "score", dict(score, rank=rank))
+    after_commit(committed)
+    return {"status": "success", "session_id": sid}
+
+def spool_events(session_id, events):
+    """Write-behind (see spool.py); falls back to a direct insert when the spool is full or failing."""
+    try:
+        spool.SPOOL.append(session_id, events)
+    except spool.SpoolFull:
+        auth.save_event_log(session_id, events)
+    except OSError as e: # spool disk full or gone: the database still takes them
+        log.error("spool append failed, saving events directly", session_id=session_id, error=str(e))
+        auth.save_event_log(session_id, events)
+
+@command("SAVE_EVENTS", {"session_id": int, "events": list}, kind="write", cost="heavy")
+def cmd_save_events(p, ctx):
+    # Reconstruct list of tuples from list of lists
+    events = [tuple(x) for x in p['events']]
+    if spool.SPOOL is None or not events:
+        auth.save_event_log(p['session_id'], events)
+        return {"status": "success"}
+
+    # Spooled rows are only checked by MySQL later, so reject bad shapes now
+    if not all(len(e) == 4 for e in events):
+        return {"status": "error", "message": "Each event must be [player_id, pocket_id, ball, event_type]"}
+    # Atomic BATCH: spool only if the session it belongs to is committed
+    after_commit(lambda: spool_events(p['session_id'], events))
+    return {"status": "success", "spooled": True}
+
+HISTORY_PAGE = 10
+HISTORY_MAX_PAGE = 50
+
+@command("GET_HISTORY", {"player_id": int, "before?": str, "limit?": int}, cost="heavy")
+def cmd_get_history(p, ctx):
+    """
+    One page of games, newest first. "next" is set when there are more:
+    send it back as "before" to get the following page.
+    """
+    limit = min(max(p.get('limit', HISTORY_PAGE), 1), HISTORY_MAX_PAGE)
+    before = None
+    if 'before' in p:
+        start, _, sid = p['before'].rpartition('|')
+        if not start or not sid.isdigit():
+            return {"status": "error", "message": "Invalid history cursor"}
+        before = (start, int(sid))
+    # One extra game tells us whether there is a next page
+    data = auth.get_full_game_history(p['player_id'], before, limit + 1)
+    more = len(data) > limit
+    data = data[:limit]
+    refcache.add_level_names([game['info'] for game in data])
+    res = {"status": "success", "data": data}
+    if more:
+        last = data[-1]['info']
+        res['next'] = f"{last['StartTime']}|{last['GameSessionID']}"
+    return res
+
+@command("GET_PLAYER_HIGH_SCORES", {"player_id": int})
+def cmd_get_player_high_scores(p, ctx):
+    data = refcache.add_level_names(auth.get_player_high_scores(p['player_id']))
+    return {"status": "success", "data": data}
+
+# --- LEADERBOARDS ---
+# Served from memory (see leaderboard.py). "window" is "all" (default),
+# "weekly" or "daily"; "difficulty" picks one level, else all levels.
+
+LEADERBOARD_LIMIT = 10
+
+def leaderboard_board(p):
+    """(window, difficulty, None) from the payload, or (None, None, error response)."""
+    window = p.get('window', 'all')
+    if window not in leaderboard.WINDOWS:
+        return None, None, {"status": "error", "message": f"window must be one of {', '.join(leaderboard.WINDOWS)}"}
+    difficulty = p.get('difficulty')
+    if difficulty is not None:
+        refcache.CACHE.current()
+        if difficulty not in refcache.CACHE.level_names:
+            return None, None, {"status": "error", "message": "Unknown difficulty"}
+    if not leaderboard.BOARDS.current():
+        return None, None, {"status": "error", "message": "Leaderboard unavailable"}
+    return window, difficulty, None
+
+@command("GET_LEADERBOARD", {"window?": str, "difficulty?": int, "limit?": int})
+def cmd_get_leaderboard(p, ctx):
+    window, difficulty, error = leaderboard_board(p)
+    if error:
+        return error
+    limit = min(max(p.get('limit', LEADERBOARD_LIMIT), 1), leaderboard.TOP_K)
+    players, rows = leaderboard.BOARDS.top(window, difficulty, limit)
+    return {"status": "success", "window": window, "difficulty": difficulty, "players": players, "data": rows}
+
+@command("GET_MY_RANK", {"player_id?": int, "window?": str, "difficulty?": int})
+def cmd_get_my_rank(p, ctx):
+    """Rank, best score and percentile of a player (default: the one logged in)."""
+    player_id = p.get('player_id', ctx.user_id if ctx is not None else None)
+    if player_id is None:
+        return {"status": "error", "message": "Login or give a player_id"}
+    window, difficulty, error = leaderboard_board(p)
+    if error:
+        return error
+    data = leaderboard.BOARDS.rank(player_id, window, difficulty)
+    return {"status": "success", "window": window, "difficulty": difficulty, "player_id": player_id, "data": data}
+
+# --- ADMIN ---
+
+@command("GET_ALL_USERS", cost="heavy")
+def cmd_get_all_users(p, ctx):
+    # Every user in one reply; kept for older clients, the admin screen uses GET_USERS
+    data = auth.get_all_users_for_admin()
+    return {"status": "success", "data": data}
+
+USERS_PAGE = 50
+USERS_MAX_PAGE = 200
+
+def users_cursor(sort, after):
+    """The "next" string for auth.get_users_page's next_after tuple."""
+    return "|".join([sort] + [str(part) for part in after])
+
+def parse_users_cursor(sort, cursor):
+    """Tuple for auth.get_users_page from a "next" string, or None if it is not one for this sort."""
+    kind, _, rest = cursor.partition('|')
+    if kind != sort or not rest:
+        return None
+    if sort == "name":
+        return (rest,) # usernames may contain '|'
+    parts = rest.split('|')
+    if not all(part.isdigit() for part in parts[1 if sort in ("games", "wins") else 0:]):
+        return None
+    if sort == "newest":
+        return (int(parts[0]),) if len(parts) == 1 else None
+    if parts[0] == "stats" and len(parts) == 3:
+        return ("stats", int(parts[1]), int(parts[2]))
+    if parts[0] == "rest" and len(parts) == 2:
+        return ("rest", int(parts[1]))
+    return None
+
+@command("GET_USERS", {"search?": str, "role?": str, "sort?": str, "after?": str, "limit?": int}, cost="heavy")
+def cmd_get_users(p, ctx):
+    """
+    One page of the user directory. "search" is a username prefix, "role"
+    PLAYER or ADMIN, "sort" one of auth.USER_SORTS (default "name"). "next"
+    is set when there are more: send it back as "after", with the same
+    search/role/sort, for the following page.
+    """
+    sort = p.get('sort') or 'name'
+    if sort not in auth.USER_SORTS:
+        return {"status": "error", "message": f"sort must be one of {', '.join(auth.USER_SORTS)}"}
+    role = p.get('role') or None
+    if role not in (None, "PLAYER", "ADMIN"):
+        return {"status": "error", "message": "role must be PLAYER or ADMIN"}
+    after = None
+    if p.get('after'):
+        after = parse_users_cursor(sort, p['after'])
+        if after is None:
+            return {"status": "error", "message": "Invalid users cursor"}
+    limit = min(max(p.get('limit') or USERS_PAGE, 1), USERS_MAX_PAGE)
+    data, after = auth.get_users_page((p.get('search') or '').strip(), role, sort, after, limit)
+    if data is None:
+        return {"status": "error", "message": "Database connection failed."}
+    res = {"status": "success", "data": data}
+    if after is not None:
+        res['next'] = users_cursor(sort, after)
+    return res
+
+def push_user_event(target_id, event, data):
+    try:
+        target_id = int(target_id)
+    except (TypeError, ValueError):
+        return
+    after_commit(lambda: push.BROKER.publish_user(target_id, event, dict(data, player_id=target_id)))
+
+@command("PROMOTE_USER", {"target_id": (int, str)}, kind="write")
+def cmd_promote_user(p, ctx):
+    success = auth.promote_user(p['target_id'])
+    if success:
+        revoke_sessions(p['target_id']) # role changed, log in again to get it
+        push_user_event(p['target_id'], "role_changed", {"role": "ADMIN"})
+    msg = "User Promoted!" if success else "Database Error"
+    return {"status": "success" if success else "error", "message": msg}
+
+@command("REVOKE_ADMIN", {"target_id": (int, str)}, kind="write")
+def cmd_revoke_admin(p, ctx):
+    success = auth.revoke_admin(p['target_id'])
+    if success:
+        revoke_sessions(p['target_id'])
+        push_user_event(p['target_id'], "role_changed", {"role": "PLAYER"})
+    log.debug("REVOKE_ADMIN", target_id=p['target_id'], type=type(p['target_id']).__name__)
+    msg = "Admin Revoked" if success else "DB Error"
+    return {"status": "success" if success else "error", "message": msg}
+
+@command("BAN_USER", {"target_id": (int, str)}, kind="write")
+def cmd_ban_user(p, ctx):
+    success = auth.ban_user(p['target_id'])
+    if success:
+        revoke_sessions(p['target_id'])
+        push_user_event(p['target_id'], "banned", {})
+        try:
+            target_id = int(p['target_id'])
+            after_commit(lambda: leaderboard.BOARDS.remove_player(target_id))
+        except ValueError:
+            pass
+    msg = "User Banned/Deleted" if success else "DB Error"
+    return {"status": "success" if success else "error", "message": msg}
+
+# --- BATCH ---
+# Runs several commands in one round trip:
+#   {"mode": "atomic" | "best_effort",
+#    "requests": [{"command": "SAVE_SESSION", "payload": {...}},
+#                 {"command": "SAVE_EVENTS",
+#                  "payload": {"session_id": {"$ref": "0.session_id"}, ...}}]}
+# {"$ref": "<index>.<key>..."} is replaced by a value from an earlier result.
+# atomic: every sub-command shares one DB transaction; the first failure
+#         stops the batch and rolls all of it back.
+# best_effort: each sub-command commits on its own; failures are reported
+#         per entry and the rest still run.
+
+MAX_BATCH = 32
+BATCH_MODES = ("atomic", "best_effort")
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+def is_failure(response):
+    return not isinstance(response, dict) or response.get('status') == 'error' \
+        or response.get('success') is False
+
+
+def resolve_refs(value, results):
+    """Replaces {"$ref": "i.key.sub"} markers with values from earlier results."""
+    if isinstance(value, dict):
+        if len(value) == 1 and "$ref" in value:
+            path = str(value["$ref"]).split(".")
+            try:
+                index = int(path[0])
+            except ValueError:
+                raise UnresolvedReference(f"bad reference '{value['$ref']}'")
+            if not 0 <= index < len(results):
+                raise UnresolvedReference(f"reference to request {index} which has not run")
+            current = results[index]
+            if is_failure(current):
+                raise UnresolvedReference(f"request {index} failed")
+            for key in path[1:]:
+                try:
+                    current = current[int(key)] if isinstance(current, list) else current[key]
+                except (KeyError, IndexError, ValueError, TypeError):
+                    raise UnresolvedReference(f"'{value['$ref']}' not found in result {index}")
+            return current
+        return {k: resolve_refs(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_refs(v, results) for v in value]
+    return value
+
+
+def check_batch(requests):
+    """Shape checks done before anything runs, so atomic batches fail cheaply."""
+    if not requests:
+        raise ValidationError("no requests")
+    if len(requests) > MAX_BATCH:
+        raise ValidationError(f"at most {MAX_BATCH} requests per batch")
+    for i, sub in enumerate(requests):
+        if not isinstance(sub, dict) or not isinstance(sub.get('payload', {}), dict):
+            raise ValidationError(f"request {i} must be an object with an object payload")
+        name = sub.get('command')
+        if name == "BATCH":
+            raise ValidationError("BATCH cannot be nested")
+        if name not in COMMANDS:
+            raise ValidationError(f"request {i}: unknown command {name}")
+
+
+def run_batch(requests, ctx, tx=None):
+    """
+    Runs the sub-commands in order. With a shared transaction (tx) the
+    batch stops at the first failure, including DB errors that the auth
+    function logged and swallowed.
+    """
+    results = []
+    for i, sub in enumerate(requests):
+        try:
+            payload = resolve_refs(sub.get('payload', {}), results)
+            with tracing.span(sub['command'], index=i):
+                response = dispatch(sub['command'], payload, ctx)
+        except UnresolvedReference as e:
+            response = {"status": "error", "message": f"Request {i}: {e}"}
+        except Exception as e:
+            response = {"status": "error", "message": str(e)}
+        if tx is not None and tx.failed and not is_failure(response):
+            response = {"status": "error", "message": "Database error"}
+        results.append(response)
+        if tx is not None and is_failure(response):
+            break
+    return results
+
+
+@command("BATCH", {"requests": list, "mode?": str}, kind="write", cost="heavy")
+def cmd_batch(p, ctx):
+    mode = p.get('mode') or "atomic"
+    if mode not in BATCH_MODES:
+        return {"status": "error", "message": f"Unknown batch mode {mode}"}
+    requests = p['requests']
+    try:
+        check_batch(requests)
+    except ValidationError as e:
+        return {"status": "error", "message": f"Invalid BATCH: {e}"}
+
+    if mode == "best_effort":
+        results = run_batch(requests, ctx)
+        failed = [i for i, r in enumerate(results) if is_failure(r)]
+        return {"status": "error" if failed else "success", "results": results, "failed": failed}
+
+    with auth.transaction() as tx:
+        if tx is None:
+            return {"status": "error", "message": "Database connection failed."}
+        results = run_batch(requests, ctx, tx)
+        failed_at = next((i for i, r in enumerate(results) if is_failure(r)), None)
+        if failed_at is not None:
+            tx.failed = True # roll back everything
+            return {"status": "error", "results": results, "failed_at": failed_at,
+                    "rolled_back": True,
+                    "message": results[failed_at].get('message', "Batch failed")}
+    return {"status": "success", "results": results}
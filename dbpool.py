@@ -0,0 +1,245 @@
+import collections
+import os
+import threading
+import time
+
+import logger
+from metrics import METRICS
+
+# --- DATABASE CONNECTION POOL ---
+# Opening a MySQL connection is a TCP connect plus an auth handshake, several
+# round trips before the first query. The pool keeps connections open
+# between commands: get_db_connection() borrows one and conn.close() hands
+# it back.
+#
+#   borrow  - takes the most recently returned idle connection. One that sat
+#             idle for more than PING_IDLE is pinged first; a dead one is
+#             dropped and the next is tried. With none idle and max_size
+#             open, waits up to `timeout`, then gives up (the auth.* callers
+#             treat that like a failed connect).
+#   return  - rolls back whatever the borrower left open (a read leaves a
+#             transaction with its snapshot behind, which the next borrower
+#             must not see). A connection that errors there is dropped, and
+#             so is one older than max_lifetime.
+#
+# Each connection also keeps the statements prepared on it (statement()),
+# up to MAX_STATEMENTS, least recently used evicted first. They go away
+# with the connection, so a recycled or dropped connection takes its
+# handles with it.
+#
+# Metrics: db_pool_checkouts, db_pool_waits / db_pool_wait_ms (borrows that
+# found the pool exhausted), db_pool_timeouts, db_pool_connect_failures,
+# db_pool_health_failures, db_pool_recycled, stmt_cache_hits / misses /
+# evictions, and the db_pool_open / idle / in_use / waiting gauges.
+#
+# Pools are per process: connections are opened on first use after any
+# prefork, and a forked child forgets (without closing) what it inherited.
+# warm() opens min_size up front.
+
+POOL_MIN = 4
+POOL_MAX = 48         # >= the scheduler's workers (interactive + auth + bulk)
+POOL_TIMEOUT = 5.0    # longest a borrower waits for a free connection
+MAX_LIFETIME = 1800.0 # seconds before a connection is closed and replaced
+PING_IDLE = 2.0       # connections idle longer than this are pinged on borrow
+MAX_STATEMENTS = 64   # prepared statements kept per connection
+
+log = logger.get("dbpool")
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the checkout timeout."""
+
+
+class _Entry:
+    __slots__ = ("conn", "created", "last_used", "statements")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = self.last_used = time.monotonic()
+        self.statements = collections.OrderedDict() # SQL text -> (SQL text, prepared cursor), LRU first
+
+
+class PooledConnection:
+    """A borrowed connection; close() returns it to the pool instead of closing it."""
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def close(self):
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry)
+
+    def statement(self, sql):
+        """(sql, prepared cursor) for this text, prepared once per connection.
+        Execute the returned sql object: the driver re-prepares on a different one."""
+        return self._pool.statement(self._entry, sql)
+
+    def __getattr__(self, name):
+        if self._entry is None:
+            raise RuntimeError("connection already returned to the pool")
+        return getattr(self._entry.conn, name)
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=POOL_MIN, max_size=POOL_MAX, timeout=POOL_TIMEOUT,
+                 max_lifetime=MAX_LIFETIME, max_statements=MAX_STATEMENTS):
+        self.connect = connect # zero-arg callable returning a new DB-API connection
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_statements = max_statements
+        self.cond = threading.Condition()
+        self.idle = collections.deque() # _Entry, most recently returned on the right
+        self.opened = 0 # idle + borrowed
+        self.waiting = 0
+        self.pid = os.getpid()
+
+    def _check_pid(self):
+        # Called with the lock held. Sockets inherited over fork belong to
+        # the parent; closing them here would close its sessions.
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.idle.clear()
+            self.opened = 0
+            self.waiting = 0
+
+    # --- borrow ---
+
+    def acquire(self):
+        """A PooledConnection. Raises PoolTimeout, or the driver's error if connecting fails."""
+        deadline = None
+        with self.cond:
+            self._check_pid()
+            while True:
+                if self.idle:
+                    entry = self.idle.pop()
+                    break
+                if self.opened < self.max_size:
+                    self.opened += 1 # reserve the slot, connect outside the lock
+                    entry = None
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    METRICS.incr("db_pool_waits")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    METRICS.incr("db_pool_timeouts")
+                    raise PoolTimeout(f"no database connection free after {self.timeout}s")
+                self.waiting += 1
+                try:
+                    self.cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+        if deadline is not None:
+            METRICS.incr("db_pool_wait_ms", round((time.monotonic() - deadline + self.timeout) * 1000, 3))
+        if entry is None:
+            entry = self._open()
+        elif time.monotonic() - entry.last_used > PING_IDLE and not self._healthy(entry):
+            self._discard(entry)
+            METRICS.incr("db_pool_health_failures")
+            return self.acquire() # drops every dead idle connection in turn, then opens one
+        METRICS.incr("db_pool_checkouts")
+        return PooledConnection(self, entry)
+
+    def _open(self):
+        try:
+            return _Entry(self.connect())
+        except BaseException:
+            METRICS.incr("db_pool_connect_failures")
+            with self.cond:
+                self.opened -= 1
+                self.cond.notify()
+            raise
+
+    @staticmethod
+    def _healthy(entry):
+        try:
+            entry.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def statement(self, entry, sql):
+        statements = entry.statements
+        cached = statements.get(sql)
+        if cached is not None:
+            statements.move_to_end(sql)
+            METRICS.incr("stmt_cache_hits")
+            return cached
+        METRICS.incr("stmt_cache_misses")
+        cached = statements[sql] = (sql, entry.conn.cursor(prepared=True))
+        if len(statements) > self.max_statements:
+            _, (_, evicted) = statements.popitem(last=False)
+            METRICS.incr("stmt_cache_evictions")
+            try:
+                evicted.close() # deallocates it on the server
+            except Exception:
+                pass
+        return cached
+
+    # --- return ---
+
+    def release(self, entry):
+        with self.cond:
+            if self.pid != os.getpid():
+                return # borrowed before a fork; the child's pool never counted it
+        try:
+            if getattr(entry.conn, "in_transaction", True):
+                entry.conn.rollback()
+        except Exception:
+            METRICS.incr("db_pool_health_failures")
+            self._discard(entry)
+            return
+        now = time.monotonic()
+        if now - entry.created > self.max_lifetime:
+            METRICS.incr("db_pool_recycled")
+            self._discard(entry)
+            return
+        entry.last_used = now
+        with self.cond:
+            self.idle.append(entry)
+            self.cond.notify()
+
+    def _discard(self, entry):
+        entry.statements.clear() # the server frees them with the connection
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self.cond:
+            self.opened -= 1
+            self.cond.notify()
+
+    # --- housekeeping ---
+
+    def warm(self):
+        """Opens connections up to min_size. Returns how many are idle now."""
+        entries = []
+        try:
+            while len(entries) < self.min_size:
+                with self.cond:
+                    self._check_pid()
+                    if self.opened >= self.min_size:
+                        break
+                    self.opened += 1
+                entries.append(self._open())
+        except Exception as e:
+            log.warn("could not open database connections", opened=len(entries), error=str(e))
+        for entry in entries:
+            self.release(entry)
+        return self.idle_count()
+
+    def idle_count(self):
+        return len(self.idle)
+
+    def in_use(self):
+        return self.opened - len(self.idle)
+
+    def register_gauges(self):
+        METRICS.gauge("db_pool_open", lambda: self.opened)
+        METRICS.gauge("db_pool_idle", self.idle_count)
+        METRICS.gauge("db_pool_in_use", self.in_use)
+        METRICS.gauge("db_pool_waiting", lambda: self.waiting)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from hmac import compare_digest
+
+import profiler
+from metrics import METRICS
+
+# --- PASSWORD HASHING POOL ---
+# PBKDF2 with 100k iterations costs tens of milliseconds of pure CPU. Run
+# inline on the request threads, a burst of logins would take every core
+# and stall SAVE_EVENTS and friends. Instead all hashing goes through one
+# small pool per process:
+#   - at most KDF_WORKERS hashes run at once (hashlib releases the GIL while
+#     hashing, so threads really do run in parallel)
+#   - at most KDF_QUEUE more may wait; anything beyond that is refused
+#     straight away with KdfBusy(retry_after) instead of piling up
+# The caller's thread waits for its own hash, so the pool also bounds how
+# many request threads can be tied up by logins: keep workers + queue well
+# below the server's DB worker count.
+
+KDF_ITERATIONS = 100000
+KDF_WORKERS = 2
+KDF_QUEUE = 8
+KDF_TIMEOUT = 10.0   # longest a caller waits for its result
+SALT_BYTES = 16
+
+
+class KdfBusy(Exception):
+    """The hashing pool is full. retry_after is a hint in seconds."""
+    def __init__(self, retry_after):
+        super().__init__(f"Password hashing is busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class KdfPool:
+    def __init__(self, workers=KDF_WORKERS, max_queue=KDF_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = None # created on first use, i.e. after any prefork
+        self.admitted = 0    # jobs in the pool, running + waiting (a timed-out caller's job still counts)
+        self.avg_seconds = 0.05 # moving average of one hash, for retry_after
+        self.lock = threading.Lock()
+
+    def queue_depth(self):
+        return max(0, self.admitted - self.workers)
+
+    def running(self):
+        return min(self.admitted, self.workers)
+
+    def retry_after(self):
+        # Time for the current backlog to drain, rounded up a little
+        backlog = self.admitted / max(self.workers, 1)
+        return round(min(10.0, max(0.5, backlog * self.avg_seconds * 1.5)), 1)
+
+    def _run(self, password, salt, iterations, command):
+        profiler.tag(command)
+        started = time.perf_counter()
+        try:
+            digest = hashlib.pbkdf2_hmac('sha256', password, salt, iterations)
+        finally:
+            profiler.untag()
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.avg_seconds += (elapsed - self.avg_seconds) * 0.1
+        return digest
+
+    def derive(self, password, salt, iterations=KDF_ITERATIONS):
+        """PBKDF2-SHA256 on the pool. Blocks until done; raises KdfBusy if full."""
+        with self.lock:
+            if self.admitted >= self.workers + self.max_queue:
+                retry_after = self.retry_after()
+                busy = True
+            else:
+                self.admitted += 1
+                busy = False
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kdf")
+        if busy:
+            METRICS.incr("kdf_rejected")
+            raise KdfBusy(retry_after)
+
+        try:
+            future = self.executor.submit(self._run, password.encode('utf-8'), salt, iterations,
+                                          profiler.current_tag())
+        except BaseException:
+            self._finished()
+            raise
+        # Counted out when the hash finishes, not when the caller gives up
+        # waiting: the job keeps its worker until then
+        future.add_done_callback(self._finished)
+        try:
+            return future.result(timeout=KDF_TIMEOUT)
+        except FutureTimeout:
+            METRICS.incr("kdf_timeouts")
+            raise KdfBusy(self.retry_after())
+
+    def _finished(self, future=None):
+        with self.lock:
+            self.admitted -= 1
+
+
+POOL = KdfPool()
+
+METRICS.gauge("kdf_queue_depth", POOL.queue_depth)
+METRICS.gauge("kdf_running", POOL.running)
+METRICS.gauge("kdf_hash_ms", lambda: round(POOL.avg_seconds * 1000, 2))
+
+
+def configure(workers=KDF_WORKERS, max_queue=KDF_QUEUE):
+    """Sizes the pool. Call before the first hash (the threads are started then)."""
+    POOL.workers = workers
+    POOL.max_queue = max_queue
+
+
+def hash_password(password):
+    """Returns (salt_hex, hash_hex) for a new password."""
+    salt = os.urandom(SALT_BYTES)
+    return salt.hex(), POOL.derive(password, salt).hex()
+
+
+def verify_password(password, salt_hex, hash_hex):
+    return compare_digest(POOL.derive(password, bytes.fromhex(salt_hex)), bytes.fromhex(hash_hex))
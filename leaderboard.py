@@ -0,0 +1,256 @@
+import bisect
+import datetime
+import threading
+import time
+
+import auth
+import logger
+from metrics import METRICS
+
+# --- LEADERBOARDS ---
+# Kept in memory per server process so GET_LEADERBOARD and GET_MY_RANK never
+# sort GameParticipant. There is one board per window ("all", "weekly",
+# "daily") and difficulty (1, 2, 3 or None for all levels). A player's place
+# on a board is their best score in it.
+#
+# Each board holds:
+#   best    - player -> best score
+#   scores  - every player's best score, sorted, so "how many players beat
+#             me" is one bisect. Memory is one entry per player whatever
+#             the scores are; a new best is a bisect and a list insert
+#   top     - the TOP_K best, kept sorted as scores come in
+#
+# Updates: SAVE_SESSION calls record() once its transaction has committed.
+# Keeping the best score is idempotent, so re-applying a game is harmless:
+# every SYNC_INTERVAL a read also pulls in games saved since the last one
+# (by another prefork worker, or straight into MySQL), re-reading the last
+# SYNC_OVERLAP ids in case of out-of-order commits. Deletions (BAN_USER on
+# another worker) are picked up by the full rebuild every REBUILD_INTERVAL.
+#
+# Windows follow the server's local time like MySQL's CURRENT_TIMESTAMP:
+# "daily" since midnight, "weekly" since Monday midnight. A board whose
+# window has rolled over starts empty.
+
+WINDOWS = ("all", "weekly", "daily")
+TOP_K = 100
+SYNC_INTERVAL = 5.0
+SYNC_OVERLAP = 500
+REBUILD_INTERVAL = 3600.0
+MAX_SCORE = 2**31 - 1 # GameParticipant.Score is an INT
+
+log = logger.get("leaderboard")
+
+
+class Board:
+    def __init__(self, period=None):
+        self.period = period # which day/week the board is for; None for all-time
+        self.best = {}
+        self.scores = [] # best scores, ascending
+        self.top = [] # (-score, seq, player_id), best first
+        self.in_top = set()
+        self.seq = 0 # earlier scores win ties in the top list
+
+    def record(self, player_id, score):
+        """Returns True if this is a new best for the player."""
+        old = self.best.get(player_id)
+        if old is not None and score <= old:
+            return False
+        if old is not None:
+            del self.scores[bisect.bisect_left(self.scores, old)]
+        self.best[player_id] = score
+        bisect.insort(self.scores, score)
+
+        if player_id in self.in_top:
+            self.top = [entry for entry in self.top if entry[2] != player_id]
+            self.in_top.discard(player_id)
+        self.seq += 1
+        entry = (-score, self.seq, player_id)
+        if len(self.top) < TOP_K or entry < self.top[-1]:
+            bisect.insort(self.top, entry)
+            self.in_top.add(player_id)
+            if len(self.top) > TOP_K:
+                self.in_top.discard(self.top.pop()[2])
+        return True
+
+    def remove(self, player_id):
+        score = self.best.pop(player_id, None)
+        if score is None:
+            return
+        del self.scores[bisect.bisect_left(self.scores, score)]
+        if player_id in self.in_top:
+            self.top = [entry for entry in self.top if entry[2] != player_id]
+            self.in_top.discard(player_id)
+            # Refill the last place from everyone else (a scan, but bans are rare)
+            if len(self.best) >= TOP_K:
+                pid, best = max(((pid, s) for pid, s in self.best.items() if pid not in self.in_top),
+                                key=lambda item: item[1])
+                self.seq += 1
+                bisect.insort(self.top, (-best, self.seq, pid))
+                self.in_top.add(pid)
+
+    def players(self):
+        return len(self.best)
+
+    def standing(self, player_id):
+        """(rank, score, players below) or None if the player has no score here."""
+        score = self.best.get(player_id)
+        if score is None:
+            return None
+        higher = len(self.scores) - bisect.bisect_right(self.scores, score)
+        below = bisect.bisect_left(self.scores, score)
+        return higher + 1, score, below
+
+    def leaders(self, limit):
+        """[(rank, player_id, score)]; equal scores share a rank."""
+        rows = []
+        for i, (neg, _, pid) in enumerate(self.top[:limit]):
+            rank = rows[-1][0] if rows and rows[-1][2] == -neg else i + 1
+            rows.append((rank, pid, -neg))
+        return rows
+
+
+def period_of(window, when):
+    if window == "daily":
+        return when.date()
+    if window == "weekly":
+        return when.date() - datetime.timedelta(days=when.weekday())
+    return None
+
+
+def window_start(window, now):
+    period = period_of(window, now)
+    return None if period is None else datetime.datetime.combine(period, datetime.time())
+
+
+class Leaderboards:
+    def __init__(self):
+        self.boards = {} # (window, difficulty or None) -> Board
+        self.names = {}  # player_id -> username
+        self.high_water = 0 # highest GameSessionID applied
+        self.loaded_at = 0.0 # monotonic; 0 = never
+        self.synced_at = 0.0
+        self.lock = threading.Lock()    # guards the boards
+        self.refresh = threading.Lock() # one thread talks to the DB at a time
+
+    # --- writes ---
+
+    def board(self, window, difficulty, now=None):
+        """The board for this window, emptied first if its day/week has passed. Lock held."""
+        period = period_of(window, now or datetime.datetime.now())
+        board = self.boards.get((window, difficulty))
+        if board is None or board.period != period:
+            board = self.boards[(window, difficulty)] = Board(period)
+        return board
+
+    def apply(self, player_id, difficulty, score, when, now):
+        """Adds one game to every board it counts for. Lock held."""
+        score = min(max(0, int(score)), MAX_SCORE)
+        for window in WINDOWS:
+            if window != "all" and period_of(window, when) != period_of(window, now):
+                continue # from an earlier day/week
+            for diff in (difficulty, None):
+                self.board(window, diff, now).record(player_id, score)
+
+    def record(self, player_id, difficulty, score, username=None):
+        """A game that has just been committed."""
+        with self.lock:
+            now = datetime.datetime.now()
+            self.apply(player_id, difficulty, score, now, now)
+            if username:
+                self.names[player_id] = username
+            elif player_id not in self.names:
+                self.synced_at = 0.0 # the next read syncs, which brings the name
+        METRICS.incr("leaderboard_updates")
+
+    def remove_player(self, player_id):
+        with self.lock:
+            for board in self.boards.values():
+                board.remove(player_id)
+            self.names.pop(player_id, None)
+
+    # --- loading ---
+
+    def load(self):
+        """Rebuilds every board from the DB. Keeps the old boards if that fails."""
+        started = time.perf_counter()
+        now = datetime.datetime.now()
+        rows = {window: auth.get_best_scores(window_start(window, now)) for window in WINDOWS}
+        METRICS.incr("leaderboard_rebuilds")
+        if any(r is None for r in rows.values()):
+            METRICS.incr("leaderboard_load_errors")
+            return False
+        boards, names, high_water = {}, {}, 0
+        for window, window_rows in rows.items():
+            for diff in (1, 2, 3, None):
+                boards[(window, diff)] = Board(period_of(window, now))
+            for row in window_rows:
+                pid = row['PlayerID']
+                for diff in (row['DifficultyID'], None):
+                    board = boards.get((window, diff))
+                    if board is None: # a difficulty added since
+                        board = boards[(window, diff)] = Board(period_of(window, now))
+                    board.record(pid, max(0, int(row['Best'])))
+                names[pid] = row['Username']
+                high_water = max(high_water, row['LastSession'] or 0)
+        with self.lock:
+            self.boards, self.names, self.high_water = boards, names, high_water
+            self.loaded_at = self.synced_at = time.monotonic()
+        log.info("leaderboards rebuilt", players=len(names), seconds=round(time.perf_counter() - started, 3))
+        return True
+
+    def sync(self):
+        """Applies games saved since the last sync (by anyone)."""
+        rows = auth.get_scores_after(max(0, self.high_water - SYNC_OVERLAP))
+        METRICS.incr("leaderboard_syncs")
+        if rows is None:
+            return False
+        with self.lock:
+            now = datetime.datetime.now()
+            for row in rows:
+                self.apply(row['PlayerID'], row['DifficultyID'], row['Score'], row['StartTime'], now)
+                self.names[row['PlayerID']] = row['Username']
+                self.high_water = max(self.high_water, row['GameSessionID'])
+            self.synced_at = time.monotonic()
+        return True
+
+    def current(self):
+        """Brings the boards up to date if due. False if they have never loaded."""
+        now = time.monotonic()
+        if now - self.loaded_at > REBUILD_INTERVAL or now - self.synced_at > SYNC_INTERVAL:
+            # One thread refreshes, the others read what is there
+            if self.refresh.acquire(blocking=self.loaded_at == 0.0):
+                try:
+                    now = time.monotonic()
+                    if now - self.loaded_at > REBUILD_INTERVAL:
+                        self.load()
+                    elif now - self.synced_at > SYNC_INTERVAL:
+                        self.sync()
+                finally:
+                    self.refresh.release()
+        return self.loaded_at != 0.0
+
+    # --- reads ---
+
+    def top(self, window="all", difficulty=None, limit=10):
+        with self.lock:
+            board = self.board(window, difficulty)
+            return board.players(), [{"rank": rank, "player_id": pid, "username": self.names.get(pid), "score": score}
+                                     for rank, pid, score in board.leaders(limit)]
+
+    def rank(self, player_id, window="all", difficulty=None):
+        """{"rank", "score", "players", "percentile"}; rank None if no score on this board."""
+        with self.lock:
+            board = self.board(window, difficulty)
+            standing = board.standing(player_id)
+            players = board.players()
+        if standing is None:
+            return {"rank": None, "score": None, "players": players, "percentile": None}
+        rank, score, below = standing
+        # Share of the other players this score beats
+        percentile = round(100.0 * below / (players - 1), 1) if players > 1 else 100.0
+        return {"rank": rank, "score": score, "players": players, "percentile": percentile}
+
+
+BOARDS = Leaderboards()
+
+METRICS.gauge("leaderboard_players", lambda: len(BOARDS.names))
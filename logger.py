@@ -0,0 +1,181 @@
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+# --- STRUCTURED LOGGING ---
+# Server modules log through here instead of print(). A call builds one
+# record and puts it on a bounded queue without waiting; one background
+# thread writes the records out in batches (one write + flush per batch).
+# A slow or blocked stdout therefore slows down the log, not the requests:
+# when the queue is full new records are dropped and counted.
+#
+#   log = logger.get("server")
+#   log.info("connected", addr=addr)
+#   log.debug("revoking admin", user_id=uid)   # skipped unless enabled
+#
+# Output is one JSON object per line:
+#   {"ts": 1700000000.123, "level": "info", "module": "server", "msg": "connected", "pid": 4242, "addr": [...]}
+# or, with format "text", "[INFO] server: connected addr=..." for reading by eye.
+#
+# Levels are set globally and can be overridden per module, e.g.
+# server.py --log-level warn --log-module auth=debug
+
+LEVELS = {"debug": 10, "info": 20, "warn": 30, "error": 40}
+DEFAULT_LEVEL = "info"
+QUEUE_SIZE = 10000 # records waiting for the writer before we start dropping
+BATCH_SIZE = 256   # records per write
+
+
+class Logger:
+    """Named logger handed out by get(); the level check is one dict lookup."""
+    def __init__(self, sink, module):
+        self.sink = sink
+        self.module = module
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.sink.threshold(self.module)
+
+    def log(self, level, msg, **fields):
+        if LEVELS[level] >= self.sink.threshold(self.module):
+            self.sink.emit(level, self.module, msg, fields)
+
+    def debug(self, msg, **fields):
+        self.log("debug", msg, **fields)
+
+    def info(self, msg, **fields):
+        self.log("info", msg, **fields)
+
+    def warn(self, msg, **fields):
+        self.log("warn", msg, **fields)
+
+    def error(self, msg, **fields):
+        self.log("error", msg, **fields)
+
+
+class Sink:
+    def __init__(self, stream=None, level=DEFAULT_LEVEL, fmt="json", max_queue=QUEUE_SIZE):
+        self.stream = stream # None: whatever sys.stdout is at write time
+        self.level = LEVELS[level]
+        self.modules = {} # module -> level number, overrides self.level
+        self.fmt = fmt
+        self.max_queue = max_queue
+        self.queue = queue.Queue(max_queue)
+        self.thread = None
+        self.pid = None # process the writer thread belongs to
+        self.lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def threshold(self, module):
+        return self.modules.get(module, self.level)
+
+    def emit(self, level, module, msg, fields):
+        if self.pid != os.getpid():
+            self.start()
+        record = {"ts": round(time.time(), 3), "level": level, "module": module, "msg": msg, "pid": self.pid}
+        record.update(fields)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    # --- writer ---
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception: # closed stdout etc.; losing the log must not kill the writer
+                self.dropped += len(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write(self, batch):
+        stream = self.stream or sys.stdout
+        stream.write("".join(self.format(record) for record in batch))
+        stream.flush()
+        self.written += len(batch)
+
+    def format(self, record):
+        if self.fmt == "text":
+            extra = " ".join(f"{k}={v}" for k, v in record.items() if k not in ("ts", "level", "module", "msg", "pid"))
+            return f"[{record['level'].upper()}] {record['module']}: {record['msg']}" + (f" {extra}" if extra else "") + "\n"
+        return json.dumps(record, default=str, separators=(",", ":")) + "\n"
+
+    def flush(self, timeout=2.0):
+        """Waits (up to timeout) until everything queued so far is written."""
+        if self.pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks and time.monotonic() < deadline:
+                self.queue.all_tasks_done.wait(0.05)
+
+    def after_fork(self):
+        # The writer thread does not exist in the child; start a fresh one
+        # (with an empty queue, the parent writes its own records) on first use
+        self.queue = queue.Queue(self.max_queue)
+        self.thread = None
+        self.pid = None
+
+
+SINK = Sink()
+LOGGERS = {}
+
+if hasattr(os, 'register_at_fork'):
+    # Drain first so the writer is idle (not holding the stream) at the fork
+    os.register_at_fork(before=SINK.flush, after_in_child=SINK.after_fork)
+atexit.register(SINK.flush)
+
+
+def get(module):
+    if module not in LOGGERS:
+        LOGGERS[module] = Logger(SINK, module)
+    return LOGGERS[module]
+
+
+def configure(level=DEFAULT_LEVEL, modules=None, fmt="json", stream=None):
+    """Sets the global level, per-module overrides ({"auth": "debug"}) and output format."""
+    SINK.level = LEVELS[level]
+    SINK.modules = {module: LEVELS[lvl] for module, lvl in (modules or {}).items()}
+    SINK.fmt = fmt
+    if stream is not None:
+        SINK.stream = stream
+
+
+def parse_module_levels(specs):
+    """["auth=debug", "server=warn"] -> {"auth": "debug", "server": "warn"}; ValueError if malformed."""
+    modules = {}
+    for spec in specs or ():
+        module, _, level = spec.partition("=")
+        if not module or level not in LEVELS:
+            raise ValueError(f"expected module=level with level in {'/'.join(LEVELS)}, got {spec!r}")
+        modules[module] = level
+    return modules
+
+
+def written():
+    return SINK.written
+
+
+def dropped():
+    return SINK.dropped
@@ -0,0 +1,242 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import logger
+
+# --- SERVER METRICS ---
+# Everything is kept in process memory and is cheap to update from any
+# thread. Read it with the STATS command or scrape the plaintext listener
+# (Prometheus exposition format) started by start_listener().
+
+METRICS_HOST = '127.0.0.1' # local only, there is no auth on the listener
+METRICS_PORT = 9465
+
+# Upper bounds in seconds, roughly x2 apart: 100us .. 20s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+# Upper bounds in bytes: 64B .. 16MB
+SIZE_BUCKETS = tuple(64 * 4 ** i for i in range(10))
+
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are interpolated inside the bucket."""
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+    def cumulative(self):
+        """[(le, count), ...] including +Inf, as Prometheus wants it."""
+        with self.lock:
+            counts = list(self.counts)
+        out, running = [], 0
+        for bound, c in zip(self.bounds + (float('inf'),), counts):
+            running += c
+            out.append((bound, running))
+        return out
+
+
+class CommandStats:
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.errors = 0
+        self.inflight = 0
+        self.latency = Histogram()     # frame received -> reply encoded
+        self.db_time = Histogram()     # time inside cursor/commit calls
+        self.encode_time = Histogram() # serialization of the reply
+        self.bytes_in = Histogram(SIZE_BUCKETS)
+        self.bytes_out = Histogram(SIZE_BUCKETS)
+        self.lock = threading.Lock()
+
+    def begin(self):
+        with self.lock:
+            self.inflight += 1
+
+    def end(self, latency, db_time, encode_time, size_in, size_out, error):
+        with self.lock:
+            self.inflight -= 1
+            self.requests += 1
+            if error:
+                self.errors += 1
+        self.latency.observe(latency)
+        self.db_time.observe(db_time)
+        self.encode_time.observe(encode_time)
+        self.bytes_in.observe(size_in)
+        self.bytes_out.observe(size_out)
+
+    def snapshot(self):
+        ms = lambda s: round(s * 1000, 3)
+        return {
+            "requests": self.requests, "errors": self.errors, "inflight": self.inflight,
+            "latency_ms": {"p50": ms(self.latency.quantile(0.5)), "p95": ms(self.latency.quantile(0.95)),
+                           "p99": ms(self.latency.quantile(0.99))},
+            "db_ms": {"p50": ms(self.db_time.quantile(0.5)), "p99": ms(self.db_time.quantile(0.99)),
+                      "total": ms(self.db_time.sum)},
+            "encode_ms": {"p50": ms(self.encode_time.quantile(0.5)), "p99": ms(self.encode_time.quantile(0.99)),
+                          "total": ms(self.encode_time.sum)},
+            "bytes_in": int(self.bytes_in.sum), "bytes_out": int(self.bytes_out.sum),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.commands = {}
+        self.counters = {}
+        self.gauges = {} # name -> zero-arg callable
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def command(self, name):
+        stats = self.commands.get(name)
+        if stats is None:
+            with self.lock:
+                stats = self.commands.setdefault(name, CommandStats(name))
+        return stats
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, fn):
+        """Registers a callable that is read whenever stats are exported."""
+        self.gauges[name] = fn
+
+    def read_gauges(self):
+        values = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                values[name] = fn()
+            except Exception:
+                values[name] = None
+        return values
+
+    def snapshot(self):
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "commands": {name: s.snapshot() for name, s in sorted(self.commands.items())},
+            "counters": dict(self.counters),
+            "gauges": self.read_gauges(),
+        }
+
+    def exposition(self):
+        """All metrics in Prometheus text format."""
+        lines = []
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        stats = sorted(self.commands.items())
+        family("pool_requests_total", "counter", "Requests handled per command.")
+        for name, s in stats:
+            lines.append(f'pool_requests_total{{command="{name}"}} {s.requests}')
+        family("pool_request_errors_total", "counter", "Requests that returned an error.")
+        for name, s in stats:
+            lines.append(f'pool_request_errors_total{{command="{name}"}} {s.errors}')
+        family("pool_requests_inflight", "gauge", "Requests currently being processed.")
+        for name, s in stats:
+            lines.append(f'pool_requests_inflight{{command="{name}"}} {s.inflight}')
+
+        for metric, attr, help_text in (
+                ("pool_request_duration_seconds", "latency", "Time from frame received to reply encoded."),
+                ("pool_request_db_seconds", "db_time", "Time spent in MySQL calls per request."),
+                ("pool_request_encode_seconds", "encode_time", "Time spent serializing the reply."),
+                ("pool_request_size_bytes", "bytes_in", "Request frame body size."),
+                ("pool_response_size_bytes", "bytes_out", "Reply frame body size.")):
+            family(metric, "histogram", help_text)
+            for name, s in stats:
+                hist = getattr(s, attr)
+                for bound, count in hist.cumulative():
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f'{metric}_bucket{{command="{name}",le="{le}"}} {count}')
+                lines.append(f'{metric}_sum{{command="{name}"}} {hist.sum}')
+                lines.append(f'{metric}_count{{command="{name}"}} {hist.count}')
+
+        for name, value in sorted(self.counters.items()):
+            family(f"pool_{name}_total", "counter", name.replace("_", " ") + ".")
+            lines.append(f"pool_{name}_total {value}")
+        for name, value in sorted(self.read_gauges().items()):
+            if value is None:
+                continue
+            family(f"pool_{name}", "gauge", name.replace("_", " ") + ".")
+            lines.append(f"pool_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry
+METRICS = Metrics()
+
+METRICS.gauge("log_records_written", logger.written)
+METRICS.gauge("log_records_dropped", logger.dropped) # log queue was full
+
+# --- DB TIME (per request, per thread) ---
+# auth.py adds the time of every cursor/commit call here; server.py resets
+# it before a command runs and reads it afterwards. Each request runs on a
+# single thread, so a thread-local is enough.
+
+_db = threading.local()
+
+def reset_db_time():
+    _db.total = 0.0
+
+def add_db_time(seconds):
+    _db.total = getattr(_db, 'total', 0.0) + seconds
+
+def take_db_time():
+    total = getattr(_db, 'total', 0.0)
+    _db.total = 0.0
+    return total
+
+
+# --- PLAINTEXT LISTENER ---
+
+class _ExpositionHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = METRICS.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # scrapes every few seconds would flood stdout
+
+
+def start_listener(host=METRICS_HOST, port=METRICS_PORT):
+    """Serves /metrics on a daemon thread. Returns the HTTP server."""
+    httpd = ThreadingHTTPServer((host, port), _ExpositionHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    logger.get("metrics").info("serving Prometheus metrics", url=f"http://{host}:{port}/metrics")
+    return httpd
@@ -0,0 +1,325 @@
+import os
+import select
+import time
+import socket
+import itertools
+from collections import deque
+
+import protocol
+import tracing
+from protocol import FLAG_PUSH, HEADER_SIZE, decode_body, encode_message, send_buffers, split_header
+
+# --- NETWORK CLIENT (CONNECTS TO SERVER.PY) ---
+class NetworkClient:
+    def __init__(self, server_ip="127.0.0.1", port=65432, codecs=("binary", "json"),
+                 compression=("zlib",), session_file=None, trace_file=None):
+        self.server_ip = server_ip
+        self.port = port
+        self.codecs = codecs
+        self.compression = compression
+        self.client = None
+        self.connected = False
+        self.next_id = itertools.count(1)
+        self.replies = {} # request id -> reply that arrived before we asked for it
+        self.codec = protocol.DEFAULT_CODEC
+        self.compress = False # compress large requests (e.g. SAVE_EVENTS) once agreed
+        # Session token from LOGIN, used to RESUME after a reconnect (and,
+        # with a session_file, after the game restarts)
+        self.session_file = session_file
+        self.token = self.load_token()
+        self.ref_cache = {} # command -> (version, data) for versioned reference data
+        # Server pushes: queued as they arrive, handed to on() handlers by poll()
+        self.pushes = deque()
+        self.handlers = {} # event -> [fn(data), ...]
+        self.topics = []   # SUBSCRIBEd topics, renewed after a reconnect
+        # Every request carries a trace id (see tracing.py); with a
+        # trace_file each round trip is recorded there as well
+        self.tracer = tracing.TraceWriter(trace_file, "client") if trace_file else None
+        self.in_flight = {} # request id -> (command, trace id, sent at)
+        self.last_trace = None
+        self.connect()
+
+    def connect(self):
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.replies = {}
+        self.in_flight = {}
+        self.codec = protocol.DEFAULT_CODEC
+        self.compress = False
+        try:
+            self.client.connect((self.server_ip, self.port))
+            self.connected = True
+            print("[NETWORK] Connected to server.")
+        except Exception as e:
+            print(f"[NETWORK] Could not connect to server: {e}")
+            return False
+        if self.codecs or self.compression:
+            self.negotiate(self.codecs, self.compression)
+        return True
+
+    def reconnect(self):
+        """New connection after a drop; logs back in with the session token if we have one."""
+        try:
+            self.client.close()
+        except OSError:
+            pass
+        self.connected = False
+        if self.connect() and self.token:
+            self.resume()
+        if self.connected and self.topics:
+            self.send("SUBSCRIBE", {"topics": self.topics})
+        return self.connected
+
+    def negotiate(self, codecs=(), compression=()):
+        """
+        HELLO: agree on the codec and compression for this connection.
+        Older servers answer "Unknown command" and we just keep plain JSON.
+        """
+        res = self.send("HELLO", {"codecs": list(codecs or ()), "compression": list(compression or ())})
+        if res.get('status') != 'success':
+            return
+        if res.get('codec') in protocol.CODECS:
+            self.codec = protocol.CODECS[res['codec']]
+        self.compress = res.get('compression') is not None
+
+    def recv_all(self, n):
+        """Helper function to receive exactly n bytes."""
+        data = bytearray()
+        while len(data) < n:
+            packet = self.client.recv(n - len(data))
+            if not packet:
+                return None
+            data.extend(packet)
+        return data
+
+    def recv_frame(self):
+        """
+        Reads one length-prefixed frame and decodes it (inflating it first if
+        the server compressed it). Returns (flags, message), None if the socket closed.
+        """
+        # A. Read the 4-byte header: flags + message length (+ 4 more for long ones)
+        raw_header = self.recv_all(HEADER_SIZE)
+        if not raw_header:
+            return None
+        flags, msglen = split_header(raw_header)
+        if msglen == protocol.LENGTH_MASK: # 16MB or more: the length follows
+            raw_length = self.recv_all(protocol.EXT_LENGTH.size)
+            if not raw_length:
+                return None
+            (msglen,) = protocol.EXT_LENGTH.unpack(raw_length)
+
+        # B. Read exactly that many bytes, inflate/decode as the flags say
+        response_data = self.recv_all(msglen)
+        if response_data is None:
+            return None
+        return flags, decode_body(flags, response_data)
+
+    def submit(self, command, payload={}):
+        """
+        Sends a request without waiting for the reply and returns its id.
+        Collect the reply later with result(id). Several submits in a row
+        share one round trip instead of paying one each.
+        """
+        req_id = next(self.next_id)
+        trace = tracing.new_id()
+        req = {"command": command, "payload": payload, "id": req_id, "trace": trace}
+        self.in_flight[req_id] = (command, trace, time.perf_counter())
+        self.last_trace = trace
+        send_buffers(self.client, encode_message(req, self.codec, self.compress))
+        return req_id
+
+    def result(self, req_id):
+        """Waits for the reply to req_id. Replies to other ids are kept for later."""
+        try:
+            return self.wait_reply(req_id)
+        finally:
+            command, trace, sent = self.in_flight.pop(req_id, (None, None, None))
+            if self.tracer is not None and trace:
+                self.tracer.span(f"rtt {command}", time.perf_counter() - sent, "client", trace, {"id": req_id})
+
+    def ready(self, req_id):
+        """True once result(req_id) would not wait. Reads what has arrived (see poll())."""
+        if req_id not in self.replies:
+            self.poll()
+        return req_id in self.replies or not self.connected
+
+    def wait_reply(self, req_id):
+        if req_id in self.replies:
+            return self.replies.pop(req_id)
+        while True:
+            frame = self.recv_frame()
+            if frame is None:
+                self.connected = False
+                return {'status': 'error', 'message': 'Connection closed'}
+            flags, reply = frame
+            if flags & FLAG_PUSH:
+                self.pushes.append(reply)
+                continue
+            rid = reply.pop('id', None)
+            if rid == req_id:
+                return reply
+            self.replies[rid] = reply
+
+    def send(self, command, payload={}):
+        if not self.connected and not self.reconnect():
+            return {'status': 'error', 'message': 'Not connected to server'}
+
+        try:
+            res = self.result(self.submit(command, payload))
+        except OSError as e:
+            # Dropped mid-request: report it, the next send reconnects. Not
+            # retried here because the server may already have run it.
+            print(f"[NETWORK] Error: {e}")
+            self.connected = False
+            return {'status': 'error', 'message': str(e)}
+        except Exception as e:
+            print(f"[NETWORK] Error: {e}")
+            return {'status': 'error', 'message': str(e)}
+        if res.get('token'): # LOGIN, RESUME, CHANGE_PASSWORD
+            self.save_token(res['token'])
+        return res
+
+    def send_many(self, requests):
+        """
+        Pipelines a list of (command, payload) pairs: all requests go out
+        first, then the replies are collected. Returns replies in request order.
+        """
+        if not self.connected and not self.reconnect():
+            return [{'status': 'error', 'message': 'Not connected to server'} for _ in requests]
+
+        try:
+            ids = [self.submit(command, payload) for command, payload in requests]
+            return [self.result(rid) for rid in ids]
+        except Exception as e:
+            print(f"[NETWORK] Error: {e}")
+            return [{'status': 'error', 'message': str(e)} for _ in requests]
+
+    # --- SESSION ---
+
+    def resume(self):
+        """
+        RESUME with the stored token. On success the reply carries
+        player_id/username/role just like LOGIN. A rejected token is forgotten.
+        """
+        if not self.token:
+            return {'status': 'error', 'success': False, 'message': 'No saved session'}
+        res = self.send("RESUME", {"token": self.token})
+        if res.get('success') is False:
+            self.save_token(None)
+        return res
+
+    def logout(self):
+        if self.token and self.connected:
+            self.send("LOGOUT", {"token": self.token})
+        self.save_token(None)
+        self.topics = [t for t in self.topics if t != "user"]
+
+    def load_token(self):
+        if not self.session_file:
+            return None
+        try:
+            with open(self.session_file, encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def save_token(self, token):
+        self.token = token
+        if not self.session_file:
+            return
+        try:
+            if token is None:
+                if os.path.exists(self.session_file):
+                    os.remove(self.session_file)
+                return
+            fd = os.open(self.session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(token)
+        except OSError as e:
+            print(f"[NETWORK] Could not save session: {e}")
+
+    # --- SERVER PUSH ---
+    # After subscribe(), the server sends events (achievement, role_changed,
+    # banned, score) without being asked. Handlers run from poll(), so call
+    # it once per frame of the game loop; it never blocks.
+
+    def on(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def subscribe(self, topics):
+        """SUBSCRIBE to "user" (needs a login) and/or "leaderboard" pushes."""
+        res = self.send("SUBSCRIBE", {"topics": list(topics)})
+        if res.get('status') == 'success':
+            self.topics = res.get('topics', [])
+        return res
+
+    def unsubscribe(self):
+        self.topics = []
+        if self.connected:
+            self.send("UNSUBSCRIBE", {})
+
+    def poll(self):
+        """Reads pushes that arrived while idle and runs their handlers. Returns how many ran."""
+        try:
+            while self.connected and select.select([self.client], [], [], 0)[0]:
+                frame = self.recv_frame()
+                if frame is None:
+                    self.connected = False
+                    break
+                flags, message = frame
+                if flags & FLAG_PUSH:
+                    self.pushes.append(message)
+                else:
+                    self.replies[message.pop('id', None)] = message
+        except OSError as e:
+            print(f"[NETWORK] Error: {e}")
+            self.connected = False
+        handled = 0
+        while self.pushes:
+            message = self.pushes.popleft()
+            for handler in self.handlers.get(message.get('event'), ()):
+                handler(message.get('data'))
+            handled += 1
+        return handled
+
+    # --- REFERENCE DATA ---
+    # GET_ALL_ACHIEVEMENTS / GET_REFERENCE_DATA replies carry a version. We
+    # send it back next time and the server only answers "not_modified".
+
+    def versioned(self, command, payload=None):
+        """Payload for a cached command with the version we hold; use with unwrap()."""
+        payload = dict(payload or {})
+        cached = self.ref_cache.get(command)
+        if cached:
+            payload['version'] = cached[0]
+        return payload
+
+    def unwrap(self, command, res):
+        """Fills in data for a not_modified reply, or remembers a fresh one."""
+        if res.get('not_modified') and command in self.ref_cache:
+            return dict(res, data=self.ref_cache[command][1])
+        if res.get('status') == 'success' and res.get('version'):
+            self.ref_cache[command] = (res['version'], res.get('data'))
+        return res
+
+    def send_cached(self, command, payload=None):
+        return self.unwrap(command, self.send(command, self.versioned(command, payload)))
+
+    @staticmethod
+    def ref(index, key):
+        """Placeholder for a value from an earlier request in the same batch()."""
+        return {"$ref": f"{index}.{key}"}
+
+    def batch(self, requests, mode="atomic"):
+        """
+        Runs a list of (command, payload) pairs on the server in one round trip.
+        Payloads may use NetworkClient.ref(i, key) to pass on an earlier result,
+        e.g. the session_id returned by SAVE_SESSION.
+        mode "atomic": all commands commit together or not at all.
+        mode "best_effort": each command stands alone.
+        Returns (ok, results) where results has one reply per command that ran.
+        """
+        res = self.send("BATCH", {
+            "mode": mode,
+            "requests": [{"command": c, "payload": p} for c, p in requests],
+        })
+        return res.get('status') == 'success', res.get('results', [])
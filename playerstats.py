@@ -0,0 +1,75 @@
+import argparse
+import sys
+
+import auth
+
+# --- PLAYER STATS CHECK / REBUILD ---
+# PlayerStats and PlayerDifficultyStats hold running totals that
+# auth.py updates in the same transaction as each game and its events.
+# They back the admin user list and sp_CheckPlayerAchievements. This tool
+# recounts them from GameParticipant/GameEvent (full scans) and compares:
+#
+#   python playerstats.py verify          # lists differences, exit code 1 if any
+#   python playerstats.py rebuild         # recounts both tables in one transaction
+#
+# Run rebuild once after creating the tables on an existing database, and
+# whenever verify reports drift (e.g. rows edited by hand). It locks the
+# rows it counts, so games saved meanwhile wait for it; pick a quiet time.
+
+PLAYER_COLUMNS = ("GamesPlayed", "Wins", "TotalPots", "TotalFouls", "LastPlayed")
+DIFFICULTY_COLUMNS = ("GamesPlayed", "BestScore")
+
+
+def diff_rows(table, stored, actual, key, columns):
+    """Differences between two row lists keyed by `key`; a missing row counts as all zeros/NULL."""
+    empty = {column: None if column == "LastPlayed" else 0 for column in columns}
+    stored = {tuple(row[k] for k in key): row for row in stored}
+    actual = {tuple(row[k] for k in key): row for row in actual}
+    problems = []
+    for ident in sorted(set(stored) | set(actual)):
+        have, want = stored.get(ident, empty), actual.get(ident, empty)
+        for column in columns:
+            # MAX(StartTime) can come back as text where the column reads as a datetime
+            if have[column] != want[column] and str(have[column]) != str(want[column]):
+                problems.append(dict(zip(key, ident), table=table, column=column,
+                                     stored=have[column], actual=want[column]))
+    return problems
+
+
+def verify():
+    """List of differences between the stored totals and a recount. None if the DB is unreachable."""
+    stored, actual = auth.get_player_stats(), auth.compute_player_stats()
+    if stored is None or actual is None:
+        return None
+    return (diff_rows("PlayerStats", stored['players'], actual['players'], ("PlayerID",), PLAYER_COLUMNS)
+            + diff_rows("PlayerDifficultyStats", stored['difficulties'], actual['difficulties'],
+                        ("PlayerID", "DifficultyID"), DIFFICULTY_COLUMNS))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or rebuild the PlayerStats tables")
+    parser.add_argument("action", choices=["verify", "rebuild"])
+    parser.add_argument("--show", type=int, default=20, help="differences to print (verify)")
+    args = parser.parse_args(argv)
+
+    if args.action == "rebuild":
+        counts = auth.rebuild_player_stats()
+        if counts is None:
+            sys.exit("Rebuild failed, see the log")
+        print(f"Rebuilt {counts['players']} PlayerStats and {counts['difficulties']} PlayerDifficultyStats rows")
+        return
+
+    problems = verify()
+    if problems is None:
+        sys.exit("Could not read the stats, see the log")
+    for p in problems[:args.show]:
+        ident = ", ".join(f"{k}={p[k]}" for k in ("PlayerID", "DifficultyID") if k in p)
+        print(f"  {p['table']} {ident}: {p['column']} stored {p['stored']}, counted {p['actual']}")
+    if problems:
+        players = len({p['PlayerID'] for p in problems})
+        sys.exit(f"{len(problems)} differences for {players} players; run: python playerstats.py rebuild")
+    print("PlayerStats match GameParticipant/GameEvent")
+
+
+if __name__ == "__main__":
+    main()
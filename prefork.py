@@ -0,0 +1,126 @@
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import logger
+
+# --- PREFORK SUPERVISOR ---
+# One Python process only ever uses one core for Python code (the GIL), so
+# for multi-core machines server.py can run N worker processes. Each worker
+# binds the same port with SO_REUSEPORT and the kernel spreads new
+# connections across them. The supervisor only forks, waits, and restarts
+# workers that die.
+#
+# Each worker has its own memory: metrics, caches and anything else kept
+# in process state are per worker, not shared. A client stays on one
+# worker for the lifetime of its connection.
+
+log = logger.get("prefork")
+
+CRASH_WINDOW = 5.0         # a worker that dies sooner than this after starting counts as crashing
+RESTART_BACKOFF_MAX = 30.0 # cap on the delay before restarting a crashing worker
+STOP_TIMEOUT = 10.0        # grace period for workers on shutdown before SIGKILL
+POLL_INTERVAL = 0.2
+
+
+def cpu_count():
+    return os.cpu_count() or 1
+
+
+def can_prefork():
+    return hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+
+
+class Supervisor:
+    """
+    Runs target(index) in `workers` forked processes, index 0..workers-1,
+    and keeps that many alive. A restarted worker gets the index of the
+    one it replaces, so per-worker settings (e.g. metrics port) stay stable.
+    """
+    def __init__(self, target, workers):
+        self.target = target
+        self.workers = workers
+        self.children = {} # pid -> (index, started)
+        self.failures = [0] * workers
+        self.stopping = False
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: default signal handling, never return into the supervisor loop
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                self.target(index)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                log.error("worker crashed", index=index, error=traceback.format_exc())
+                code = 1
+            finally:
+                logger.SINK.flush()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.children[pid] = (index, time.monotonic())
+        log.info("worker started", index=index, pid=pid)
+
+    def stop(self, signum=None, frame=None):
+        if self.stopping:
+            return
+        self.stopping = True
+        log.info("stopping workers", count=len(self.children))
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def restart_delay(self, index, uptime):
+        if uptime >= CRASH_WINDOW:
+            self.failures[index] = 0
+            return 0.0
+        self.failures[index] += 1
+        return min(RESTART_BACKOFF_MAX, 0.5 * 2 ** (self.failures[index] - 1))
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        log.info("starting workers", count=self.workers, pid=os.getpid())
+        for index in range(self.workers):
+            self.spawn(index)
+
+        stop_deadline = None
+        while self.children:
+            # Poll rather than block in wait() so a stop request is noticed
+            # even if no worker exits
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if self.stopping:
+                    if stop_deadline is None:
+                        stop_deadline = time.monotonic() + STOP_TIMEOUT
+                    elif time.monotonic() > stop_deadline:
+                        for child in self.children:
+                            os.kill(child, signal.SIGKILL)
+                        stop_deadline = float('inf')
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            index, started = self.children.pop(pid, (None, 0.0))
+            if index is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+            reason = f"signal {-code}" if code < 0 else f"exit code {code}"
+            delay = self.restart_delay(index, time.monotonic() - started)
+            log.error("worker died, restarting", index=index, pid=pid, reason=reason, delay=round(delay, 1))
+            if delay:
+                time.sleep(delay)
+            if not self.stopping:
+                self.spawn(index)
+        log.info("all workers stopped")
@@ -0,0 +1,196 @@
+import argparse
+import collections
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import logger
+from metrics import METRICS
+
+# --- SAMPLING PROFILER ---
+# Looks at the live server without restarting it. While a profile runs, a
+# thread wakes every `interval` seconds, takes the current stack of every
+# other thread (sys._current_frames) and counts it. Nothing is traced in
+# between, so the cost is one stack walk per thread per sample and zero
+# when no profile is running.
+#
+# Request threads are tagged with the command they are running (see
+# server.process_request), and KDF pool threads with the command that
+# submitted the hash. Each stack's root frame is that tag, so a flame graph
+# splits by command first, e.g.
+#   LOGIN;kdf.py:_run 412
+#   GET_HISTORY;server.py:process_request;commands.py:cmd_get_history;auth.py:get_full_game_history 230
+# Untagged threads (event loop, idle workers, metrics) are only sampled
+# with all_threads, rooted at their thread name.
+#
+# Output is the "collapsed stack" format flamegraph.pl and speedscope read.
+#
+# Started by the admin-only PROFILE command, or with SIGUSR2, which
+# profiles for SIGNAL_SECONDS and writes the result to a file:
+#   kill -USR2 <pid>
+# One profile runs at a time per process.
+
+DEFAULT_INTERVAL = 0.005 # 200 samples a second
+MAX_SECONDS = 60.0
+SIGNAL_SECONDS = 30.0
+
+log = logger.get("profiler")
+
+_tags = {} # thread id -> command name, while the thread runs one
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this process."""
+
+
+def tag(name):
+    _tags[threading.get_ident()] = name
+
+
+def untag():
+    _tags.pop(threading.get_ident(), None)
+
+
+def current_tag():
+    return _tags.get(threading.get_ident())
+
+
+class Profile:
+    def __init__(self, interval=DEFAULT_INTERVAL, all_threads=False):
+        self.interval = interval
+        self.all_threads = all_threads
+        self.stacks = collections.Counter() # "root;frame;frame" -> samples
+        self.by_tag = collections.Counter() # root -> samples
+        self.samples = 0
+        self.labels = {} # code object -> "file.py:function"
+        self.thread_names = {}
+
+    def label(self, code):
+        name = self.labels.get(code)
+        if name is None:
+            name = self.labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return name
+
+    def sample(self, me):
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            root = _tags.get(tid)
+            if root is None:
+                if not self.all_threads:
+                    continue
+                root = self.thread_names.get(tid, "thread")
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame.f_code))
+                frame = frame.f_back
+            stack.append(root)
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+            self.by_tag[root] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        """Samples on the calling thread for `seconds`."""
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        next_names = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now >= next_names: # pick up new threads' names once a second
+                self.thread_names = {t.ident: t.name for t in threading.enumerate()}
+                next_names = now + 1.0
+            self.sample(me)
+            time.sleep(self.interval)
+        return self
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def summary(self):
+        return {"samples": self.samples, "interval_ms": round(self.interval * 1000, 2),
+                "by_command": dict(self.by_tag.most_common())}
+
+
+def profile(seconds, interval=DEFAULT_INTERVAL, all_threads=False):
+    """Runs one profile on this thread and returns it. Raises ProfilerBusy if one is running."""
+    seconds = min(max(float(seconds), 0.0), MAX_SECONDS)
+    interval = max(float(interval), 0.001)
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        log.info("profiling", seconds=seconds, interval_ms=interval * 1000, all_threads=all_threads)
+        METRICS.incr("profiles_run")
+        return Profile(interval, all_threads).run(seconds)
+    finally:
+        _running.release()
+
+
+def dump(seconds=SIGNAL_SECONDS, directory=None, all_threads=True):
+    """Profiles and writes collapsed stacks to a file. Returns the path, or None if busy."""
+    try:
+        prof = profile(seconds, all_threads=all_threads)
+    except ProfilerBusy:
+        log.warn("profile already running, signal ignored")
+        return None
+    path = os.path.join(directory or tempfile.gettempdir(),
+                        f"pool-profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(prof.collapsed())
+    log.info("profile written", path=path, **prof.summary())
+    return path
+
+
+def install_signal(directory=None, seconds=SIGNAL_SECONDS):
+    """SIGUSR2 -> dump() on a background thread. Call from the main thread."""
+    import signal
+    if not hasattr(signal, "SIGUSR2"): # Windows
+        return False
+
+    def handler(signum, frame):
+        threading.Thread(target=dump, args=(seconds, directory), name="profiler", daemon=True).start()
+
+    signal.signal(signal.SIGUSR2, handler)
+    return True
+
+
+# --- COMMAND LINE ---
+# python profiler.py --user admin --password ... --seconds 10 -o server.folded
+# Logs in on the running server and asks it for a PROFILE.
+
+def main(argv=None):
+    from network import NetworkClient
+
+    parser = argparse.ArgumentParser(description="Profile a running Pool Game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=65432)
+    parser.add_argument("--user", required=True, help="an ADMIN account")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--interval-ms", type=float, default=DEFAULT_INTERVAL * 1000)
+    parser.add_argument("--all-threads", action="store_true", help="include idle and untagged threads")
+    parser.add_argument("-o", "--output", default="server.folded")
+    args = parser.parse_args(argv)
+
+    net = NetworkClient(args.host, args.port)
+    res = net.send("LOGIN", {"username": args.user, "password": args.password})
+    if not res.get('success'):
+        sys.exit(f"Login failed: {res.get('message')}")
+    res = net.send("PROFILE", {"seconds": args.seconds, "interval_ms": args.interval_ms,
+                               "all_threads": args.all_threads})
+    if res.get('status') != 'success':
+        sys.exit(f"PROFILE failed: {res.get('message')}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(res['data'])
+    print(f"{res['samples']} samples written to {args.output}")
+    for command, samples in res['by_command'].items():
+        print(f"  {command:<28}{samples:>8}")
+
+
+if __name__ == "__main__":
+    main()
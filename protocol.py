@@ -0,0 +1,237 @@
+import struct
+import json
+import datetime
+import zlib
+from decimal import Decimal
+
+import bincodec
+
+# --- WIRE FORMAT (shared by server.py and network.py) ---
+# Every message in both directions is one frame:
+#   4-byte big-endian header + body
+# The header's top byte holds flags and the low 24 bits the body length,
+# so a frame with no flags set is just the old plain length prefix.
+# Bodies of 16MB and more set the 24 bits to all ones and put the real
+# length in 4 more bytes right after the header.
+# By default the body is a JSON object. Requests look like
+#   {"command": "...", "payload": {...}, "id": 7}
+# "id" is optional. When present the server copies it into the reply so a
+# client can pipeline several requests and match replies that come back
+# out of order.
+#
+# Codec negotiation: a client that sends
+#   HELLO {"codecs": ["binary", "json"]}
+# gets back the first codec the server supports, and from then on the
+# server encodes that connection's replies with it. Every frame says which
+# codec its body uses (FLAG_BINARY), so frames already in flight during
+# the switch still decode correctly.
+#
+# Compression is negotiated the same way: HELLO {"compression": ["zlib"]}.
+# After that, bodies of at least COMPRESS_THRESHOLD bytes are zlib
+# compressed (when it actually saves space) and marked with FLAG_ZLIB.
+# A receiver always inflates a FLAG_ZLIB body, whatever was negotiated.
+#
+# Push frames (FLAG_PUSH) go from server to client without a request:
+#   {"event": "achievement", "data": {...}}
+# They never carry an id and are only sent on connections that asked for
+# them with SUBSCRIBE (see push.py), so older clients never see one.
+
+HEADER = struct.Struct('>I')
+HEADER_SIZE = HEADER.size
+EXT_LENGTH = struct.Struct('>I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024 - 1 # largest frame we read, plenty for any SAVE_EVENTS list
+MAX_BODY_SIZE = 0xFFFFFFFF # largest the extended length can describe (big GET_HISTORY replies)
+LENGTH_MASK = 0xFFFFFF # also the "extended length follows" marker
+FLAG_SHIFT = 24
+
+FLAG_BINARY = 0x01 # body uses bincodec instead of JSON
+FLAG_ZLIB = 0x02   # body is zlib compressed
+FLAG_PUSH = 0x04   # unsolicited server event, not a reply
+
+COMPRESSIONS = ("zlib",)
+COMPRESS_THRESHOLD = 1024 # smaller bodies are not worth the CPU
+COMPRESS_LEVEL = 1        # fast; history/user lists are repetitive enough
+MAX_INFLATED_SIZE = 64 * 1024 * 1024
+
+
+class FrameError(Exception):
+    """Raised when the peer sends a frame we refuse to read (e.g. too large)."""
+
+
+# --- CODECS ---
+
+# Helper to serialize Dates AND Decimals for JSON
+def json_serial(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal): 
+        return int(obj)          # Convert Decimal to Int
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+class JsonCodec:
+    name = "json"
+    flags = 0
+
+    @staticmethod
+    def encode(obj):
+        return json.dumps(obj, default=json_serial).encode('utf-8')
+
+    @staticmethod
+    def decode(body):
+        return json.loads(body)
+
+
+class BinaryCodec:
+    name = "binary"
+    flags = FLAG_BINARY
+
+    encode = staticmethod(bincodec.encode)
+    decode = staticmethod(bincodec.decode)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, BinaryCodec)}
+DEFAULT_CODEC = JsonCodec
+
+
+def choose_codec(offered):
+    """Server side of HELLO: first codec in the client's list that we know."""
+    for name in offered or ():
+        if name in CODECS:
+            return CODECS[name]
+    return DEFAULT_CODEC
+
+
+def choose_compression(offered):
+    """Server side of HELLO: "zlib" if the client offered it, else None."""
+    for name in offered or ():
+        if name in COMPRESSIONS:
+            return name
+    return None
+
+
+def inflate(body):
+    inflater = zlib.decompressobj()
+    try:
+        data = inflater.decompress(body, MAX_INFLATED_SIZE)
+    except zlib.error as e:
+        raise FrameError(f"Bad compressed frame: {e}")
+    if inflater.unconsumed_tail:
+        raise FrameError(f"Compressed frame inflates past {MAX_INFLATED_SIZE} bytes")
+    return data
+
+
+def decode_body(flags, body):
+    if flags & FLAG_ZLIB:
+        body = inflate(body)
+    codec = BinaryCodec if flags & FLAG_BINARY else JsonCodec
+    try:
+        return codec.decode(body)
+    except RecursionError: # json: "[[[[..." deeper than the interpreter allows
+        raise FrameError("Request nested too deeply")
+
+
+# --- FRAMING ---
+
+def encode_header(length, flags=0):
+    if length < LENGTH_MASK:
+        return HEADER.pack((flags << FLAG_SHIFT) | length)
+    if length > MAX_BODY_SIZE:
+        raise FrameError(f"Frame of {length} bytes exceeds {MAX_BODY_SIZE}")
+    return HEADER.pack((flags << FLAG_SHIFT) | LENGTH_MASK) + EXT_LENGTH.pack(length)
+
+
+def encode_frame(body, flags=0):
+    """Returns header + body as one bytes object."""
+    return encode_header(len(body), flags) + body
+
+
+def encode_message(obj, codec=DEFAULT_CODEC, compress=False, flags=0):
+    """
+    Returns (header, body) ready for a scatter/gather send.
+    With compress=True, large bodies are zlib compressed if that makes them smaller.
+    """
+    body = codec.encode(obj)
+    flags |= codec.flags
+    # Past MAX_INFLATED_SIZE the receiver would refuse to inflate it
+    if compress and COMPRESS_THRESHOLD <= len(body) <= MAX_INFLATED_SIZE:
+        packed = zlib.compress(body, COMPRESS_LEVEL)
+        if len(packed) < len(body):
+            body = packed
+            flags |= FLAG_ZLIB
+    return encode_header(len(body), flags), body
+
+
+def encode_push(event, data, codec=DEFAULT_CODEC, compress=False):
+    """A FLAG_PUSH frame as (header, body)."""
+    return encode_message({"event": event, "data": data}, codec, compress, FLAG_PUSH)
+
+
+def split_header(raw):
+    """
+    Returns (flags, length) from a 4-byte header. A length of LENGTH_MASK
+    means the real one is in the next EXT_LENGTH.size bytes.
+    """
+    (word,) = HEADER.unpack(raw)
+    return word >> FLAG_SHIFT, word & LENGTH_MASK
+
+
+def send_buffers(sock, buffers):
+    """
+    Writes several buffers with one sendmsg() call (no header + body copy).
+    Loops on partial writes; falls back to sendall where sendmsg is missing.
+    """
+    if not hasattr(sock, 'sendmsg'): # Windows
+        sock.sendall(b''.join(buffers))
+        return
+    views = [memoryview(b) for b in buffers if len(b)]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+class FrameDecoder:
+    """
+    Streaming decoder. Feed it whatever recv() returned; it hands back
+    (flags, body) for every complete frame and keeps partial data until the
+    rest arrives. One recv can hold half a frame or several frames.
+    """
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        self.pos = 0 # start of unconsumed data in buffer
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        frames = []
+        buf = self.buffer
+        while len(buf) - self.pos >= HEADER_SIZE:
+            (word,) = HEADER.unpack_from(buf, self.pos)
+            length = word & LENGTH_MASK
+            start = self.pos + HEADER_SIZE
+            if length == LENGTH_MASK:
+                if len(buf) - start < EXT_LENGTH.size:
+                    break
+                (length,) = EXT_LENGTH.unpack_from(buf, start)
+                start += EXT_LENGTH.size
+            if length > self.max_frame_size:
+                raise FrameError(f"Frame of {length} bytes exceeds {self.max_frame_size}")
+            end = start + length
+            if len(buf) < end:
+                break
+            frames.append((word >> FLAG_SHIFT, bytes(buf[start:end])))
+            self.pos = end
+
+        # Drop consumed bytes once in a while instead of on every frame
+        if self.pos and (self.pos == len(buf) or self.pos > 65536):
+            del buf[:self.pos]
+            self.pos = 0
+        return frames
+
+    def pending(self):
+        """Number of buffered bytes that do not form a complete frame yet."""
+        return len(self.buffer) - self.pos
@@ -0,0 +1,83 @@
+import threading
+
+import protocol
+from metrics import METRICS
+
+# --- SERVER PUSH ---
+# Lets the server tell a client about things it did not ask for, on the
+# connection it already has: achievement unlocked, role changed, banned,
+# a new score on the leaderboard. Saves the screens from re-polling.
+#
+# The client opts in with SUBSCRIBE {"topics": [...]}:
+#   "user"        - events about the player logged in on this connection
+#                   (achievement, role_changed, banned); needs LOGIN/RESUME
+#   "leaderboard" - every newly saved score
+# Events arrive as FLAG_PUSH frames (see protocol.py).
+#
+# Delivery never blocks the request that published the event: the server
+# sets ctx.push to a function that hands the frame to the connection
+# without waiting (see server.py). A connection whose send buffer is full
+# just misses the push (push_dropped); clients still refresh a screen when
+# they open it.
+#
+# The broker is per process. With --workers, a client only gets events
+# published by the worker it is connected to; commands a player runs on
+# their own connection (achievements, scores) always reach them.
+
+TOPICS = ("user", "leaderboard")
+
+
+class Broker:
+    def __init__(self):
+        self.topics = {topic: set() for topic in TOPICS} # topic -> {ctx, ...}
+        self.lock = threading.Lock()
+
+    def subscribe(self, ctx, topics):
+        with self.lock:
+            for topic in topics:
+                self.topics[topic].add(ctx)
+
+    def unsubscribe(self, ctx, topics=TOPICS):
+        with self.lock:
+            for topic in topics:
+                self.topics[topic].discard(ctx)
+
+    def subscriptions(self, ctx):
+        with self.lock:
+            return [topic for topic in TOPICS if ctx in self.topics[topic]]
+
+    def publish(self, topic, event, data):
+        with self.lock:
+            targets = list(self.topics[topic])
+        self.deliver(targets, event, data)
+
+    def publish_user(self, user_id, event, data):
+        """Sends to every connection where user_id is logged in and subscribed."""
+        # Matched on who is logged in now, so a connection that switches
+        # user keeps its subscription without re-subscribing. User events
+        # are rare enough for a scan.
+        with self.lock:
+            targets = [ctx for ctx in self.topics["user"] if ctx.user_id == user_id]
+        self.deliver(targets, event, data)
+
+    def deliver(self, targets, event, data):
+        frames = {} # encoded once per (codec, compress) in use
+        for ctx in targets:
+            if ctx.push is None:
+                continue
+            key = (ctx.codec.name, ctx.compress)
+            if key not in frames:
+                frames[key] = protocol.encode_push(event, data, ctx.codec, ctx.compress)
+            if ctx.push(frames[key]):
+                METRICS.incr("push_sent")
+            else:
+                METRICS.incr("push_dropped")
+
+    def count(self):
+        with self.lock:
+            return len(set().union(*self.topics.values()))
+
+
+BROKER = Broker()
+
+METRICS.gauge("push_subscribers", BROKER.count)
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import threading
+import time
+
+import auth
+import protocol
+from metrics import METRICS
+
+# --- REFERENCE DATA CACHE ---
+# Achievement, DifficultyLevel and Pocket are tiny and almost never change,
+# so each server process keeps them in memory instead of querying or
+# joining them per request. The cache has a version: a hash of the
+# contents, so every worker (and every restart) computes the same version
+# for the same data.
+#
+# Clients send back the version they already hold ("version" in the
+# payload) and get {"not_modified": true} instead of the rows.
+#
+# Freshness: the tables are re-read at most every REFRESH_INTERVAL seconds
+# (three small SELECTs), which picks up edits made directly in MySQL or by
+# another worker. Code that writes to these tables in this process calls
+# invalidate() so the next read reloads straight away.
+
+REFRESH_INTERVAL = 30.0
+
+
+class ReferenceCache:
+    def __init__(self):
+        self.tables = None   # {"achievements": [...], "difficulties": [...], "pockets": [...]}
+        self.version = None
+        self.level_names = {} # DifficultyID -> LevelName
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Reads the tables from the DB. Keeps the old copy if that fails."""
+        tables = auth.get_reference_tables()
+        METRICS.incr("refcache_loads")
+        if tables is None:
+            METRICS.incr("refcache_load_errors")
+            return False
+        raw = json.dumps(tables, sort_keys=True, default=protocol.json_serial).encode('utf-8')
+        version = hashlib.sha256(raw).hexdigest()[:16]
+        level_names = {row['DifficultyID']: row['LevelName'] for row in tables['difficulties']}
+        # Swap in one go; readers see either the old or the new set
+        self.tables, self.version, self.level_names = tables, version, level_names
+        self.loaded_at = time.monotonic()
+        return True
+
+    def current(self):
+        """Returns (version, tables), reloading first if they are stale. (None, None) if never loaded."""
+        if time.monotonic() - self.loaded_at > REFRESH_INTERVAL:
+            # One thread refreshes, the others keep using what is there
+            if self.lock.acquire(blocking=self.tables is None):
+                try:
+                    if time.monotonic() - self.loaded_at > REFRESH_INTERVAL:
+                        self.load()
+                finally:
+                    self.lock.release()
+        return self.version, self.tables
+
+    def invalidate(self):
+        self.loaded_at = 0.0
+
+
+CACHE = ReferenceCache()
+
+
+def invalidate():
+    CACHE.invalidate()
+
+
+def versioned_reply(client_version, pick):
+    """
+    Reply for a cached read: not_modified if the client already has this
+    version, else {"data": pick(tables)}. None if the cache is unavailable.
+    """
+    version, tables = CACHE.current()
+    if tables is None:
+        return None
+    if client_version == version:
+        METRICS.incr("refcache_not_modified")
+        return {"status": "success", "not_modified": True, "version": version}
+    return {"status": "success", "data": pick(tables), "version": version}
+
+
+def add_level_names(rows):
+    """Fills in LevelName from DifficultyID (replaces the DifficultyLevel join)."""
+    CACHE.current()
+    names = CACHE.level_names
+    if any(row.get('DifficultyID') not in names for row in rows if row.get('DifficultyID') is not None):
+        CACHE.invalidate() # a level added since the last refresh
+        CACHE.current()
+        names = CACHE.level_names
+    for row in rows:
+        if 'DifficultyID' in row:
+            row['LevelName'] = names.get(row['DifficultyID'])
+    return rows
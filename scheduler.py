@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+
+# --- PRIORITY CLASSES ---
+# Every command belongs to a class (see commands.command(priority=...)):
+#   interactive - gameplay and screen loads: SAVE_SESSION, SAVE_EVENTS,
+#                 CHECK_ACHIEVEMENTS, BATCH, RESUME, ...
+#   auth        - LOGIN / REGISTER / CHANGE_PASSWORD (PBKDF2, see kdf.py)
+#   bulk        - scans and reports: GET_USERS, GET_HISTORY, PROFILE
+# Each class has its own bounded set of workers and its own bounded queue,
+# so a pile of admin scans can hold at most the bulk workers (and their DB
+# connections) while gameplay writes keep theirs.
+#
+# Load shedding: a request is refused straight away (busy, retry_after)
+# when its class's queue is full, or when a more important class is
+# backed up past SHED_PRESSURE of its queue. The most important class with
+# a backlog therefore keeps the server's capacity to itself; bulk goes
+# first, then auth, interactive only when its own queue overflows.
+#
+# Async mode runs each class on its own thread pool. Thread mode has no
+# pools (each connection has a thread), so there the worker count is a
+# semaphore the connection thread waits on.
+
+CLASSES = ("interactive", "auth", "bulk") # most important first
+SHED_PRESSURE = 0.5
+RETRY_AFTER = {"interactive": 0.5, "auth": 1.0, "bulk": 5.0}
+
+
+class PriorityClass:
+    def __init__(self, name, workers, max_queue):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.admitted = 0 # running + waiting
+        self.slots = threading.BoundedSemaphore(workers) # thread mode
+        self.executor = None # async mode, created on first use (after any prefork)
+
+    def queued(self):
+        return max(0, self.admitted - self.workers)
+
+    def running(self):
+        return min(self.admitted, self.workers)
+
+    def backed_up(self):
+        return self.queued() > self.max_queue * SHED_PRESSURE
+
+    def pool(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"db-{self.name}")
+        return self.executor
+
+
+class Scheduler:
+    def __init__(self, limits):
+        """limits: {class name: (workers, max_queue)} for every name in CLASSES."""
+        self.classes = {name: PriorityClass(name, *limits[name]) for name in CLASSES}
+        self.lock = threading.Lock()
+        for pc in self.classes.values():
+            METRICS.gauge(f"sched_{pc.name}_running", pc.running)
+            METRICS.gauge(f"sched_{pc.name}_queued", pc.queued)
+
+    def admit(self, name):
+        """Counts a request in. Returns its PriorityClass, or None if it is shed."""
+        pc = self.classes[name]
+        with self.lock:
+            shed = pc.admitted >= pc.workers + pc.max_queue
+            if not shed:
+                for other in CLASSES[:CLASSES.index(name)]:
+                    if self.classes[other].backed_up():
+                        shed = True
+                        break
+            if not shed:
+                pc.admitted += 1
+        if shed:
+            METRICS.incr(f"shed_{name}")
+            return None
+        return pc
+
+    def release(self, pc):
+        with self.lock:
+            pc.admitted -= 1
+
+    def pending(self):
+        return sum(pc.admitted for pc in self.classes.values())
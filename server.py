@@ -1,141 +1,581 @@
 import socket
 import threading
-import json
+import commands
+import asyncio
+import argparse
+import os
+import select
+import tempfile
+import time
+
 import auth
-import datetime
-import struct
+import dbpool
+import kdf
+import leaderboard
+import logger
+import metrics
+import prefork
+import profiler
+import push
+import refcache
+import scheduler
+import sessions
+import spool
+import tracing
+from metrics import METRICS
+
+from protocol import FrameDecoder, FrameError, decode_body, encode_message, send_buffers
+from commands import ClientContext
+
+log = logger.get("server")
 
 # Configuration
 HOST = '127.0.0.1'
 PORT = 65432
 
-from decimal import Decimal 
+# Connection limits, both modes (see ConnectionPolicy)
+MAX_CONNECTIONS = 20000   # open client sockets
+MAX_PER_IP = 64           # open sockets from one peer address
+IDLE_TIMEOUT = 300.0      # seconds without a request before we hang up
+READ_TIMEOUT = 30.0       # seconds to finish a frame once it has started arriving
+WRITE_TIMEOUT = 15.0      # seconds a reply may sit unsent before the client counts as stuck
+MAX_SEND_BUFFER = 1 << 20 # bytes queued per connection before writes wait for the client
+
+# Worker pools per priority class (see scheduler.py)
+DB_WORKERS = 32           # interactive: threads running gameplay commands
+MAX_INFLIGHT = 256        # interactive: requests allowed to wait for one
+BULK_WORKERS = 4          # bulk: scans/reports running at once (each holds a DB connection)
+BULK_QUEUE = 16           # bulk: allowed to wait; more are refused with retry_after
+# auth gets kdf workers + queue (see make_scheduler)
+
+# Async mode limits (see AsyncServer)
+MAX_PIPELINE = 16         # tagged requests one connection may have running
+LISTEN_BACKLOG = 1024
+RECV_SIZE = 65536
+
+def process_request(request, ctx, size_in=0, received=None, shed=None):
+    """
+    Routes one decoded request and returns the framed reply as (header, body).
+    Records per-command metrics; `received` is when the frame came off the
+    socket, so queueing time counts towards latency. With shed=<class> the
+    command is not run and the reply is "busy" (see scheduler.py).
+    """
+    if received is None:
+        received = time.perf_counter()
+    cmd = request.get('command')
+    name = cmd if cmd in commands.COMMANDS else "UNKNOWN"
+    profiler.tag(name) # stacks sampled on this thread count towards cmd
+    trace = tracing.trace_of(request)
+    if trace:
+        # Spans from here on (dispatch, SQL, encode) belong to this trace
+        tracing.begin(trace)
+        tracing.record("queue", time.perf_counter() - received) # frame received -> worker
+    try:
+        return _process_request(request, ctx, cmd, METRICS.command(name), size_in, received, shed)
+    finally:
+        profiler.untag()
+        if trace:
+            tracing.record(f"request {name}", time.perf_counter() - received)
+            tracing.end()
+
+def _process_request(request, ctx, cmd, stats, size_in, received, shed):
+    stats.begin()
+    metrics.reset_db_time()
+    try:
+        p = request.get('payload', {})
+        if shed:
+            response = commands.busy_response(scheduler.RETRY_AFTER[shed])
+        else:
+            with tracing.span("dispatch", command=cmd):
+                response = commands.dispatch(cmd, p, ctx)
+    except Exception as e:
+        log.error("command failed", addr=ctx.addr, command=cmd, trace=request.get('trace'), error=str(e))
+        response = {"status": "error", "message": str(e)}
+    db_time = metrics.take_db_time()
+
+    # Echo the request id so pipelining clients can match the reply
+    if 'id' in request:
+        response = dict(response, id=request['id'])
+
+    # Encode with the codec this client negotiated (JSON unless HELLO said otherwise)
+    encode_start = time.perf_counter()
+    try:
+        reply = encode_message(response, ctx.codec, ctx.compress)
+    except (TypeError, ValueError) as e:
+        log.error("could not encode reply", addr=ctx.addr, command=cmd, error=str(e))
+        response = {"status": "error", "message": "Could not encode reply"}
+        reply = encode_message(dict(response, id=request.get('id')), ctx.codec)
+    except FrameError as e:
+        log.error("reply too large", addr=ctx.addr, command=cmd, error=str(e))
+        response = {"status": "error", "message": f"Reply too large: {e}"}
+        reply = encode_message(dict(response, id=request.get('id')), ctx.codec)
+    done = time.perf_counter()
+    tracing.record("encode", done - encode_start, bytes=len(reply[1]))
+
+    stats.end(latency=done - received, db_time=db_time, encode_time=done - encode_start,
+              size_in=size_in, size_out=len(reply[1]), error=commands.is_failure(response))
+    return reply
+
+def parse_request(flags, body, addr):
+    """Decodes one frame body. Returns None (and logs) if it is not a valid request object."""
+    started = time.perf_counter()
+    try:
+        request = decode_body(flags, body)
+    except (ValueError, FrameError) as e: # bad JSON / binary / UTF-8 / zlib, nested too deeply
+        log.warn("bad request frame", addr=addr, error=str(e))
+        return None
+    if not isinstance(request, dict):
+        log.warn("request is not an object", addr=addr)
+        return None
+    trace = tracing.trace_of(request)
+    if trace:
+        tracing.record("decode", time.perf_counter() - started, trace=trace, bytes=len(body))
+    return request
+
+def make_scheduler(db_workers=DB_WORKERS, max_inflight=MAX_INFLIGHT,
+                   bulk_workers=BULK_WORKERS, bulk_queue=BULK_QUEUE):
+    # LOGIN beyond the KDF pool's capacity is refused by kdf.py anyway
+    auth = kdf.POOL.workers + kdf.POOL.max_queue
+    return scheduler.Scheduler({"interactive": (db_workers, max_inflight),
+                                "auth": (auth, auth),
+                                "bulk": (bulk_workers, bulk_queue)})
+
+def run_scheduled(sched, request, ctx, size_in, received):
+    """Thread mode: waits for a slot in the request's class, or sheds it."""
+    cls = commands.priority_of(request.get('command'), request.get('payload'))
+    pc = sched.admit(cls)
+    if pc is None:
+        return process_request(request, ctx, size_in, received, shed=cls)
+    try:
+        with pc.slots:
+            return process_request(request, ctx, size_in, received)
+    finally:
+        sched.release(pc)
+
+# --- CONNECTION POLICY (both modes) ---
+
+class ConnectionPolicy:
+    """
+    Limits applied to every client connection:
+      - at most max_connections open, and max_per_ip from one address
+      - idle_timeout: hang up on a client that sends nothing for this long
+      - read_timeout: a frame that has started arriving must finish in time
+        (a client trickling bytes cannot hold a connection forever)
+      - write_timeout / max_send_buffer: at most max_send_buffer bytes of
+        replies wait per connection; a client that does not read them
+        within write_timeout is disconnected as a slow consumer
+    Each refusal and disconnect is counted in METRICS.
+    """
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_per_ip=MAX_PER_IP,
+                 idle_timeout=IDLE_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 write_timeout=WRITE_TIMEOUT, max_send_buffer=MAX_SEND_BUFFER):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.idle_timeout = idle_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.max_send_buffer = max_send_buffer
+        self.open = 0
+        self.per_ip = {}
+        self.lock = threading.Lock()
+
+    def admit(self, addr):
+        """Counts a new connection. Returns None if allowed, else why it is refused."""
+        ip = addr[0] if addr else None
+        with self.lock:
+            if self.open >= self.max_connections:
+                reason = "global"
+            elif self.max_per_ip and self.per_ip.get(ip, 0) >= self.max_per_ip:
+                reason = "per_ip"
+            else:
+                self.open += 1
+                self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+                return None
+        METRICS.incr("connections_rejected")
+        METRICS.incr(f"connections_rejected_{reason}")
+        limit = self.max_connections if reason == "global" else self.max_per_ip
+        log.warn("connection rejected", addr=addr, reason=reason, limit=limit)
+        return reason
+
+    def release(self, addr):
+        ip = addr[0] if addr else None
+        with self.lock:
+            self.open -= 1
+            left = self.per_ip.get(ip, 1) - 1
+            if left:
+                self.per_ip[ip] = left
+            else:
+                self.per_ip.pop(ip, None)
+
+    def recv_timeout(self, decoder):
+        return self.read_timeout if decoder.pending() else self.idle_timeout
+
+    def timed_out(self, addr, decoder):
+        kind = "read" if decoder.pending() else "idle"
+        METRICS.incr(f"{kind}_timeouts")
+        log.info("connection timed out", addr=addr, kind=kind)
+
+    def slow_consumer(self, addr):
+        METRICS.incr("slow_consumer_disconnects")
+        log.warn("slow consumer disconnected", addr=addr, write_timeout=self.write_timeout)
 
-# Helper to serialize Dates AND Decimals for JSON
-def json_serial(obj):
-    if isinstance(obj, (datetime.datetime, datetime.date)):
-        return obj.isoformat()
-    if isinstance(obj, Decimal): 
-        return int(obj)          # Convert Decimal to Int
-    raise TypeError(f"Type {type(obj)} not serializable")
+# --- THREADED MODE (one OS thread per connection) ---
 
-def handle_client(conn, addr):
-    print(f"[NEW CONNECTION] {addr} connected.")
+def push_nowait(conn, send_lock, frame):
+    """
+    Thread mode ctx.push: sends a push frame from whichever thread published
+    it, but only if the socket can take it right now. False means dropped.
+    """
+    if not send_lock.acquire(timeout=1.0): # a reply is stuck going out
+        return False
+    try:
+        _, writable, _ = select.select([], [conn], [], 0)
+        if not writable:
+            return False
+        send_buffers(conn, frame)
+        return True
+    except (OSError, ValueError): # closed meanwhile; the handler cleans up
+        return False
+    finally:
+        send_lock.release()
+
+def handle_client(conn, addr, policy, sched):
+    log.info("connected", addr=addr)
+    decoder = FrameDecoder()
+    ctx = ClientContext(addr)
+    # Replies and pushes from other threads must not interleave
+    send_lock = threading.Lock()
+    ctx.push = lambda frame: push_nowait(conn, send_lock, frame)
+    # Replies are sent inline, so a full kernel buffer blocks this thread;
+    # the socket timeout turns that into a disconnect after write_timeout
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, policy.max_send_buffer)
     try:
         while True:
-            # Receive data (up to 8KB buffer)
-            data = conn.recv(8192).decode('utf-8')
+            conn.settimeout(policy.recv_timeout(decoder))
+            try:
+                data = conn.recv(RECV_SIZE)
+            except socket.timeout:
+                policy.timed_out(addr, decoder)
+                break
             if not data: break
 
-            try:
-                request = json.loads(data)
-                cmd = request.get('command')
-                p = request.get('payload', {})
-                response = {"status": "error", "message": "Unknown command"}
-
-                # --- ROUTING LOGIC ---
-                if cmd == "LOGIN":
-                    response = auth.login_player(p['username'], p['password'])
-
-                elif cmd == "REGISTER":
-                    response = auth.register_player(p['username'], p['password'])
-
-                elif cmd == "CHANGE_PASSWORD":
-                    response = auth.update_password(p['player_id'], p['new_password'])
-
-                elif cmd == "GET_ACHIEVEMENTS":
-                    # Convert SET to LIST for JSON
-                    ach_set = auth.get_player_achievements(p['player_id'])
-                    response = {"status": "success", "data": list(ach_set)}
-
-                elif cmd == "GET_ALL_ACHIEVEMENTS":
-                    data = auth.get_all_achievements_list()
-                    response = {"status": "success", "data": data}
-
-                elif cmd == "GET_HISTORY":
-                    data = auth.get_full_game_history(p['player_id'])
-                    response = {"status": "success", "data": data}
-
-                elif cmd == "GRANT_ACHIEVEMENT":
-                    auth.grant_achievement(p['player_id'], p['achievement_id'])
-                    response = {"status": "success"}
-
-                elif cmd == "SAVE_SESSION":
-                    sid = auth.save_game_session(p['pid'], p['diff'], p['score'], p['win'])
-                    response = {"status": "success", "session_id": sid}
-
-                elif cmd == "SAVE_EVENTS":
-                    # Reconstruct list of tuples from list of lists
-                    events = [tuple(x) for x in p['events']] 
-                    auth.save_event_log(p['session_id'], events)
-                    response = {"status": "success"}
-
-                elif cmd == "CHECK_ACHIEVEMENTS":
-                    new_achs = auth.check_all_achievements(
-                        p['pid'], p['diff'], p['timer'], p['shots'], p['fouls'], p['win']
-                    )
-                    response = {"status": "success", "data": new_achs}
-
-                
-                elif cmd == "GET_ALL_USERS":
-                    # In a real app, verify p['requester_role'] == 'ADMIN' here
-                    data = auth.get_all_users_for_admin()
-                    response = {"status": "success", "data": data}
-
-                elif cmd == "PROMOTE_USER":
-                    success = auth.promote_user(p['target_id'])
-                    msg = "User Promoted!" if success else "Database Error"
-                    response = {"status": "success" if success else "error", "message": msg}
-
-
-                elif cmd == "GET_PLAYER_HIGH_SCORES":
-                    data = auth.get_player_high_scores(p['player_id'])
-                    response = {"status": "success", "data": data}
-
-                elif cmd == "REVOKE_ADMIN":
-                    success = auth.revoke_admin(p['target_id'])
-                    t_id = p.get('target_id')
-                    print(f"[SERVER DEBUG] Received REVOKE request for ID: {t_id} (Type: {type(t_id)})")
-                    msg = "Admin Revoked" if success else "DB Error"
-                    response = {"status": "success" if success else "error", "message": msg}
-
-
-                elif cmd == "BAN_USER":
-                    success = auth.ban_user(p['target_id'])
-                    msg = "User Banned/Deleted" if success else "DB Error"
-                    response = {"status": "success" if success else "error", "message": msg}
-
-                
-                # Send Response (using custom serializer for dates)
-                json_data = json.dumps(response, default=json_serial).encode('utf-8')
-                    
-                    # 2. Pack the length of the data into 4 bytes (Big Endian integer)
-                msg_length = struct.pack('>I', len(json_data))
-                    
-                    # 3. Send Length + Data
-                conn.sendall(msg_length + json_data)
-
-            except json.JSONDecodeError:
-                print(f"[{addr}] JSON Error")
-            except Exception as e:
-                print(f"[{addr}] Logic Error: {e}")
-                conn.sendall(json.dumps({"status": "error", "message": str(e)}).encode('utf-8'))
-
-    except ConnectionResetError:
+            # One recv may hold a partial request or several whole ones
+            received = time.perf_counter()
+            for flags, body in decoder.feed(data):
+                request = parse_request(flags, body, addr)
+                if request is not None:
+                    reply = run_scheduled(sched, request, ctx, len(body), received)
+                    with send_lock:
+                        conn.settimeout(policy.write_timeout)
+                        try:
+                            send_buffers(conn, reply)
+                        except socket.timeout:
+                            policy.slow_consumer(addr)
+                            return
+
+    except FrameError as e:
+        log.warn("protocol error", addr=addr, error=str(e))
+    except (ConnectionResetError, BrokenPipeError):
         pass
     finally:
-        conn.close()
-        print(f"[DISCONNECTED] {addr}")
+        ctx.push = None
+        push.BROKER.unsubscribe(ctx)
+        policy.release(addr)
+        with send_lock:
+            conn.close()
+        log.info("disconnected", addr=addr)
 
-def start_server():
+def start_server(host=HOST, port=PORT, reuse_port=False, policy=None, sched=None):
+    policy = policy or ConnectionPolicy()
+    sched = sched or make_scheduler()
+    METRICS.gauge("connections_open", lambda: policy.open)
+    METRICS.gauge("requests_pending", sched.pending)
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind((HOST, PORT))
-    server.listen()
-    print(f"[LISTENING] Server listening on {HOST}:{PORT}")
+    if reuse_port: # prefork: every worker binds the same port
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.bind((host, port))
+    server.listen(LISTEN_BACKLOG)
+    log.info("listening", mode="thread", host=host, port=port)
     while True:
         conn, addr = server.accept()
-        thread = threading.Thread(target=handle_client, args=(conn, addr))
+        if policy.admit(addr):
+            conn.close()
+            continue
+        thread = threading.Thread(target=handle_client, args=(conn, addr, policy, sched))
         thread.start()
 
+# --- ASYNC MODE (single event loop, blocking auth calls on a bounded pool) ---
+
+class AsyncServer:
+    """
+    Serves every connection from one asyncio event loop.
+    Idle connections only cost a socket and a small buffer, not a thread.
+    The auth.* calls are blocking (MySQL + PBKDF2), so they run on
+    fixed-size thread pools, one per priority class, each with a bounded
+    queue (see scheduler.py).
+    Requests carrying an "id" are run concurrently (up to max_pipeline per
+    connection) and answered as they finish. Connection caps and timeouts
+    come from the ConnectionPolicy.
+    """
+    def __init__(self, host=HOST, port=PORT, policy=None,
+                 db_workers=DB_WORKERS, max_inflight=MAX_INFLIGHT, max_pipeline=MAX_PIPELINE,
+                 backlog=LISTEN_BACKLOG, reuse_port=False, sched=None):
+        self.host = host
+        self.port = port
+        self.policy = policy or ConnectionPolicy()
+        self.reuse_port = reuse_port
+        self.backlog = backlog
+        self.db_workers = db_workers
+        self.scheduler = sched or make_scheduler(db_workers, max_inflight)
+        self.max_pipeline = max_pipeline
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        policy = self.policy
+        if policy.admit(addr):
+            writer.close()
+            return
+
+        log.info("connected", addr=addr)
+        # drain() waits once this much is queued; run_request bounds the wait
+        writer.transport.set_write_buffer_limits(high=policy.max_send_buffer)
+        decoder = FrameDecoder()
+        ctx = ClientContext(addr)
+        loop = asyncio.get_running_loop()
+        ctx.push = lambda frame: self.push(loop, writer, frame)
+        pipeline = asyncio.Semaphore(self.max_pipeline)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(reader.read(RECV_SIZE), policy.recv_timeout(decoder))
+                except asyncio.TimeoutError:
+                    if tasks and not decoder.pending():
+                        continue # quiet because it is waiting on its own requests
+                    policy.timed_out(addr, decoder)
+                    break
+                if not data: break
+
+                received = time.perf_counter()
+                for flags, body in decoder.feed(data):
+                    request = parse_request(flags, body, addr)
+                    if request is None:
+                        continue
+                    job = (request, ctx, len(body), received)
+                    if 'id' in request:
+                        # Tagged request: run it alongside the others from this
+                        # client, the reply may overtake earlier ones
+                        await pipeline.acquire()
+                        task = asyncio.create_task(self.run_request(job, writer))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                        task.add_done_callback(lambda _: pipeline.release())
+                    else:
+                        # Untagged: old clients expect replies in order
+                        await self.run_request(job, writer)
+                if writer.is_closing(): # dropped as a slow consumer
+                    break
+
+        except FrameError as e:
+            log.warn("protocol error", addr=addr, error=str(e))
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            ctx.push = None
+            push.BROKER.unsubscribe(ctx)
+            policy.release(addr)
+            writer.close()
+            log.info("disconnected", addr=addr)
+
+    async def run_request(self, job, writer):
+        loop = asyncio.get_running_loop()
+        request = job[0]
+        cls = commands.priority_of(request.get('command'), request.get('payload'))
+        pc = self.scheduler.admit(cls)
+        if pc is None: # shed: the busy reply is cheap enough to build right here
+            reply = process_request(*job, shed=cls)
+        else:
+            try:
+                reply = await loop.run_in_executor(pc.pool(), process_request, *job)
+            finally:
+                self.scheduler.release(pc)
+        if writer.is_closing():
+            return
+        writer.writelines(reply) # header + body without concatenating them
+        # Queued replies are bounded: at most max_send_buffer plus one reply
+        # per pipelined request. A client that will not read them is dropped.
+        try:
+            await asyncio.wait_for(writer.drain(), self.policy.write_timeout)
+        except asyncio.TimeoutError:
+            self.policy.slow_consumer(writer.get_extra_info('peername'))
+            writer.transport.abort()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+
+    def push(self, loop, writer, frame):
+        """
+        Async mode ctx.push, called from a DB worker thread. The frame is
+        written on the loop; it is dropped if the client already has
+        max_send_buffer of unread data.
+        """
+        transport = writer.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > self.policy.max_send_buffer:
+            return False
+        loop.call_soon_threadsafe(self.write_push, writer, frame)
+        return True
+
+    @staticmethod
+    def write_push(writer, frame):
+        if not writer.is_closing():
+            writer.writelines(frame)
+
+    async def serve(self):
+        METRICS.gauge("connections_open", lambda: self.policy.open)
+        METRICS.gauge("requests_pending", self.scheduler.pending)
+        server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, backlog=self.backlog,
+            reuse_port=self.reuse_port or None)
+        log.info("listening", mode="async", host=self.host, port=self.port,
+                 max_connections=self.policy.max_connections, db_workers=self.db_workers)
+        async with server:
+            await server.serve_forever()
+
+def raise_fd_limit():
+    """Lifts the soft open-file limit to the hard limit so we can hold 10k+ sockets."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as e:
+            log.warn("could not raise open file limit", soft=soft, error=str(e))
+
+def start_async_server(host=HOST, port=PORT, **limits):
+    raise_fd_limit()
+    try:
+        asyncio.run(AsyncServer(host, port, **limits).serve())
+    except KeyboardInterrupt:
+        pass
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pool Game server")
+    parser.add_argument("--mode", choices=["async", "thread"], default="async",
+                        help="async: one event loop for all clients (default); thread: one thread per client")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help="concurrent client connections (per worker process)")
+    parser.add_argument("--max-per-ip", type=int, default=MAX_PER_IP,
+                        help="concurrent connections from one address (0 = no limit)")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds a connection may stay silent")
+    parser.add_argument("--read-timeout", type=float, default=READ_TIMEOUT,
+                        help="seconds to finish sending a frame once it has started")
+    parser.add_argument("--write-timeout", type=float, default=WRITE_TIMEOUT,
+                        help="seconds a client may leave replies unread before it is dropped")
+    parser.add_argument("--max-send-buffer", type=int, default=MAX_SEND_BUFFER,
+                        help="bytes of replies queued per connection before writes wait")
+    parser.add_argument("--db-workers", type=int, default=DB_WORKERS,
+                        help="interactive (gameplay) commands running at once")
+    parser.add_argument("--max-inflight", type=int, default=MAX_INFLIGHT,
+                        help="interactive commands allowed to wait; more are refused with retry_after")
+    parser.add_argument("--bulk-workers", type=int, default=BULK_WORKERS,
+                        help="bulk commands (GET_USERS, GET_HISTORY, ...) running at once")
+    parser.add_argument("--bulk-queue", type=int, default=BULK_QUEUE,
+                        help="bulk commands allowed to wait; more are refused with retry_after")
+    parser.add_argument("--max-pipeline", type=int, default=MAX_PIPELINE,
+                        help="async mode: pipelined requests per connection")
+    parser.add_argument("--db-pool-min", type=int, default=dbpool.POOL_MIN,
+                        help="MySQL connections opened at startup (per worker process)")
+    parser.add_argument("--db-pool-max", type=int, default=dbpool.POOL_MAX,
+                        help="MySQL connections open at most; keep >= db-workers + bulk-workers + kdf capacity")
+    parser.add_argument("--db-pool-timeout", type=float, default=dbpool.POOL_TIMEOUT,
+                        help="seconds a command waits for a free MySQL connection before failing")
+    parser.add_argument("--kdf-workers", type=int, default=kdf.KDF_WORKERS,
+                        help="password hashes computed at once (per worker process)")
+    parser.add_argument("--kdf-queue", type=int, default=kdf.KDF_QUEUE,
+                        help="password hashes allowed to wait; more are rejected with retry_after")
+    parser.add_argument("--metrics-port", type=int, default=metrics.METRICS_PORT,
+                        help="local Prometheus /metrics listener (0 to disable); worker N uses port + N")
+    parser.add_argument("--session-file",
+                        help="persist session tokens here so RESUME survives restarts (shared by prefork workers)")
+    parser.add_argument("--spool-dir",
+                        help="write-behind for SAVE_EVENTS: ack once spooled here, insert into MySQL in the background")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes sharing the port via SO_REUSEPORT (0 = one per CPU). "
+                             "Each worker has its own DB pool, so MySQL sees up to workers x db-pool-max connections")
+    parser.add_argument("--trace-file",
+                        help="record spans of requests that carry a trace id here (Chrome trace-event JSON)")
+    parser.add_argument("--log-level", choices=list(logger.LEVELS), default=logger.DEFAULT_LEVEL)
+    parser.add_argument("--log-module", action="append", metavar="MODULE=LEVEL",
+                        help="per-module log level, e.g. auth=debug (repeatable)")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json",
+                        help="json: one JSON object per line (default); text: for reading by eye")
+    args = parser.parse_args(argv)
+    try:
+        args.log_modules = logger.parse_module_levels(args.log_module)
+    except ValueError as e:
+        parser.error(f"--log-module: {e}")
+    return args
+
+def run_worker(args, index=0, reuse_port=False):
+    """Runs one server process (the only one, or one prefork worker)."""
+    kdf.configure(args.kdf_workers, args.kdf_queue)
+    auth.configure_pool(args.db_pool_min, args.db_pool_max, args.db_pool_timeout)
+    auth.POOL.warm() # after the fork: connections are per process
+    if args.metrics_port:
+        metrics.start_listener(port=args.metrics_port + index)
+    METRICS.gauge("worker_index", lambda: index)
+    if tracing.WRITER is not None:
+        METRICS.gauge("trace_spans_dropped", lambda: tracing.WRITER.dropped)
+    if args.spool_dir:
+        spool.configure(args.spool_dir, index)
+    profiler.install_signal() # kill -USR2 <pid>: profile for 30s into a temp file
+    if not refcache.CACHE.load(): # otherwise loaded on first use
+        log.warn("reference data not loaded at startup, will retry on first request")
+    if not leaderboard.BOARDS.load():
+        log.warn("leaderboards not built at startup, will retry on first request")
+    policy = ConnectionPolicy(max_connections=args.max_connections,
+                              max_per_ip=args.max_per_ip,
+                              idle_timeout=args.idle_timeout,
+                              read_timeout=args.read_timeout,
+                              write_timeout=args.write_timeout,
+                              max_send_buffer=args.max_send_buffer)
+    sched = make_scheduler(args.db_workers, args.max_inflight, args.bulk_workers, args.bulk_queue)
+    if args.mode == "thread":
+        start_server(args.host, args.port, reuse_port=reuse_port, policy=policy, sched=sched)
+    else:
+        start_async_server(args.host, args.port,
+                           policy=policy,
+                           db_workers=args.db_workers,
+                           max_pipeline=args.max_pipeline,
+                           reuse_port=reuse_port,
+                           sched=sched)
+
+def main(args):
+    logger.configure(args.log_level, args.log_modules, args.log_format)
+    workers = args.workers if args.workers > 0 else prefork.cpu_count()
+    if workers > 1 and not prefork.can_prefork():
+        log.warn("prefork needs fork() and SO_REUSEPORT; running a single process")
+        workers = 1
+    session_file = args.session_file
+    if workers > 1 and not session_file:
+        # Workers only see each other's sessions through the file
+        session_file = os.path.join(tempfile.gettempdir(), f"pool_sessions_{args.port}.log")
+        log.warn("--session-file not set, prefork workers share sessions via a temp file", path=session_file)
+    sessions.configure(session_file) # before the fork: one secret for every worker
+    tracing.configure(args.trace_file) # file opened by each process on its first span
+    if workers == 1:
+        run_worker(args)
+        return
+    # Nothing that starts threads may run before the fork: each worker
+    # opens its own listener, metrics server and DB pool
+    prefork.Supervisor(lambda index: run_worker(args, index, reuse_port=True), workers).run()
+
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    main(parse_args())
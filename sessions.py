@@ -0,0 +1,283 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+import logger
+from metrics import METRICS
+
+try:
+    import fcntl
+except ImportError: # Windows: no prefork either, so no other process to lock out
+    fcntl = None
+
+# --- SESSION TOKENS ---
+# LOGIN hands out a token so a client that reconnects (or a restarted
+# game) can RESUME without sending the password again. Checking a token is
+# one HMAC and a dict lookup instead of a User query plus 100k rounds of
+# PBKDF2.
+#
+#   token = <session id>.<user id>.<expires>.<signature>
+#
+# The signature (HMAC-SHA256 under SECRET) proves the server issued it, the
+# store says it has not been revoked. Tokens are revoked on LOGOUT, and all
+# of a user's tokens on ban, role change or password change.
+#
+# Persistence is optional: with a session file every issue/revoke is
+# appended to it as one JSON line, and stores replay lines they have not
+# seen before validating a token. That keeps sessions across restarts and
+# shares them between prefork workers (all workers append to the same
+# file). The secret must then be stable too: it comes from
+# POOL_SESSION_SECRET, or a key file next to the session file.
+#
+# The file only grows, so once it passes compact_at it is rewritten with
+# just the live sessions and swapped in with os.replace(). A flock on
+# <file>.lock keeps appends (shared) and the rewrite (exclusive) apart. A
+# store notices the swap because the path no longer names the file it has
+# open, and then rebuilds its state from the new file.
+
+log = logger.get("sessions")
+
+SESSION_TTL = 7 * 24 * 3600
+ROTATE_AFTER = SESSION_TTL // 2 # RESUME re-issues tokens older than this
+SECRET_ENV = "POOL_SESSION_SECRET"
+COMPACT_BYTES = 1024 * 1024 # rewrite the session file past this size (and twice its live size)
+
+
+class Session:
+    __slots__ = ("sid", "user_id", "username", "role", "issued", "expires")
+
+    def __init__(self, sid, user_id, username, role, issued, expires):
+        self.sid = sid
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self.issued = issued
+        self.expires = expires
+
+    def record(self):
+        return {"op": "issue", "sid": self.sid, "uid": self.user_id, "name": self.username,
+                "role": self.role, "iat": self.issued, "exp": self.expires}
+
+
+class SessionStore:
+    def __init__(self, secret=None, path=None, ttl=SESSION_TTL):
+        self.secret = secret or secrets.token_bytes(32)
+        self.path = path
+        self.ttl = ttl
+        self.sessions = {} # sid -> Session
+        self.by_user = {}  # user id -> {sid, ...}
+        self.file = None   # the session file as we last opened it, kept open so its inode stays ours
+        self.inode = None
+        self.offset = 0    # bytes of that file already applied
+        self.compact_at = COMPACT_BYTES
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock() # one catch_up at a time, so offset stays right
+
+    # --- tokens ---
+
+    def sign(self, body):
+        digest = hmac.new(self.secret, body.encode('ascii'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+    def issue(self, user_id, username, role):
+        """Creates a session and returns (token, session)."""
+        now = int(time.time())
+        session = Session(secrets.token_urlsafe(12), int(user_id), username, role, now, now + self.ttl)
+        self._apply(session.record(), persist=True)
+        METRICS.incr("sessions_issued")
+        body = f"{session.sid}.{session.user_id}.{session.expires}"
+        return f"{body}.{self.sign(body)}", session
+
+    def validate(self, token):
+        """Returns the Session for a valid, unexpired, unrevoked token, else None."""
+        try:
+            sid, user_id, expires, signature = token.split(".")
+            user_id, expires = int(user_id), int(expires)
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(signature, self.sign(f"{sid}.{user_id}.{expires}")):
+            return None
+        if expires < time.time():
+            return None
+        self.catch_up()
+        session = self.sessions.get(sid)
+        if session is None or session.user_id != user_id:
+            return None
+        return session
+
+    # --- revocation ---
+
+    def revoke(self, sid):
+        self.catch_up()
+        if sid in self.sessions:
+            self._apply({"op": "revoke", "sid": sid}, persist=True)
+            METRICS.incr("sessions_revoked")
+
+    def revoke_user(self, user_id):
+        """Ends every session of this user (ban, role change, new password)."""
+        self.catch_up()
+        count = len(self.by_user.get(int(user_id), ()))
+        self._apply({"op": "revoke_user", "uid": int(user_id)}, persist=True)
+        if count:
+            METRICS.incr("sessions_revoked", count)
+
+    def active(self):
+        return len(self.sessions)
+
+    # --- store ---
+
+    def _apply(self, rec, persist=False):
+        with self.lock:
+            op = rec.get("op")
+            if op == "issue":
+                session = Session(rec["sid"], rec["uid"], rec["name"], rec["role"], rec["iat"], rec["exp"])
+                self.sessions[session.sid] = session
+                self.by_user.setdefault(session.user_id, set()).add(session.sid)
+            elif op == "revoke":
+                session = self.sessions.pop(rec["sid"], None)
+                if session is not None:
+                    self.by_user.get(session.user_id, set()).discard(session.sid)
+            elif op == "revoke_user":
+                for sid in self.by_user.pop(rec["uid"], ()):
+                    self.sessions.pop(sid, None)
+        if persist and self.path:
+            # One write() per record on an O_APPEND file, so lines from
+            # several processes do not interleave
+            with self.locked_file(exclusive=False):
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+                    size = f.tell()
+            if size > self.compact_at:
+                self.compact(min_size=self.compact_at)
+
+    @contextmanager
+    def locked_file(self, exclusive):
+        """flock on <session file>.lock: shared for appends, exclusive to rewrite the file."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield # unlocked when f is closed
+
+    def catch_up(self):
+        """Applies records other processes appended to the session file since we last looked."""
+        if not self.path:
+            return
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        if st.st_ino == self.inode and st.st_size <= self.offset:
+            return
+        with self.file_lock:
+            if st.st_ino != self.inode and not self._reopen():
+                return
+            size = os.fstat(self.file.fileno()).st_size
+            data = _pread(self.file, size - self.offset, self.offset)
+            end = data.rfind(b"\n") + 1 # only whole lines, a writer may be mid-append
+            for line in data[:end].splitlines():
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    continue
+            self.offset += end
+
+    def _reopen(self):
+        """
+        First look at the file, or another process compacted it: forget what
+        we knew and replay the file now at self.path from the start.
+        """
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        if self.file is not None:
+            self.file.close()
+        self.file, self.inode, self.offset = f, os.fstat(f.fileno()).st_ino, 0
+        with self.lock:
+            self.sessions.clear()
+            self.by_user.clear()
+        return True
+
+    def compact(self, min_size=0):
+        """
+        Rewrites the session file with only the live sessions. Skipped if it
+        is no larger than min_size by the time we hold the lock (another
+        process may just have compacted it).
+        """
+        if not self.path:
+            return
+        with self.locked_file(exclusive=True):
+            try:
+                if os.path.getsize(self.path) <= min_size:
+                    return
+            except OSError:
+                pass
+            self.catch_up()
+            now = time.time()
+            with self.lock:
+                lines = [json.dumps(s.record(), separators=(",", ":")) + "\n"
+                         for s in self.sessions.values() if s.expires >= now]
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+            os.replace(tmp, self.path)
+            self.catch_up() # picks up the new file like any other process would
+        self.compact_at = max(COMPACT_BYTES, 2 * self.offset)
+        METRICS.incr("session_file_compactions")
+
+    def load(self):
+        """Replays the session file, drops expired sessions and rewrites it compacted."""
+        self.compact()
+
+
+def _pread(f, size, offset):
+    """Reads without moving the shared file position (the file may be inherited across fork)."""
+    if hasattr(os, 'pread'):
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset) # Windows: no fork, nobody shares it
+    return f.read(size)
+
+
+def load_secret(path=None):
+    """Secret from POOL_SESSION_SECRET, else a key file beside the session file, else random."""
+    env = os.environ.get(SECRET_ENV)
+    if env:
+        return env.encode('utf-8')
+    if not path:
+        return secrets.token_bytes(32)
+    key_path = path + ".key"
+    try:
+        with open(key_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        key = secrets.token_bytes(32)
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        return key
+
+
+STORE = SessionStore()
+
+METRICS.gauge("sessions_active", lambda: STORE.active())
+
+
+def configure(path=None, ttl=SESSION_TTL):
+    """
+    Sets up the process-wide store. Call before prefork so every worker
+    shares the secret (and the session file, if any).
+    """
+    global STORE
+    STORE = SessionStore(load_secret(path), path, ttl)
+    STORE.load()
+    if path:
+        log.info("sessions loaded", count=STORE.active(), path=path)
+    return STORE
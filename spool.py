@@ -0,0 +1,277 @@
+import collections
+import datetime
+import os
+import socket
+import struct
+import threading
+import zlib
+
+import auth
+import bincodec
+import logger
+from metrics import METRICS
+
+# --- WRITE-BEHIND EVENT SPOOL ---
+# Optional (server.py --spool-dir). SAVE_EVENTS appends the events to a
+# local append-only file and replies once that file is fsynced; a
+# background flusher moves them into GameEvent with large multi-row
+# inserts.
+#
+#   record = u32 length | u32 crc32 | u64 seq | payload
+#   payload = bincodec [session_id, spooled_at, [[player, pocket, ball, type], ...]]
+#
+# Group fsync: appenders write, then queue for one fsync; whoever gets the
+# fsync lock syncs everything written so far, so one fsync covers every
+# append that arrived meanwhile.
+#
+# No duplicates after a crash: each flush inserts the rows AND moves this
+# spool's SpoolCheckpoint.LastSeq forward in the same DB transaction. On
+# startup the whole file is read back and only records past LastSeq are
+# flushed again. Once everything is flushed the file is compacted down to
+# a single marker record that keeps the sequence number going.
+#
+# Events get EventTime = when they were spooled, not when they reach the
+# DB. GET_HISTORY can lag by up to FLUSH_INTERVAL.
+
+log = logger.get("spool")
+
+RECORD_HEADER = struct.Struct('>IIQ')
+FLUSH_INTERVAL = 0.25          # seconds between flushes when there is little to do
+FLUSH_MAX_ROWS = 5000          # rows per flush transaction
+INSERT_CHUNK = 500             # rows per INSERT statement
+MAX_PENDING_ROWS = 500000      # beyond this SAVE_EVENTS goes straight to the DB again
+COMPACT_BYTES = 4 * 1024 * 1024
+RETRY_MAX = 30.0               # longest pause between flush attempts while the DB is down
+BAD_DATA_ERRNOS = {1048, 1264, 1292, 1366, 1406, 1452} # row can never be inserted
+
+
+class SpoolFull(Exception):
+    """Too many events waiting for the DB; the caller should write directly."""
+
+
+class Spool:
+    def __init__(self, path, spool_id):
+        self.path = path
+        self.spool_id = spool_id
+        self.lock = threading.Lock()      # file writes and the pending queue
+        self.sync_lock = threading.Lock() # one fsync at a time
+        self.wakeup = threading.Event()
+        self.pending = collections.deque() # (seq, session_id, spooled_at, events)
+        self.pending_rows = 0
+        self.next_seq = 1
+        self.written_seq = 0
+        self.synced_seq = 0
+        self.checkpoint = None # LastSeq in the DB, unknown until the flusher reads it
+        self.fd = None
+        self.thread = None
+
+    # --- file ---
+
+    def open(self):
+        """Reads back any records left from the last run, then opens for appending."""
+        records, good_bytes = read_records(self.path)
+        max_seq = 0
+        for seq, payload in records:
+            max_seq = max(max_seq, seq)
+            if payload is not None:
+                sid, spooled_at, events = payload
+                self.pending.append((seq, sid, spooled_at, events))
+                self.pending_rows += len(events)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        if os.fstat(self.fd).st_size > good_bytes: # torn write at the end from a crash
+            os.ftruncate(self.fd, good_bytes)
+        self.next_seq = max_seq + 1
+        self.written_seq = self.synced_seq = max_seq
+        if self.pending:
+            log.info("replaying spooled events", records=len(self.pending), events=self.pending_rows, path=self.path)
+
+    def append(self, session_id, events):
+        """Spools one SAVE_EVENTS. Returns once it is on disk."""
+        if self.checkpoint is None:
+            raise SpoolFull("spool has not reached the database yet")
+        if self.pending_rows + len(events) > MAX_PENDING_ROWS:
+            METRICS.incr("spool_full")
+            raise SpoolFull(f"{self.pending_rows} events waiting for the database")
+        spooled_at = datetime.datetime.now().replace(microsecond=0)
+        events = [list(e) for e in events]
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            os.write(self.fd, encode_record(seq, [session_id, spooled_at, events]))
+            self.written_seq = seq
+            self.pending.append((seq, session_id, spooled_at, events))
+            self.pending_rows += len(events)
+        self.sync(seq)
+        METRICS.incr("spool_appends")
+        if self.pending_rows >= FLUSH_MAX_ROWS:
+            self.wakeup.set()
+        return seq
+
+    def sync(self, seq):
+        with self.sync_lock:
+            if self.synced_seq >= seq:
+                return # someone else's fsync already covered it
+            target = self.written_seq
+            os.fsync(self.fd)
+            self.synced_seq = target
+            METRICS.incr("spool_fsyncs")
+
+    def compact(self):
+        """Everything is in the DB: replace the file with one marker record."""
+        # sync_lock too: an appender whose record the flusher has already
+        # taken may still be about to fsync self.fd, which must not be
+        # closed (or its number reused) under it. sync_lock before lock,
+        # append() never holds lock while waiting for sync_lock.
+        with self.sync_lock, self.lock:
+            if self.pending or os.fstat(self.fd).st_size < COMPACT_BYTES:
+                return
+            tmp = self.path + ".tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                os.write(fd, encode_record(self.written_seq, None))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp, self.path)
+            os.close(self.fd)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+
+    # --- flusher ---
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="spool-flusher", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        failures = 0
+        while True:
+            self.wakeup.wait(FLUSH_INTERVAL if not failures else min(RETRY_MAX, 0.5 * 2 ** failures))
+            self.wakeup.clear()
+            try:
+                if self.checkpoint is None:
+                    self.load_checkpoint()
+                while self.pending and self.flush_once():
+                    pass
+                self.compact()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                METRICS.incr("spool_flush_errors")
+                log.error("flush failed, retrying", failures=failures, error=str(e))
+
+    def load_checkpoint(self):
+        last = auth.get_spool_checkpoint(self.spool_id)
+        if last is None:
+            raise RuntimeError("database unavailable")
+        with self.lock:
+            self.checkpoint = last
+            if last >= self.next_seq: # file lost or replaced: never reuse flushed numbers
+                self.next_seq = last + 1
+                self.written_seq = self.synced_seq = last
+            while self.pending and self.pending[0][0] <= last:
+                self.pending_rows -= len(self.pending.popleft()[3])
+        if self.pending:
+            METRICS.incr("spool_replayed_records", len(self.pending))
+
+    def take_batch(self):
+        with self.lock:
+            batch, rows = [], 0
+            for record in self.pending:
+                if batch and rows + len(record[3]) > FLUSH_MAX_ROWS:
+                    break
+                batch.append(record)
+                rows += len(record[3])
+        return batch
+
+    def flush_once(self):
+        """Writes one batch to the DB. Returns False if there was nothing to do."""
+        batch = self.take_batch()
+        if not batch:
+            return False
+        last_seq = batch[-1][0]
+        try:
+            ok = auth.flush_spooled_events(self.spool_id, rows_of(batch), last_seq, INSERT_CHUNK)
+        except auth.Error as e:
+            if getattr(e, 'errno', None) not in BAD_DATA_ERRNOS:
+                raise
+            # Some row can never go in (e.g. its session was deleted):
+            # retry record by record so only the bad ones are dropped
+            ok = all(self.flush_record(record) for record in batch)
+        if not ok:
+            raise RuntimeError("database unavailable")
+        self.done(batch)
+        return True
+
+    def flush_record(self, record):
+        try:
+            return auth.flush_spooled_events(self.spool_id, rows_of([record]), record[0], INSERT_CHUNK)
+        except auth.Error as e:
+            if getattr(e, 'errno', None) not in BAD_DATA_ERRNOS:
+                raise
+            log.error("dropping events the database refuses", events=len(record[3]), session_id=record[1], error=str(e))
+            METRICS.incr("spool_dropped_records")
+            return auth.flush_spooled_events(self.spool_id, [], record[0], INSERT_CHUNK)
+
+    def done(self, batch):
+        with self.lock:
+            for record in batch:
+                if self.pending and self.pending[0][0] == record[0]:
+                    self.pending.popleft()
+                    self.pending_rows -= len(record[3])
+            self.checkpoint = batch[-1][0]
+        METRICS.incr("spool_flushed_rows", sum(len(r[3]) for r in batch))
+
+
+def rows_of(batch):
+    return [(sid, *event, spooled_at) for _, sid, spooled_at, events in batch for event in events]
+
+
+def encode_record(seq, payload):
+    body = b"" if payload is None else bincodec.encode(payload)
+    head = struct.pack('>Q', seq) + body
+    return struct.pack('>II', len(body), zlib.crc32(head)) + head
+
+
+def read_records(path):
+    """Returns ([(seq, payload or None), ...], bytes of intact records). Stops at the first damaged record."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+    records, pos = [], 0
+    while pos + RECORD_HEADER.size <= len(data):
+        length, crc, seq = RECORD_HEADER.unpack_from(data, pos)
+        end = pos + RECORD_HEADER.size + length
+        if end > len(data) or zlib.crc32(data[pos + 8:end]) != crc:
+            break
+        body = data[pos + RECORD_HEADER.size:end]
+        try:
+            records.append((seq, bincodec.decode(body) if body else None))
+        except bincodec.CodecError:
+            break
+        pos = end
+    return records, pos
+
+
+SPOOL = None
+
+def configure(directory, worker_index=0):
+    """
+    Opens this worker's spool and starts its flusher. Call after any prefork.
+    Spool directories are per host; the checkpoint row is keyed by host name.
+    """
+    global SPOOL
+    os.makedirs(directory, exist_ok=True)
+    name = f"events-{worker_index}"
+    SPOOL = Spool(os.path.join(directory, name + ".spool"), f"{socket.gethostname()}:{name}")
+    SPOOL.open()
+    try:
+        SPOOL.load_checkpoint() # until this works, SAVE_EVENTS writes directly
+    except Exception as e:
+        log.warn("checkpoint not loaded yet, the flusher will retry", error=str(e))
+    SPOOL.start()
+    METRICS.gauge("spool_pending_rows", lambda: SPOOL.pending_rows)
+    METRICS.gauge("spool_pending_records", lambda: len(SPOOL.pending))
+    log.info("write-behind for SAVE_EVENTS", path=SPOOL.path)
+    return SPOOL
@@ -0,0 +1,412 @@
+import datetime
+import functools
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+import types
+
+# --- LOCAL STAND-IN DATABASE ---
+# A small mysql.connector look-alike backed by SQLite, for benchmarks and
+# offline runs. install() puts it in sys.modules before auth is imported,
+# so auth.py runs unchanged: same SQL, same connect/commit pattern. Only the
+# handful of MySQL-isms auth.py uses are translated, and
+# sp_CheckPlayerAchievements is re-implemented in Python.
+#
+# Not a MySQL emulator: numbers from it are for comparing server changes
+# against each other, not for predicting production DB latency. Use
+# `latency` to add a fixed per-statement delay that stands in for the
+# network hop to a real MySQL.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS User (
+  UserID INTEGER PRIMARY KEY AUTOINCREMENT,
+  Username TEXT NOT NULL UNIQUE,
+  PasswordHash TEXT NOT NULL,
+  Salt TEXT NOT NULL,
+  Role TEXT NOT NULL CHECK (Role IN ('PLAYER', 'ADMIN')),
+  DateCreated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS Player (
+  PlayerID INTEGER PRIMARY KEY REFERENCES User(UserID) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS Admin (
+  AdminID INTEGER PRIMARY KEY REFERENCES User(UserID) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS DifficultyLevel (
+  DifficultyID INTEGER PRIMARY KEY,
+  LevelName TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Pocket (
+  PocketID INTEGER PRIMARY KEY,
+  PocketName TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Achievement (
+  AchievementID INTEGER PRIMARY KEY,
+  Name TEXT NOT NULL,
+  Description TEXT,
+  DifficultyID INTEGER REFERENCES DifficultyLevel(DifficultyID)
+);
+CREATE TABLE IF NOT EXISTS GameSession (
+  GameSessionID INTEGER PRIMARY KEY AUTOINCREMENT,
+  DifficultyID INTEGER NOT NULL REFERENCES DifficultyLevel(DifficultyID),
+  StartTime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  EndTime TIMESTAMP NULL
+);
+CREATE TABLE IF NOT EXISTS GameParticipant (
+  GameSessionID INTEGER NOT NULL REFERENCES GameSession(GameSessionID) ON DELETE CASCADE,
+  PlayerID INTEGER NOT NULL REFERENCES Player(PlayerID) ON DELETE CASCADE,
+  Score INTEGER NOT NULL DEFAULT 0,
+  IsWinner BOOLEAN NOT NULL DEFAULT 0,
+  PRIMARY KEY (GameSessionID, PlayerID)
+);
+CREATE TABLE IF NOT EXISTS GameEvent (
+  EventID INTEGER PRIMARY KEY AUTOINCREMENT,
+  GameSessionID INTEGER NOT NULL REFERENCES GameSession(GameSessionID) ON DELETE CASCADE,
+  PlayerID INTEGER NOT NULL REFERENCES Player(PlayerID) ON DELETE CASCADE,
+  PocketID INTEGER NULL REFERENCES Pocket(PocketID),
+  BallPotted TEXT NULL,
+  EventType TEXT NOT NULL,
+  EventTime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS PlayerAchievement (
+  PlayerID INTEGER NOT NULL REFERENCES Player(PlayerID) ON DELETE CASCADE,
+  AchievementID INTEGER NOT NULL REFERENCES Achievement(AchievementID) ON DELETE CASCADE,
+  DateEarned TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (PlayerID, AchievementID)
+);
+CREATE TABLE IF NOT EXISTS SpoolCheckpoint (
+  SpoolID TEXT NOT NULL PRIMARY KEY,
+  LastSeq INTEGER NOT NULL DEFAULT 0,
+  UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS PlayerStats (
+  PlayerID INTEGER NOT NULL PRIMARY KEY REFERENCES Player(PlayerID) ON DELETE CASCADE,
+  GamesPlayed INTEGER NOT NULL DEFAULT 0,
+  Wins INTEGER NOT NULL DEFAULT 0,
+  TotalPots INTEGER NOT NULL DEFAULT 0,
+  TotalFouls INTEGER NOT NULL DEFAULT 0,
+  LastPlayed TIMESTAMP NULL
+);
+CREATE TABLE IF NOT EXISTS PlayerDifficultyStats (
+  PlayerID INTEGER NOT NULL REFERENCES Player(PlayerID) ON DELETE CASCADE,
+  DifficultyID INTEGER NOT NULL REFERENCES DifficultyLevel(DifficultyID),
+  GamesPlayed INTEGER NOT NULL DEFAULT 0,
+  BestScore INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (PlayerID, DifficultyID)
+);
+-- MySQL indexes every foreign key automatically, SQLite does not
+CREATE INDEX IF NOT EXISTS idx_gp_player ON GameParticipant(PlayerID);
+CREATE INDEX IF NOT EXISTS idx_ge_session ON GameEvent(GameSessionID);
+CREATE INDEX IF NOT EXISTS idx_ge_player ON GameEvent(PlayerID);
+-- User directory indexes, as in QueriesFileNew.sql
+CREATE INDEX IF NOT EXISTS idx_user_role_name ON User(Role, Username);
+CREATE INDEX IF NOT EXISTS idx_user_role_id ON User(Role, UserID);
+CREATE INDEX IF NOT EXISTS idx_ps_games ON PlayerStats(GamesPlayed, PlayerID);
+CREATE INDEX IF NOT EXISTS idx_ps_wins ON PlayerStats(Wins, PlayerID);
+"""
+
+REFERENCE_DATA = """
+INSERT OR IGNORE INTO DifficultyLevel (DifficultyID, LevelName) VALUES (1, 'Easy'), (2, 'Medium'), (3, 'Hard');
+INSERT OR IGNORE INTO Pocket (PocketID, PocketName) VALUES
+(1, 'Top-Left'), (2, 'Top-Middle'), (3, 'Top-Right'),
+(4, 'Bottom-Left'), (5, 'Bottom-Middle'), (6, 'Bottom-Right');
+INSERT OR IGNORE INTO Achievement (AchievementID, Name, Description, DifficultyID) VALUES
+(1, 'Speed Demon', 'Win a game in under 90 seconds.', NULL),
+(2, 'Sharpshooter', 'Win a game in 10 shots or less.', NULL),
+(3, 'Pool Shark', 'Win a game on Hard difficulty.', 3),
+(4, 'Hardcore', 'Win on Hard difficulty with 0 fouls.', 3),
+(5, 'First Victory', 'Win your first game.', NULL),
+(6, 'On the Board', 'Play your first game to completion.', NULL),
+(7, 'Combo Shot', 'Pot 2 or more balls in a single shot.', NULL),
+(8, 'First Potter', 'Pot your very first ball.', NULL);
+"""
+
+DB_PATH = None  # set by install()
+LATENCY = 0.0   # seconds added to every statement
+
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.datetime.fromisoformat(b.decode()))
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(" "))
+
+
+class Error(Exception):
+    def __init__(self, msg=None, errno=None):
+        super().__init__(msg)
+        self.msg = msg
+        self.errno = errno
+
+
+# --- SQL TRANSLATION ---
+
+_ON_DUP = re.compile(r"ON DUPLICATE KEY UPDATE\s+(\w+)\s*=\s*\1\s*$", re.I)
+_ON_DUP_SET = re.compile(r"ON DUPLICATE KEY UPDATE\b(.*)$", re.I | re.S)
+_CALL = re.compile(r"^\s*CALL\s+(\w+)\s*\(", re.I)
+
+@functools.lru_cache(maxsize=512)
+def translate(sql):
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"\bINSERT IGNORE\b", "INSERT OR IGNORE", sql, flags=re.I)
+    sql = re.sub(r"\bNOW\(\)", "CURRENT_TIMESTAMP", sql, flags=re.I)
+    sql = re.sub(r"\bGREATEST\(", "MAX(", sql, flags=re.I)
+    sql = _ON_DUP.sub("ON CONFLICT DO NOTHING", sql)
+    sql = _ON_DUP_SET.sub(lambda m: "ON CONFLICT DO UPDATE SET" + re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", m.group(1)), sql)
+    return sql.strip().rstrip(";")
+
+
+def _wrap_error(e):
+    if isinstance(e, sqlite3.IntegrityError) and "UNIQUE" in str(e):
+        return Error(f"1062 (23000): Duplicate entry: {e}", errno=1062)
+    if isinstance(e, sqlite3.IntegrityError):
+        return Error(f"1452 (23000): {e}", errno=1452)
+    return Error(str(e), errno=1105)
+
+
+# --- CURSOR / CONNECTION ---
+
+class Cursor:
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._db.cursor()
+        self._dictionary = dictionary
+        self._rows = None # result of an emulated CALL
+        self.lastrowid = None
+        self.rowcount = -1
+
+    @property
+    def column_names(self):
+        return tuple(d[0] for d in self._cursor.description or ())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip(self.column_names, row))
+
+    def execute(self, operation, params=()):
+        if LATENCY:
+            time.sleep(LATENCY)
+        self._rows = None
+        call = _CALL.match(operation)
+        if call:
+            proc = PROCEDURES.get(call.group(1))
+            if proc is None:
+                raise Error(f"1305 (42000): PROCEDURE {call.group(1)} does not exist", errno=1305)
+            self._rows = proc(self._connection, *params)
+            return
+        if re.match(r"^\s*SET\s+SQL_SAFE_UPDATES", operation, re.I):
+            return
+        try:
+            self._cursor.execute(translate(operation), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _wrap_error(e)
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, operation, seq_params):
+        if LATENCY:
+            time.sleep(LATENCY)
+        try:
+            self._cursor.executemany(translate(operation), [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise _wrap_error(e)
+        self.rowcount = self._cursor.rowcount
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._rows.pop(0) if self._rows else None
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                   detect_types=sqlite3.PARSE_DECLTYPES,
+                                   isolation_level="IMMEDIATE")
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._open = True
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        return Cursor(self, dictionary=dictionary)
+
+    def start_transaction(self, *args, **kwargs):
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._db.in_transaction
+
+    def is_connected(self):
+        return self._open
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if not self._open:
+            raise Error("2013: Lost connection", errno=2013)
+
+    def close(self):
+        if self._open:
+            self._db.close()
+            self._open = False
+
+
+def connect(**kwargs):
+    if LATENCY:
+        time.sleep(LATENCY * 3) # handshake round trips
+    try:
+        return Connection(DB_PATH)
+    except sqlite3.Error as e:
+        raise Error(f"2003: Can't connect to stand-in database: {e}", errno=2003)
+
+
+# --- STORED PROCEDURES ---
+
+def sp_check_player_achievements(conn, player_id, difficulty_id, timer, shots, fouls, did_win):
+    """Python copy of sp_CheckPlayerAchievements (QueriesFileNew.sql)."""
+    db = conn._db
+    granted = []
+
+    def grant(ach_id):
+        cur = db.execute("INSERT OR IGNORE INTO PlayerAchievement (PlayerID, AchievementID, DateEarned) "
+                         "VALUES (?, ?, CURRENT_TIMESTAMP)", (player_id, ach_id))
+        if cur.rowcount > 0:
+            name = db.execute("SELECT Name FROM Achievement WHERE AchievementID = ?", (ach_id,)).fetchone()[0]
+            granted.append({"AchievementID": ach_id, "Name": name})
+
+    def required_difficulty(ach_id):
+        row = db.execute("SELECT DifficultyID FROM Achievement WHERE AchievementID = ?", (ach_id,)).fetchone()
+        return row[0] if row else None
+
+    stats = db.execute("SELECT Wins, GamesPlayed FROM PlayerStats WHERE PlayerID = ?", (player_id,)).fetchone()
+    total_wins, total_games = stats or (None, None)
+
+    if did_win:
+        if timer < 90: grant(1)
+        if shots <= 10: grant(2)
+        if difficulty_id == required_difficulty(3): grant(3)
+        if difficulty_id == required_difficulty(4) and fouls == 0: grant(4)
+        if total_wins == 1: grant(5)
+
+    if total_games == 1: grant(6)
+    return granted
+
+PROCEDURES = {"sp_CheckPlayerAchievements": sp_check_player_achievements}
+
+
+# --- SETUP ---
+
+def create(path):
+    """Creates the schema and lookup rows if they are missing."""
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode = WAL") # readers do not block the writer
+    db.executescript(SCHEMA)
+    db.executescript(REFERENCE_DATA)
+    db.commit()
+    db.close()
+
+
+def seed(path, users=200, games_per_user=15, events_per_game=30,
+         password="benchpass", prefix="bench", admins=2, rng=None):
+    """
+    Fills the stand-in with users named <prefix>0..N-1 (all sharing one
+    password) and some game history. One PBKDF2 hash is reused for every
+    user so seeding stays fast; LOGIN still runs the full 100k iterations.
+    """
+    rng = rng or random.Random(42)
+    salt = os.urandom(16)
+    pw_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100000).hex()
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA foreign_keys = ON")
+    now = datetime.datetime.now().replace(microsecond=0)
+    with db:
+        for i in range(users):
+            role = 'ADMIN' if i < admins else 'PLAYER'
+            cur = db.execute("INSERT OR IGNORE INTO User (Username, PasswordHash, Salt, Role) VALUES (?, ?, ?, ?)",
+                             (f"{prefix}{i}", pw_hash, salt.hex(), role))
+            if not cur.rowcount:
+                continue
+            uid = cur.lastrowid
+            if role == 'ADMIN':
+                db.execute("INSERT INTO Admin (AdminID) VALUES (?)", (uid,))
+                continue
+            db.execute("INSERT INTO Player (PlayerID) VALUES (?)", (uid,))
+            for g in range(games_per_user):
+                started = now - datetime.timedelta(minutes=rng.randint(1, 60 * 24 * 30))
+                sid = db.execute("INSERT INTO GameSession (DifficultyID, StartTime) VALUES (?, ?)",
+                                 (rng.randint(1, 3), started.isoformat(" "))).lastrowid
+                db.execute("INSERT INTO GameParticipant (GameSessionID, PlayerID, Score, IsWinner) VALUES (?, ?, ?, ?)",
+                           (sid, uid, rng.randint(0, 2000), rng.random() < 0.4))
+                db.executemany("INSERT INTO GameEvent (GameSessionID, PlayerID, PocketID, BallPotted, EventType, EventTime) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               [(sid, uid, rng.randint(1, 6), str(rng.randint(1, 8)), rng.choice(("SHOT", "POTTED", "FOUL")),
+                                 (started + datetime.timedelta(seconds=e)).isoformat(" "))
+                                for e in range(events_per_game)])
+        rebuild_stats(db)
+    db.close()
+
+
+def rebuild_stats(db):
+    """Recounts PlayerStats/PlayerDifficultyStats after rows were inserted behind auth.py's back."""
+    db.execute("DELETE FROM PlayerDifficultyStats")
+    db.execute("DELETE FROM PlayerStats")
+    db.execute("""
+        INSERT INTO PlayerStats (PlayerID, GamesPlayed, Wins, TotalPots, TotalFouls, LastPlayed)
+        SELECT p.PlayerID,
+               (SELECT COUNT(*) FROM GameParticipant gp WHERE gp.PlayerID = p.PlayerID),
+               (SELECT COUNT(*) FROM GameParticipant gp WHERE gp.PlayerID = p.PlayerID AND gp.IsWinner = 1),
+               (SELECT COUNT(*) FROM GameEvent ge WHERE ge.PlayerID = p.PlayerID AND ge.EventType = 'POTTED'),
+               (SELECT COUNT(*) FROM GameEvent ge WHERE ge.PlayerID = p.PlayerID AND ge.EventType = 'FOUL'),
+               (SELECT MAX(gs.StartTime) FROM GameParticipant gp
+                JOIN GameSession gs ON gs.GameSessionID = gp.GameSessionID WHERE gp.PlayerID = p.PlayerID)
+        FROM Player p""")
+    db.execute("""
+        INSERT INTO PlayerDifficultyStats (PlayerID, DifficultyID, GamesPlayed, BestScore)
+        SELECT gp.PlayerID, gs.DifficultyID, COUNT(*), MAX(gp.Score)
+        FROM GameParticipant gp JOIN GameSession gs ON gs.GameSessionID = gp.GameSessionID
+        GROUP BY gp.PlayerID, gs.DifficultyID""")
+
+
+def install(path, latency=0.0):
+    """
+    Makes `import mysql.connector` (and therefore auth.py) use the stand-in.
+    Must run before auth is imported.
+    """
+    global DB_PATH, LATENCY
+    DB_PATH = path
+    LATENCY = latency
+    create(path)
+
+    connector = types.ModuleType("mysql.connector")
+    connector.connect = connect
+    connector.Error = Error
+    connector.__all__ = ["connect", "Error"]
+    package = types.ModuleType("mysql")
+    package.__path__ = []
+    package.connector = connector
+    sys.modules["mysql"] = package
+    sys.modules["mysql.connector"] = connector
+    return connector
@@ -0,0 +1,65 @@
+import itertools
+import os
+import secrets
+import sys
+import tempfile
+
+import pytest
+
+# The modules live at the top of the repo, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import standin_db
+
+# auth.py imports mysql.connector, so the stand-in has to be in place
+# before any test module imports it (or anything that imports it). One
+# seeded database serves the whole run; tests make their own players
+# (new_player) when they need to know exactly what is in the DB.
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="pooltests"), "standin.db")
+standin_db.install(DB_PATH)
+standin_db.seed(DB_PATH, users=40, games_per_user=3, events_per_game=4)
+
+import logger
+
+# The log writer thread outlives each test's output capture, so server
+# records go to a file next to the database instead of the terminal
+logger.configure(stream=open(os.path.join(os.path.dirname(DB_PATH), "server.log"), "a"))
+
+_names = itertools.count()
+
+
+def db_connection():
+    """A new auth.* connection, or skip the test when there is no database."""
+    import auth
+    conn = auth.get_db_connection()
+    if conn is None:
+        pytest.skip("database not reachable")
+    return conn
+
+
+@pytest.fixture
+def query():
+    """query(sql, params=()) -> rows, run on its own connection and committed."""
+    def run(sql, params=()):
+        conn = db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall() if cursor.description else cursor.lastrowid
+            conn.commit()
+            return rows
+        finally:
+            cursor.close(); conn.close()
+    return run
+
+
+@pytest.fixture
+def new_player(query):
+    """new_player(name=None, role="PLAYER") -> user id of a fresh user without any games."""
+    def make(name=None, role="PLAYER"):
+        name = name or f"t_{secrets.token_hex(4)}_{next(_names)}"
+        uid = query("INSERT INTO User (Username, PasswordHash, Salt, Role) VALUES (%s, 'x', 'x', %s)",
+                    (name, role))
+        query(f"INSERT INTO {'Admin (AdminID)' if role == 'ADMIN' else 'Player (PlayerID)'} VALUES (%s)", (uid,))
+        return uid
+    return make
@@ -0,0 +1,150 @@
+import os
+import re
+
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which commands.py imports, needs it
+
+import commands
+import leaderboard
+from commands import UnresolvedReference, resolve_refs
+
+NO_SUCH_PLAYER = 999999999
+
+
+def save(pid, score=100, win=True, diff=1):
+    return {"command": "SAVE_SESSION", "payload": {"pid": pid, "diff": diff, "score": score, "win": win}}
+
+
+def events(ref, pid, *types):
+    return {"command": "SAVE_EVENTS",
+            "payload": {"session_id": {"$ref": ref}, "events": [[pid, 1, "3", t] for t in types]}}
+
+
+def check(pid, win=True, timer=30):
+    return {"command": "CHECK_ACHIEVEMENTS",
+            "payload": {"pid": pid, "diff": 1, "timer": timer, "shots": 20, "fouls": 1, "win": win}}
+
+
+def games_of(query, pid):
+    return query("SELECT COUNT(*) FROM GameParticipant WHERE PlayerID = %s", (pid,))[0][0]
+
+
+def stats_of(query, pid):
+    rows = query("SELECT GamesPlayed, Wins, TotalPots, TotalFouls FROM PlayerStats WHERE PlayerID = %s", (pid,))
+    return tuple(rows[0]) if rows else None
+
+
+def events_of(query, sid):
+    return query("SELECT COUNT(*) FROM GameEvent WHERE GameSessionID = %s", (sid,))[0][0]
+
+
+# --- $ref ---
+
+def test_refs_are_replaced_anywhere_in_the_payload():
+    results = [{"status": "success", "session_id": 7, "rows": [{"id": 3}, {"id": 4}]}]
+    payload = {"a": {"$ref": "0.session_id"}, "b": [{"$ref": "0.rows.1.id"}, 5], "c": {"d": {"$ref": "0.rows"}}}
+    assert resolve_refs(payload, results) == {"a": 7, "b": [4, 5], "c": {"d": results[0]["rows"]}}
+
+
+def test_dicts_with_more_than_a_ref_are_left_alone():
+    assert resolve_refs({"$ref": "0.x", "other": 1}, []) == {"$ref": "0.x", "other": 1}
+
+
+@pytest.mark.parametrize("ref, message", [
+    ("x.session_id", "bad reference"),
+    ("1.session_id", "has not run"),
+    ("0.missing", "not found"),
+    ("0.rows.9", "not found"),
+])
+def test_unresolvable_refs(ref, message):
+    with pytest.raises(UnresolvedReference, match=message):
+        resolve_refs({"$ref": ref}, [{"status": "success", "rows": []}])
+
+
+def test_ref_to_a_failed_request():
+    with pytest.raises(UnresolvedReference, match="failed"):
+        resolve_refs({"$ref": "0.session_id"}, [{"status": "error", "session_id": None}])
+
+
+# --- BATCH ---
+
+def test_atomic_batch_commits_everything(query, new_player):
+    pid = new_player()
+    res = commands.dispatch("BATCH", {"requests": [
+        save(pid), events("0.session_id", pid, "POTTED", "FOUL", "SHOT"), check(pid)]})
+    assert res["status"] == "success"
+    assert events_of(query, res["results"][0]["session_id"]) == 3
+    assert games_of(query, pid) == 1
+    assert stats_of(query, pid) == (1, 1, 1, 1)
+    assert {a["AchievementID"] for a in res["results"][2]["data"]} >= {1, 6}
+
+
+def test_atomic_batch_rolls_back_on_failure(query, new_player):
+    pid = new_player()
+    res = commands.dispatch("BATCH", {"requests": [
+        save(pid), events("0.session_id", pid, "POTTED"),
+        save(NO_SUCH_PLAYER), # foreign key error
+        save(pid)]})
+    assert res["status"] == "error" and res["rolled_back"] and res["failed_at"] == 2
+    assert len(res["results"]) == 3 # stopped at the failure
+    assert games_of(query, pid) == 0
+    assert stats_of(query, pid) is None
+    # after_commit work (the leaderboard) never ran
+    assert leaderboard.BOARDS.rank(pid)["rank"] is None
+
+
+def test_failed_achievement_check_rolls_back_the_session(query, new_player):
+    pid = new_player()
+    # Granting "Speed Demon" to a player that does not exist is a DB error
+    # inside sp_CheckPlayerAchievements
+    res = commands.dispatch("BATCH", {"requests": [
+        save(pid), events("0.session_id", pid, "POTTED"), check(NO_SUCH_PLAYER)]})
+    assert res["status"] == "error" and res["failed_at"] == 2
+    sid = res["results"][0]["session_id"]
+    assert games_of(query, pid) == 0
+    assert events_of(query, sid) == 0
+    assert stats_of(query, pid) is None
+    assert query("SELECT COUNT(*) FROM GameSession WHERE GameSessionID = %s", (sid,))[0][0] == 0
+
+
+def test_achievement_procedure_does_not_commit_implicitly():
+    # A batch runs the procedure inside its transaction. TRUNCATE and other
+    # DDL on real tables commit implicitly in MySQL, which would make a
+    # later rollback keep half of the batch.
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "QueriesFileNew.sql")
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    body = re.search(r"CREATE PROCEDURE sp_CheckPlayerAchievements.*?\bBEGIN\b(.*?)END\$\$", sql, re.S).group(1)
+    code = re.sub(r"--[^\n]*", "", body)
+    assert not re.search(r"\b(TRUNCATE|COMMIT|ALTER|RENAME|LOCK\s+TABLES)\b", code, re.I)
+    assert not re.search(r"\b(CREATE|DROP)\s+(?!TEMPORARY)\w+", code, re.I)
+
+
+def test_atomic_batch_stops_at_an_unresolved_ref(query, new_player):
+    pid = new_player()
+    res = commands.dispatch("BATCH", {"requests": [save(pid), events("0.nothing", pid, "SHOT")]})
+    assert res["failed_at"] == 1 and "not found" in res["message"]
+    assert games_of(query, pid) == 0
+
+
+def test_best_effort_batch_keeps_what_worked(query, new_player):
+    pid = new_player()
+    res = commands.dispatch("BATCH", {"mode": "best_effort", "requests": [
+        save(pid), save(NO_SUCH_PLAYER), events("1.session_id", pid, "SHOT"), save(pid, win=False)]})
+    assert res["status"] == "error" and res["failed"] == [1, 2]
+    assert games_of(query, pid) == 2
+    assert stats_of(query, pid)[:2] == (2, 1)
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"requests": []}, "no requests"),
+    ({"requests": [save(1)] * (commands.MAX_BATCH + 1)}, "at most"),
+    ({"requests": [{"command": "BATCH", "payload": {"requests": []}}]}, "cannot be nested"),
+    ({"requests": [{"command": "NOPE", "payload": {}}]}, "unknown command"),
+    ({"requests": ["SAVE_SESSION"]}, "must be an object"),
+    ({"requests": [save(1)], "mode": "sometimes"}, "Unknown batch mode"),
+])
+def test_malformed_batches_are_refused_before_running(payload, message):
+    res = commands.dispatch("BATCH", payload)
+    assert res["status"] == "error" and message in res["message"]
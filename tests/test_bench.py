@@ -0,0 +1,21 @@
+import json
+
+import bench
+
+
+def test_percentile_and_summary():
+    assert bench.percentile([], 0.5) == 0.0
+    assert bench.percentile([1, 2, 3, 4, 5], 0.5) == 3
+    report = bench.summarize([("A", 0.010, True), ("A", 0.030, False), ("B", 0.002, True)], elapsed=2.0)
+    assert report["A"] == {"count": 2, "errors": 1, "rps": 1.0, "p50_ms": 10.0, "p95_ms": 30.0,
+                           "p99_ms": 30.0, "max_ms": 30.0}
+    assert report["B"]["count"] == 1
+
+
+def test_bench_runs_against_a_local_stand_in_server(tmp_path):
+    out = tmp_path / "report.json"
+    bench.main(["--clients", "2", "--iterations", "3", "--duration", "60", "--users", "10",
+                "--mix", "mixed", "--db", str(tmp_path / "bench.db"), "--json", str(out)])
+    report = json.loads(out.read_text())["report"]
+    assert sum(r["count"] for r in report.values()) >= 6
+    assert sum(r["errors"] for r in report.values()) == 0
@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+import bincodec
+import protocol
+from bincodec import CodecError
+
+
+def nested_list(depth):
+    value = []
+    for _ in range(depth - 1):
+        value = [value]
+    return value
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, -1, 127, -128, 128, 2**31 - 1, -2**31, 2**40, 2**70, -2**70, 1.5,
+    "", "hi", "ü" * 300, b"\x00\xff",
+    [], [1, "a", None], {"a": 1, "b": [1, 2, {"c": None}]}, {1: "int key", None: "none key"},
+    datetime.datetime(2026, 10, 17, 12, 30, 5, 1234), datetime.date(2026, 1, 2),
+])
+def test_round_trip(value):
+    assert bincodec.decode(bincodec.encode(value)) == value
+
+
+def test_tuples_and_sets_come_back_as_lists():
+    assert bincodec.decode(bincodec.encode((1, 2))) == [1, 2]
+    assert bincodec.decode(bincodec.encode({3})) == [3]
+
+
+def test_aware_datetime_is_sent_as_utc():
+    aware = datetime.datetime(2026, 1, 1, 12, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+    assert bincodec.decode(bincodec.encode(aware)) == datetime.datetime(2026, 1, 1, 10)
+
+
+def test_nesting_up_to_the_limit_decodes():
+    value = nested_list(bincodec.MAX_DEPTH)
+    assert bincodec.decode(bincodec.encode(value)) == value
+
+
+@pytest.mark.parametrize("data", [
+    b"",                                    # nothing
+    b"\x30\x05ab",                          # string shorter than its length
+    b"\x11\x00\x01",                        # truncated int32
+    b"\x40\x00\x00\x00\x02\x10\x01",        # list shorter than its count
+    b"\x30\x02\xff\xfe",                    # bad UTF-8
+    b"\x50" + bytes(11),                    # datetime with year 0
+    b"\x51\x7f\xff\xff\xff",                # date ordinal out of range
+    b"\x13\x00\x00\x00\x01x",               # big int that is not a number
+    b"\x99",                                # unknown tag
+    b"\x10\x01\x10\x02",                    # trailing bytes
+])
+def test_corrupt_data_raises_codec_error(data):
+    with pytest.raises(CodecError):
+        bincodec.decode(data)
+
+
+@pytest.mark.parametrize("data", [
+    b"\x48\x00\x00\x00\x01\x40\x00\x00\x00\x00\x00", # {[]: None}
+    b"\x48\x00\x00\x00\x01\x48\x00\x00\x00\x00\x00", # {{}: None}
+])
+def test_unhashable_dict_key_raises_codec_error(data):
+    with pytest.raises(CodecError, match="Dict key"):
+        bincodec.decode(data)
+
+
+@pytest.mark.parametrize("item", [b"\x40\x00\x00\x00\x01", b"\x48\x00\x00\x00\x01\x30\x01k"])
+def test_deep_nesting_raises_codec_error(item):
+    # Far deeper than the interpreter's recursion limit
+    with pytest.raises(CodecError, match="Nested deeper"):
+        bincodec.decode(item * 100000 + b"\x00")
+    with pytest.raises(CodecError, match="Nested deeper"):
+        bincodec.decode(bincodec.encode(nested_list(bincodec.MAX_DEPTH + 1)))
+
+
+def test_deep_json_raises_frame_error():
+    with pytest.raises(protocol.FrameError):
+        protocol.decode_body(0, b"[" * 100000)
+
+
+def test_malformed_binary_body_is_a_value_error():
+    # server.parse_request drops frames that raise ValueError or FrameError
+    with pytest.raises(ValueError):
+        protocol.decode_body(protocol.FLAG_BINARY, b"\x48\x00\x00\x00\x01\x40\x00\x00\x00\x00\x00")
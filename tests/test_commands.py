@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which commands.py imports, needs it
+
+import commands
+from commands import ValidationError, compile_schema
+
+
+@pytest.fixture
+def echo():
+    """Registers a throwaway ECHO command for the test."""
+    @commands.command("TEST_ECHO", {"n": int, "name?": str, "score": commands.NUMBER, "flag?": bool})
+    def cmd_echo(p, ctx):
+        return {"status": "success", "payload": p, "ctx": ctx}
+
+    yield cmd_echo
+    del commands.COMMANDS["TEST_ECHO"]
+
+
+def test_valid_payloads_reach_the_handler(echo):
+    res = commands.dispatch("TEST_ECHO", {"n": 1, "score": 2.5}, ctx="conn")
+    assert res == {"status": "success", "payload": {"n": 1, "score": 2.5}, "ctx": "conn"}
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"score": 1}, "missing field 'n'"),
+    ({"n": None, "score": 1}, "missing field 'n'"),
+    ({"n": "1", "score": 1}, "field 'n' must be int, got str"),
+    ({"n": True, "score": 1}, "field 'n' must be int, got bool"),
+    ({"n": 1, "score": "high"}, "field 'score' must be int/float, got str"),
+    ({"n": 1, "score": 1, "name": 5}, "field 'name' must be str, got int"),
+    ({"n": 1, "score": 1, "flag": 1}, "field 'flag' must be bool, got int"),
+    ([1, 2], "payload must be an object"),
+])
+def test_bad_payloads_never_reach_the_handler(echo, payload, message):
+    res = commands.dispatch("TEST_ECHO", payload)
+    assert res == {"status": "error", "message": f"Invalid TEST_ECHO payload: {message}"}
+
+
+def test_optional_fields_may_be_missing_or_null():
+    validate = compile_schema({"a?": int})
+    validate({})
+    validate({"a": None})
+    with pytest.raises(ValidationError):
+        validate({"a": 1.5})
+
+
+def test_unknown_commands():
+    assert commands.dispatch("NOT_A_COMMAND", {}) == {"status": "error", "message": "Unknown command"}
+
+
+def test_commands_cannot_be_registered_twice(echo):
+    with pytest.raises(ValueError, match="registered twice"):
+        commands.command("TEST_ECHO")(lambda p, ctx: None)
+
+
+def test_every_command_is_described():
+    for name, entry in commands.COMMANDS.items():
+        assert entry.name == name
+        assert entry.kind in ("read", "write")
+        assert entry.cost in ("light", "heavy", "kdf")
@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+
+import pytest
+
+import dbpool
+from dbpool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, n):
+        self.n = n
+        self.alive = True
+        self.closed = False
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise OSError("gone away")
+
+    def rollback(self):
+        if not self.alive:
+            raise OSError("gone away")
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self, prepared=False):
+        return FakeCursor()
+
+
+class FakeCursor:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Connector:
+    """connect() for the pool: hands out FakeConnections and remembers them."""
+    def __init__(self):
+        self.made = []
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise OSError("connection refused")
+        conn = FakeConnection(len(self.made))
+        self.made.append(conn)
+        return conn
+
+
+@pytest.fixture
+def connect():
+    return Connector()
+
+
+def test_connections_are_reused(connect):
+    pool = ConnectionPool(connect, max_size=2)
+    first = pool.acquire()
+    n = first.n
+    first.close()
+    again = pool.acquire()
+    assert again.n == n and len(connect.made) == 1
+    assert pool.in_use() == 1 and pool.idle_count() == 0
+    again.close()
+    with pytest.raises(RuntimeError):
+        again.n # returned already
+
+
+def test_a_full_pool_waits_then_times_out(connect):
+    pool = ConnectionPool(connect, max_size=1, timeout=0.1)
+    held = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.1
+    threading.Timer(0.05, held.close).start()
+    pool.timeout = 5
+    assert pool.acquire().n == 0 # the one handed back
+
+
+def test_leftover_transactions_are_rolled_back(connect):
+    pool = ConnectionPool(connect)
+    conn = pool.acquire()
+    connect.made[0].in_transaction = True
+    conn.close()
+    assert connect.made[0].rollbacks == 1
+    pool.acquire().close() # nothing open this time
+    assert connect.made[0].rollbacks == 1
+
+
+def test_dead_idle_connections_are_replaced(connect, monkeypatch):
+    pool = ConnectionPool(connect)
+    pool.acquire().close()
+    connect.made[0].alive = False
+    monkeypatch.setattr(dbpool, "PING_IDLE", -1) # ping on every borrow
+    conn = pool.acquire()
+    assert conn.n == 1 and connect.made[0].closed
+    assert pool.opened == 1
+
+
+def test_a_connection_that_fails_on_return_is_dropped(connect):
+    pool = ConnectionPool(connect)
+    conn = pool.acquire()
+    connect.made[0].in_transaction = True
+    connect.made[0].alive = False # the rollback fails
+    conn.close()
+    assert connect.made[0].closed and pool.opened == 0 and pool.idle_count() == 0
+
+
+def test_old_connections_are_recycled(connect):
+    pool = ConnectionPool(connect, max_lifetime=0)
+    pool.acquire().close()
+    assert connect.made[0].closed and pool.opened == 0
+
+
+def test_failed_connects_free_their_slot(connect):
+    pool = ConnectionPool(connect, max_size=1)
+    connect.fail = True
+    with pytest.raises(OSError):
+        pool.acquire()
+    connect.fail = False
+    assert pool.acquire().n == 0
+
+
+def test_warm_opens_min_size(connect):
+    pool = ConnectionPool(connect, min_size=3)
+    assert pool.warm() == 3 and len(connect.made) == 3
+    assert pool.warm() == 3 and len(connect.made) == 3
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_a_forked_child_starts_empty(connect):
+    pool = ConnectionPool(connect)
+    borrowed = pool.acquire()
+    pool.acquire().close()
+    pid = os.fork()
+    if pid == 0: # child: report through the exit code
+        ok = False
+        try:
+            borrowed.close() # the parent's; must not become idle here
+            conn = pool.acquire()
+            ok = pool.opened == 1 and conn.n == 2 and not connect.made[0].closed
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert pool.opened == 2 and pool.idle_count() == 1 # the parent's pool is untouched
+
+
+def test_auth_treats_a_checkout_timeout_like_a_failed_connect(monkeypatch):
+    auth = pytest.importorskip("auth") # needs mysql.connector
+    monkeypatch.setattr(auth, "POOL", ConnectionPool(Connector(), max_size=0, timeout=0.01))
+    assert auth.get_db_connection() is None
+    assert auth.get_all_achievements_list() == []
+
+
+# --- prepared statement cache ---
+
+def test_statements_are_prepared_once_per_connection(connect):
+    pool = ConnectionPool(connect)
+    conn = pool.acquire()
+    sql, stmt = conn.statement("SELECT 1")
+    assert conn.statement("SELECT 1")[1] is stmt
+    other = pool.acquire() # a second connection prepares its own
+    assert other.statement("SELECT 1")[1] is not stmt
+
+
+def test_least_recently_used_statements_are_evicted(connect):
+    pool = ConnectionPool(connect, max_statements=2)
+    conn = pool.acquire()
+    a = conn.statement("SELECT a")[1]
+    b = conn.statement("SELECT b")[1]
+    conn.statement("SELECT a")
+    conn.statement("SELECT c") # evicts b, the least recently used
+    assert b.closed and not a.closed
+    assert conn.statement("SELECT a")[1] is a
+
+
+def test_a_dropped_connection_takes_its_statements(connect):
+    pool = ConnectionPool(connect, max_lifetime=0)
+    conn = pool.acquire()
+    conn.statement("SELECT 1")
+    entry = conn._entry
+    conn.close() # recycled
+    assert not entry.statements
+
+
+def test_spool_flush_chunks_stay_out_of_the_statement_cache(new_player):
+    auth = pytest.importorskip("auth") # needs mysql.connector
+    pid = new_player()
+    sid = auth.save_game_session(pid, 1, 10, True)
+    spool_id = f"stmt-test:{os.getpid()}"
+    auth.get_spool_checkpoint(spool_id)
+    rows = [(sid, pid, None, None, "SHOT", "2026-01-01 00:00:00")] * 7
+    assert auth.flush_spooled_events(spool_id, rows, 1, chunk=3) # chunks of 3, 3 and 1
+    cached = [sql for entry in auth.POOL.idle for sql in entry.statements]
+    assert cached and not [sql for sql in cached if sql.startswith("INSERT INTO GameEvent")]
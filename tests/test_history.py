@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which commands.py imports, needs it
+
+import auth
+import commands
+import dbpool
+
+
+@pytest.fixture
+def player(new_player):
+    """A player with 23 games; game n has n % 3 + 1 events. Returns (pid, {sid: event count})."""
+    pid = new_player()
+    games = {}
+    for n in range(23):
+        sid = auth.save_game_session(pid, 1, n, n % 2 == 0)
+        auth.save_event_log(sid, [(pid, None, None, "SHOT")] * (n % 3 + 1))
+        games[sid] = n % 3 + 1
+    return pid, games
+
+
+def pages(pid, **payload):
+    res = commands.dispatch("GET_HISTORY", dict(payload, player_id=pid))
+    yield res
+    while "next" in res:
+        res = commands.dispatch("GET_HISTORY", dict(payload, player_id=pid, before=res["next"]))
+        yield res
+
+
+def test_history_pages_cover_every_game_once(player):
+    pid, games = player
+    got = list(pages(pid, limit=10))
+    assert [len(page["data"]) for page in got] == [10, 10, 3]
+    sessions = [game["info"] for page in got for game in page["data"]]
+    order = [(s["StartTime"], s["GameSessionID"]) for s in sessions]
+    assert order == sorted(order, reverse=True) # newest first, across pages too
+    assert {s["GameSessionID"]: 0 for s in sessions}.keys() == games.keys()
+
+
+def test_events_are_grouped_by_game(player):
+    pid, games = player
+    for page in pages(pid):
+        for game in page["data"]:
+            assert len(game["events"]) == games[game["info"]["GameSessionID"]]
+            assert "GameSessionID" not in game["events"][0]
+            assert game["info"]["LevelName"] is not None
+
+
+def test_page_size_is_capped():
+    assert commands.HISTORY_MAX_PAGE == 50
+    res = commands.dispatch("GET_HISTORY", {"player_id": 1, "limit": 10000})
+    assert res["status"] == "success" and len(res["data"]) <= commands.HISTORY_MAX_PAGE
+
+
+def test_a_player_without_games(new_player):
+    assert commands.dispatch("GET_HISTORY", {"player_id": new_player()}) == {"status": "success", "data": []}
+
+
+@pytest.mark.parametrize("before", ["", "2026-01-01", "2026-01-01|x", "|5"])
+def test_bad_cursors_are_refused(before):
+    res = commands.dispatch("GET_HISTORY", {"player_id": 1, "before": before})
+    assert res == {"status": "error", "message": "Invalid history cursor"}
+
+
+def test_every_page_reuses_one_events_statement(player, monkeypatch):
+    pid, _ = player
+    pool = dbpool.ConnectionPool(auth._connect, max_size=1) # every page on one connection
+    monkeypatch.setattr(auth, "POOL", pool)
+    assert len(list(pages(pid, limit=5))) == 5 # the last one is short
+    (entry,) = pool.idle
+    assert len([sql for sql in entry.statements if "FROM GameEvent" in sql]) == 1
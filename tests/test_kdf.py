@@ -0,0 +1,72 @@
+import hashlib
+import threading
+
+import pytest
+
+import commands
+import kdf
+from kdf import KdfBusy, KdfPool
+
+
+def blocked(pool, monkeypatch):
+    """Makes every hash on `pool` wait until the returned event is set."""
+    release = threading.Event()
+    run = pool._run
+    monkeypatch.setattr(pool, "_run", lambda *args: release.wait(5) and run(*args))
+    return release
+
+
+def test_derive_is_pbkdf2():
+    pool = KdfPool(workers=1, max_queue=0)
+    assert pool.derive("pw", b"salt", 1000) == hashlib.pbkdf2_hmac('sha256', b"pw", b"salt", 1000)
+    assert pool.admitted == 0
+
+
+def test_hash_and_verify_round_trip():
+    salt_hex, hash_hex = kdf.hash_password("secret")
+    assert len(bytes.fromhex(salt_hex)) == kdf.SALT_BYTES
+    assert kdf.verify_password("secret", salt_hex, hash_hex)
+    assert not kdf.verify_password("Secret", salt_hex, hash_hex)
+
+
+def test_a_full_pool_refuses_straight_away(monkeypatch):
+    pool = KdfPool(workers=1, max_queue=1)
+    release = blocked(pool, monkeypatch)
+    callers = [threading.Thread(target=pool.derive, args=("pw", b"salt", 1000)) for _ in range(2)]
+    for t in callers:
+        t.start()
+    while pool.admitted < 2:
+        pass
+    assert (pool.running(), pool.queue_depth()) == (1, 1)
+    with pytest.raises(KdfBusy) as busy:
+        pool.derive("pw", b"salt", 1000)
+    assert 0.5 <= busy.value.retry_after <= 10.0
+    release.set()
+    for t in callers:
+        t.join()
+    assert pool.admitted == 0
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes(monkeypatch):
+    monkeypatch.setattr(kdf, "KDF_TIMEOUT", 0.05)
+    pool = KdfPool(workers=1, max_queue=0)
+    release = blocked(pool, monkeypatch)
+
+    with pytest.raises(KdfBusy):
+        pool.derive("pw", b"salt", 1000) # caller gives up, the hash is still running
+    assert pool.admitted == 1
+    with pytest.raises(KdfBusy):
+        pool.derive("pw", b"salt", 1000) # refused straight away: the worker is taken
+    release.set()
+    pool.executor.shutdown(wait=True)
+    assert pool.admitted == 0
+
+
+def test_busy_logins_get_a_retry_hint(monkeypatch, query, new_player):
+    def busy(*args):
+        raise KdfBusy(2.5)
+
+    name = query("SELECT Username FROM User WHERE UserID = %s", (new_player(),))[0][0]
+    monkeypatch.setattr(kdf, "verify_password", busy)
+    res = commands.dispatch("LOGIN", {"username": name, "password": "pw"})
+    assert res["status"] == "error" and res["code"] == "busy" and res["retry_after"] == 2.5
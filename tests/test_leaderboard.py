@@ -0,0 +1,141 @@
+import datetime
+import random
+import time
+
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py needs it
+
+import auth
+import commands
+import leaderboard
+from leaderboard import Board, Leaderboards
+
+
+def expected(best, limit):
+    """Brute-force leaders(): sorted by score, equal scores share the rank of the first."""
+    ordered = sorted(best.values(), reverse=True)
+    return [(ordered.index(score) + 1, score) for score in ordered[:limit]]
+
+
+def test_board_matches_brute_force():
+    rng = random.Random(8)
+    board, best = Board(), {}
+    for _ in range(3000):
+        pid = rng.randrange(300)
+        if rng.random() < 0.05:
+            board.remove(pid)
+            best.pop(pid, None)
+            continue
+        score = rng.choice([rng.randrange(50), rng.randrange(10**6)])
+        assert board.record(pid, score) == (score > best.get(pid, -1))
+        best[pid] = max(best.get(pid, -1), score)
+    assert board.players() == len(best)
+    assert [(rank, score) for rank, _, score in board.leaders(leaderboard.TOP_K)] == expected(best, leaderboard.TOP_K)
+    for pid, score in best.items():
+        higher = sum(1 for s in best.values() if s > score)
+        below = sum(1 for s in best.values() if s < score)
+        assert board.standing(pid) == (higher + 1, score, below)
+    assert board.standing(-1) is None
+
+
+def test_ties_share_a_rank_and_earlier_scores_list_first():
+    board = Board()
+    for pid, score in ((1, 50), (2, 80), (3, 50), (4, 10)):
+        board.record(pid, score)
+    assert board.leaders(10) == [(1, 2, 80), (2, 1, 50), (2, 3, 50), (4, 4, 10)]
+    assert board.standing(3) == (2, 50, 1)
+
+
+def test_removal_refills_the_top_list(monkeypatch):
+    monkeypatch.setattr(leaderboard, "TOP_K", 3)
+    board = Board()
+    for pid in range(6):
+        board.record(pid, pid * 10)
+    board.remove(5)
+    assert [pid for _, pid, _ in board.leaders(3)] == [4, 3, 2]
+    assert board.standing(0) == (5, 0, 0)
+
+
+def test_huge_scores_cost_nothing_extra():
+    boards = Leaderboards()
+    now = datetime.datetime.now()
+    started = time.perf_counter()
+    with boards.lock:
+        boards.apply(1, 1, leaderboard.MAX_SCORE, now, now)
+        boards.apply(2, 1, 2**40, now, now) # clamped
+        boards.apply(3, 1, -5, now, now)
+    assert time.perf_counter() - started < 0.5
+    board = boards.board("all", None)
+    assert board.scores == [0, leaderboard.MAX_SCORE, leaderboard.MAX_SCORE]
+    assert boards.rank(2)["rank"] == 1 and boards.rank(3)["rank"] == 3
+
+
+@pytest.mark.parametrize("score", [-1, leaderboard.MAX_SCORE + 1, 2**63, float("nan"), float("inf")])
+def test_save_session_refuses_out_of_range_scores(score, new_player):
+    res = commands.dispatch("SAVE_SESSION", {"pid": new_player(), "diff": 1, "score": score, "win": True})
+    assert res["status"] == "error" and res["session_id"] is None
+
+
+@pytest.mark.parametrize("score", [0, 12.5, leaderboard.MAX_SCORE])
+def test_save_session_accepts_the_whole_score_range(score, new_player):
+    pid = new_player()
+    res = commands.dispatch("SAVE_SESSION", {"pid": pid, "diff": 1, "score": score, "win": True})
+    assert res["status"] == "success" and leaderboard.BOARDS.rank(pid)["score"] == int(score)
+
+
+def test_windows():
+    wednesday = datetime.datetime(2024, 5, 8, 15, 30)
+    assert leaderboard.period_of("all", wednesday) is None
+    assert leaderboard.period_of("daily", wednesday) == datetime.date(2024, 5, 8)
+    assert leaderboard.period_of("weekly", wednesday) == datetime.date(2024, 5, 6)
+    assert leaderboard.window_start("weekly", wednesday) == datetime.datetime(2024, 5, 6)
+    assert leaderboard.window_start("all", wednesday) is None
+
+
+def test_old_games_only_count_all_time_and_boards_roll_over():
+    boards = Leaderboards()
+    now = datetime.datetime(2024, 5, 8, 23, 0)
+    with boards.lock:
+        boards.apply(1, 2, 40, now - datetime.timedelta(days=1), now) # this week, not today
+        boards.apply(2, 2, 30, now, now)
+        assert boards.board("all", 2, now).players() == 2
+        assert boards.board("weekly", None, now).players() == 2
+        assert boards.board("daily", 2, now).players() == 1
+        tomorrow = now + datetime.timedelta(hours=2)
+        assert boards.board("daily", 2, tomorrow).players() == 0
+        assert boards.board("weekly", 2, tomorrow).players() == 2
+        assert boards.board("weekly", 2, now + datetime.timedelta(days=5)).players() == 0
+
+
+def test_loaded_boards_match_the_database(query):
+    boards = Leaderboards()
+    assert boards.load()
+    rows = query("SELECT gp.PlayerID, gs.DifficultyID, gp.Score, gs.StartTime FROM GameParticipant gp "
+                 "JOIN GameSession gs ON gs.GameSessionID = gp.GameSessionID")
+    now = datetime.datetime.now()
+    for window in leaderboard.WINDOWS:
+        start = leaderboard.window_start(window, now)
+        for diff in (None, 1, 2, 3):
+            best = {}
+            for pid, game_diff, score, started in rows:
+                if (diff is None or game_diff == diff) and (start is None or started >= start):
+                    best[pid] = max(best.get(pid, -1), score)
+            players, leaders = boards.top(window, diff, leaderboard.TOP_K)
+            assert players == len(best)
+            assert [(r["rank"], r["score"]) for r in leaders] == expected(best, leaderboard.TOP_K)
+            for pid, score in list(best.items())[:20]:
+                assert boards.rank(pid, window, diff)["rank"] == 1 + sum(1 for s in best.values() if s > score)
+
+
+def test_committed_games_and_sync_reach_the_boards(new_player):
+    boards = Leaderboards()
+    assert boards.load()
+    pid = new_player()
+    boards.record(pid, 3, 123)
+    assert boards.rank(pid, "daily", 3)["score"] == 123
+    other = new_player()
+    auth.save_game_session(other, 1, 77, False) # saved by "another worker"
+    assert boards.rank(other)["rank"] is None
+    assert boards.sync()
+    assert boards.rank(other, "weekly", 1)["score"] == 77
@@ -0,0 +1,98 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import logger
+from logger import Logger, Sink
+
+
+def written_lines(sink):
+    sink.flush()
+    return sink.stream.getvalue().splitlines()
+
+
+@pytest.fixture
+def sink():
+    return Sink(stream=io.StringIO())
+
+
+def test_records_are_json_lines(sink):
+    Logger(sink, "server").info("connected", addr=("127.0.0.1", 5000), when=object)
+    (line,) = written_lines(sink)
+    record = json.loads(line)
+    assert record["level"] == "info" and record["module"] == "server" and record["msg"] == "connected"
+    assert record["addr"] == ["127.0.0.1", 5000] and record["when"].startswith("<class")
+    assert set(record) >= {"ts", "pid"}
+
+
+def test_text_format(sink):
+    sink.fmt = "text"
+    Logger(sink, "auth").warn("invalid user id", user_id="x")
+    assert written_lines(sink) == ["[WARN] auth: invalid user id user_id=x"]
+
+
+def test_levels_and_module_overrides(sink):
+    sink.level = logger.LEVELS["warn"]
+    sink.modules = {"auth": logger.LEVELS["debug"]}
+    server, auth = Logger(sink, "server"), Logger(sink, "auth")
+    server.info("skipped")
+    server.error("kept")
+    auth.debug("kept too")
+    assert not server.enabled("info") and auth.enabled("debug")
+    assert [json.loads(line)["msg"] for line in written_lines(sink)] == ["kept", "kept too"]
+
+
+def test_parse_module_levels():
+    assert logger.parse_module_levels(["auth=debug", "server=warn"]) == {"auth": "debug", "server": "warn"}
+    for bad in ("auth", "=debug", "auth=loud"):
+        with pytest.raises(ValueError):
+            logger.parse_module_levels([bad])
+
+
+class StuckStream(io.StringIO):
+    """A stdout nobody reads: write() blocks until released."""
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, text):
+        self.released.wait(5)
+        return super().write(text)
+
+
+def test_a_stuck_stream_drops_records_instead_of_blocking():
+    stream = StuckStream()
+    sink = Sink(stream=stream, max_queue=10)
+    log = Logger(sink, "server")
+    start = time.perf_counter()
+    for n in range(100):
+        log.info("request", n=n)
+    assert time.perf_counter() - start < 1.0
+    # The writer holds one batch (at most a full queue) and the queue holds 10 more
+    assert sink.dropped >= 100 - 2 * 10
+    stream.released.set()
+    sink.flush()
+    assert sink.written + sink.dropped == 100
+    assert len(stream.getvalue().splitlines()) == sink.written
+
+
+def test_a_broken_stream_does_not_stop_the_writer(sink):
+    log = Logger(sink, "server")
+    sink.stream = io.StringIO()
+    sink.stream.close()
+    log.info("lost")
+    sink.flush()
+    assert sink.dropped == 1
+    sink.stream = io.StringIO()
+    log.info("kept")
+    assert len(written_lines(sink)) == 1
+
+
+def test_the_child_of_a_fork_starts_with_an_empty_queue(sink):
+    Logger(sink, "server").info("parent")
+    sink.flush()
+    sink.after_fork()
+    assert sink.queue.empty() and sink.thread is None and sink.pid is None
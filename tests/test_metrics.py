@@ -0,0 +1,98 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics
+from metrics import METRICS, Histogram
+
+
+@pytest.fixture
+def server():
+    pytest.importorskip("mysql.connector") # auth.py, which server.py imports, needs it
+    import server
+    return server
+
+
+def test_quantiles_are_interpolated_inside_the_bucket():
+    hist = Histogram(bounds=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0):
+        hist.observe(value)
+    assert hist.count == 4 and hist.sum == 6.5
+    assert hist.quantile(0.25) == 1.0       # all of the first bucket
+    assert hist.quantile(0.5) == 1.5        # halfway through (1, 2]
+    assert 2.0 < hist.quantile(0.99) <= 4.0
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_cumulative_buckets_end_with_inf():
+    hist = Histogram(bounds=(1.0, 2.0))
+    for value in (0.5, 1.5, 9.0):
+        hist.observe(value)
+    assert hist.cumulative() == [(1.0, 1), (2.0, 2), (float('inf'), 3)]
+
+
+def test_db_time_is_per_thread_and_taken_once():
+    metrics.reset_db_time()
+    metrics.add_db_time(0.25)
+    metrics.add_db_time(0.5)
+    assert metrics.take_db_time() == 0.75
+    assert metrics.take_db_time() == 0.0
+
+
+def test_requests_are_recorded_per_command(server, monkeypatch):
+    import commands
+
+    def dispatch(cmd, p, ctx):
+        metrics.add_db_time(0.004) # as auth's timed cursor would
+        return {"status": "error" if p.get("fail") else "success"}
+
+    monkeypatch.setitem(commands.COMMANDS, "TEST_METRICS", commands.COMMANDS["STATS"])
+    monkeypatch.setattr(commands, "dispatch", dispatch)
+    ctx = commands.ClientContext("test")
+    for fail in (False, False, True):
+        server.process_request({"command": "TEST_METRICS", "payload": {"fail": fail}}, ctx, size_in=100)
+    stats = METRICS.command("TEST_METRICS")
+    assert (stats.requests, stats.errors, stats.inflight) == (3, 1, 0)
+    assert stats.db_time.count == 3 and stats.db_time.sum == pytest.approx(0.012)
+    assert stats.bytes_in.sum == 300 and stats.bytes_out.count == 3
+
+    unknown = METRICS.command("UNKNOWN").requests
+    server.process_request({"command": "NO_SUCH_COMMAND_1"}, ctx)
+    server.process_request({"command": "NO_SUCH_COMMAND_2"}, ctx)
+    assert METRICS.command("UNKNOWN").requests == unknown + 2
+    assert "NO_SUCH_COMMAND_1" not in METRICS.commands
+
+
+def test_stats_command_returns_a_snapshot(server):
+    import commands
+    commands.dispatch("NOT_A_COMMAND", {})
+    server.process_request({"command": "STATS"}, commands.ClientContext("test"))
+    res = commands.dispatch("STATS", {})
+    assert res["status"] == "success"
+    snap = res["data"]["commands"]["STATS"]
+    assert snap["requests"] >= 1
+    assert set(snap["latency_ms"]) == {"p50", "p95", "p99"}
+
+
+def test_metrics_listener_serves_prometheus_text():
+    METRICS.command("TEST_LISTENER").end(latency=0.01, db_time=0.0, encode_time=0.0,
+                                         size_in=10, size_out=20, error=False)
+    METRICS.gauge("test_gauge", lambda: 7)
+    METRICS.gauge("test_broken_gauge", lambda: 1 / 0)
+    httpd = metrics.start_listener(port=0)
+    try:
+        url = f"http://127.0.0.1:{httpd.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as res:
+            assert res.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            text = res.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        httpd.shutdown()
+        del METRICS.gauges["test_gauge"], METRICS.gauges["test_broken_gauge"]
+    assert '# TYPE pool_requests_total counter' in text
+    assert 'pool_requests_total{command="TEST_LISTENER"} 1' in text
+    assert 'pool_request_duration_seconds_bucket{command="TEST_LISTENER",le="+Inf"} 1' in text
+    assert "pool_test_gauge 7" in text
+    assert "test_broken_gauge" not in text
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py needs it
+
+import auth
+import playerstats
+
+
+def stats_of(query, pid):
+    rows = query("SELECT GamesPlayed, Wins, TotalPots, TotalFouls FROM PlayerStats WHERE PlayerID = %s", (pid,))
+    return tuple(rows[0]) if rows else None
+
+
+def best_scores(query, pid):
+    return dict(query("SELECT DifficultyID, BestScore FROM PlayerDifficultyStats WHERE PlayerID = %s", (pid,)))
+
+
+def test_games_and_events_update_the_totals(query, new_player):
+    pid = new_player()
+    won = auth.save_game_session(pid, 1, 40, True)
+    auth.save_event_log(won, [(pid, 1, "3", "POTTED"), (pid, 2, "5", "POTTED"), (pid, None, None, "FOUL")])
+    auth.save_game_session(pid, 1, 90, False)
+    auth.save_game_session(pid, 2, 10, False)
+    assert stats_of(query, pid) == (3, 1, 2, 1)
+    assert best_scores(query, pid) == {1: 90, 2: 10}
+
+
+def test_spooled_events_are_counted_too(query, new_player):
+    pid = new_player()
+    sid = auth.save_game_session(pid, 1, 5, False)
+    spool_id = f"stats-test:{pid}"
+    auth.get_spool_checkpoint(spool_id)
+    rows = [(sid, pid, 1, "3", "POTTED", "2026-01-01 00:00:00"), (sid, pid, None, None, "FOUL", "2026-01-01 00:00:00")]
+    assert auth.flush_spooled_events(spool_id, rows, 1)
+    assert auth.flush_spooled_events(spool_id, rows, 1) # replayed: already in, not counted again
+    assert stats_of(query, pid) == (1, 0, 1, 1)
+
+
+def test_verify_finds_drift_and_rebuild_fixes_it(query, new_player):
+    assert auth.rebuild_player_stats() is not None
+    assert playerstats.verify() == []
+    pid = new_player()
+    auth.save_game_session(pid, 1, 40, True)
+    assert playerstats.verify() == []
+    query("UPDATE PlayerStats SET Wins = Wins + 5 WHERE PlayerID = %s", (pid,))
+    (problem,) = playerstats.verify()
+    assert problem == {"PlayerID": pid, "table": "PlayerStats", "column": "Wins", "stored": 6, "actual": 1}
+    with pytest.raises(SystemExit):
+        playerstats.main(["verify"])
+    playerstats.main(["rebuild"])
+    assert playerstats.verify() == []
+
+
+def test_diff_rows_treats_a_missing_row_as_empty():
+    stored = [{"PlayerID": 1, "GamesPlayed": 2, "BestScore": 50}]
+    assert playerstats.diff_rows("T", stored, [], ("PlayerID",), ("GamesPlayed", "BestScore")) == [
+        {"PlayerID": 1, "table": "T", "column": "GamesPlayed", "stored": 2, "actual": 0},
+        {"PlayerID": 1, "table": "T", "column": "BestScore", "stored": 50, "actual": 0}]
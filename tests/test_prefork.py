@@ -0,0 +1,99 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+import prefork
+from network import NetworkClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not prefork.can_prefork(), reason="needs fork() and SO_REUSEPORT")
+
+
+def wait_for(check, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        value = check()
+        if value:
+            return value
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_crashing_workers_back_off():
+    sup = prefork.Supervisor(target=None, workers=2)
+    assert [sup.restart_delay(0, 0.1) for _ in range(8)] == [0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0]
+    assert sup.restart_delay(1, 0.1) == 0.5 # counted per worker
+    assert sup.restart_delay(0, prefork.CRASH_WINDOW) == 0.0 # ran long enough: healthy again
+    assert sup.restart_delay(0, 0.1) == 0.5
+
+
+def test_supervisor_starts_restarts_and_stops_workers(tmp_path):
+    log = tmp_path / "workers.log"
+    script = tmp_path / "supervise.py"
+    script.write_text(textwrap.dedent(f"""
+        import os, sys, time
+        sys.path.insert(0, {ROOT!r})
+        import prefork
+
+        def work(index):
+            with open({str(log)!r}, "a") as f:
+                f.write(f"{{index}} {{os.getpid()}}\\n")
+            while True:
+                time.sleep(1)
+
+        prefork.Supervisor(work, 2).run()
+    """))
+    proc = subprocess.Popen([sys.executable, str(script)], stdout=subprocess.DEVNULL)
+    try:
+        def started():
+            lines = log.read_text().split("\n")[:-1] if log.exists() else []
+            return [tuple(map(int, line.split())) for line in lines]
+        first = wait_for(lambda: len(started()) == 2 and started())
+        assert sorted(index for index, _ in first) == [0, 1]
+
+        crashed_index, crashed_pid = first[0]
+        os.kill(crashed_pid, signal.SIGKILL)
+        restarted = wait_for(lambda: len(started()) == 3 and started()[2])
+        assert restarted[0] == crashed_index and restarted[1] != crashed_pid
+
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=prefork.STOP_TIMEOUT + 5) == 0
+        for _, pid in (first[1], restarted):
+            with pytest.raises(ProcessLookupError):
+                os.kill(pid, 0)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+
+def test_workers_share_the_port(tmp_path):
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "bench.py"), "--serve",
+                             "--db", str(tmp_path / "standin.db"), "--port", str(port),
+                             "--server-workers", "2"], stdout=subprocess.DEVNULL, cwd=ROOT)
+    try:
+        seen = set()
+        def ask():
+            client = NetworkClient(port=port)
+            if client.connected:
+                res = client.send("STATS")
+                client.client.close()
+                seen.add(res["data"]["gauges"]["worker_index"])
+            return seen == {0, 1}
+        wait_for(ask, timeout=20)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=15)
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which commands.py imports, needs it
+
+import commands
+import profiler
+from commands import ClientContext
+from kdf import KdfPool
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+@pytest.fixture
+def busy_thread():
+    """A thread tagged SLOW_COMMAND that keeps running spin() until the test ends."""
+    stop = threading.Event()
+
+    def run():
+        profiler.tag("SLOW_COMMAND")
+        try:
+            spin(stop)
+        finally:
+            profiler.untag()
+
+    thread = threading.Thread(target=run, name="busy")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join(5)
+
+
+def test_tags_belong_to_the_calling_thread():
+    profiler.tag("LOGIN")
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(profiler.current_tag()))
+    thread.start(); thread.join()
+    assert profiler.current_tag() == "LOGIN" and seen == [None]
+    profiler.untag()
+    assert profiler.current_tag() is None
+
+
+def test_stacks_are_rooted_at_the_command(busy_thread):
+    prof = profiler.profile(0.2, interval=0.005)
+    assert prof.samples > 5
+    assert prof.by_tag["SLOW_COMMAND"] > 0 and set(prof.by_tag) == {"SLOW_COMMAND"}
+    stacks = prof.collapsed().splitlines()
+    assert any(line.startswith("SLOW_COMMAND;") and "test_profiler.py:spin " in line for line in stacks)
+
+
+def test_all_threads_adds_untagged_ones_by_name(busy_thread):
+    done = threading.Event()
+    idle = threading.Thread(target=done.wait, args=(5,), name="idle-helper")
+    idle.start()
+    try:
+        prof = profiler.profile(0.1, interval=0.005, all_threads=True)
+    finally:
+        done.set(); idle.join()
+    assert "SLOW_COMMAND" in prof.by_tag and "idle-helper" in prof.by_tag
+    assert "busy" not in prof.by_tag # tagged threads are rooted at their tag only
+
+
+def test_one_profile_at_a_time():
+    with profiler._running:
+        with pytest.raises(profiler.ProfilerBusy):
+            profiler.profile(0.1)
+
+
+def test_signal_dump_writes_a_file(busy_thread, tmp_path):
+    path = profiler.dump(0.1, directory=str(tmp_path))
+    assert os.path.dirname(path) == str(tmp_path) and path.endswith(".folded")
+    with open(path, encoding="utf-8") as f:
+        assert "SLOW_COMMAND;" in f.read()
+
+
+def test_kdf_threads_inherit_the_tag(monkeypatch):
+    seen = []
+    real = hashlib.pbkdf2_hmac
+
+    def pbkdf2(*args):
+        seen.append(profiler.current_tag())
+        return real(*args)
+
+    monkeypatch.setattr(hashlib, "pbkdf2_hmac", pbkdf2)
+    profiler.tag("LOGIN")
+    try:
+        KdfPool(workers=1).derive("pw", b"salt", 1000)
+    finally:
+        profiler.untag()
+    assert seen == ["LOGIN"]
+
+
+def test_profile_command_needs_an_admin(busy_thread):
+    ctx = ClientContext(("127.0.0.1", 0))
+    ctx.role = "PLAYER"
+    assert "admin" in commands.dispatch("PROFILE", {"seconds": 0.1}, ctx)["message"]
+    ctx.role = "ADMIN"
+    res = commands.dispatch("PROFILE", {"seconds": 0.1, "interval_ms": 5}, ctx)
+    assert res["status"] == "success" and res["interval_ms"] == 5
+    assert res["by_command"]["SLOW_COMMAND"] > 0 and "SLOW_COMMAND;" in res["data"]
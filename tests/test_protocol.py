@@ -0,0 +1,143 @@
+import os
+import socket
+import threading
+import zlib
+
+import pytest
+
+import network
+import protocol
+from protocol import FLAG_BINARY, FLAG_ZLIB, LENGTH_MASK, FrameDecoder, FrameError
+
+BIG = LENGTH_MASK + 10 # needs the extended length
+
+
+def frame(obj, codec=protocol.JsonCodec, compress=False):
+    header, body = protocol.encode_message(obj, codec, compress)
+    return header + body
+
+
+def test_header_carries_flags_and_length():
+    raw = protocol.encode_header(1234, FLAG_BINARY)
+    assert len(raw) == protocol.HEADER_SIZE
+    assert protocol.split_header(raw) == (FLAG_BINARY, 1234)
+
+
+def test_header_without_flags_is_a_plain_length_prefix():
+    assert protocol.encode_header(5) == (5).to_bytes(4, "big")
+    assert protocol.encode_frame(b"hello") == b"\x00\x00\x00\x05hello"
+
+
+def test_long_bodies_use_the_extended_length():
+    raw = protocol.encode_header(BIG, FLAG_BINARY)
+    assert len(raw) == protocol.HEADER_SIZE + protocol.EXT_LENGTH.size
+    assert protocol.split_header(raw[:protocol.HEADER_SIZE]) == (FLAG_BINARY, LENGTH_MASK)
+    assert protocol.EXT_LENGTH.unpack(raw[protocol.HEADER_SIZE:]) == (BIG,)
+    # The all-ones length itself is extended too, so it never means "short"
+    assert len(protocol.encode_header(LENGTH_MASK)) == 8
+    assert len(protocol.encode_header(LENGTH_MASK - 1)) == 4
+
+
+def test_bodies_the_extended_length_cannot_describe_are_refused():
+    with pytest.raises(FrameError):
+        protocol.encode_header(protocol.MAX_BODY_SIZE + 1)
+
+
+def test_decoder_handles_split_and_coalesced_frames():
+    rows = ["same text again"] * 500
+    data = frame({"id": 1}) + frame({"id": 2}, protocol.BinaryCodec) + frame({"id": 3, "rows": rows}, compress=True)
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(0, len(data), 3): # three bytes per recv
+        frames += decoder.feed(data[i:i + 3])
+    assert [protocol.decode_body(flags, body)["id"] for flags, body in frames] == [1, 2, 3]
+    assert [flags for flags, _ in frames] == [0, FLAG_BINARY, FLAG_ZLIB]
+    assert decoder.pending() == 0
+
+
+def test_decoder_reads_extended_frames():
+    body = b"x" * BIG
+    data = protocol.encode_frame(body, FLAG_BINARY) + protocol.encode_frame(b"next")
+    decoder = FrameDecoder(max_frame_size=BIG)
+    assert decoder.feed(data[:6]) == [] # header and half the extended length
+    frames = []
+    for i in range(6, len(data), 1 << 20):
+        frames += decoder.feed(data[i:i + (1 << 20)])
+    assert frames == [(FLAG_BINARY, body), (0, b"next")]
+
+
+def test_decoder_keeps_a_partial_frame():
+    data = frame({"command": "PING"})
+    decoder = FrameDecoder()
+    assert decoder.feed(data[:-1]) == []
+    assert decoder.pending() == len(data) - 1
+    assert len(decoder.feed(data[-1:])) == 1
+
+
+def test_decoder_refuses_oversized_frames_from_the_header():
+    decoder = FrameDecoder(max_frame_size=100)
+    with pytest.raises(FrameError):
+        decoder.feed(protocol.encode_header(101) + b"x")
+    with pytest.raises(FrameError):
+        FrameDecoder().feed(protocol.encode_header(protocol.MAX_FRAME_SIZE + 1))
+
+
+def test_client_reads_extended_replies():
+    client = network.NetworkClient(port=1, codecs=()) # nothing listens there
+    client.client, server_end = socket.socketpair()
+    body = b'"' + b"x" * BIG + b'"'
+    sender = threading.Thread(target=server_end.sendall, args=(protocol.encode_frame(body),))
+    sender.start()
+    flags, message = client.recv_frame()
+    assert flags == 0 and len(message) == BIG
+    sender.join()
+    client.client.close(); server_end.close()
+
+
+def test_choose_codec_takes_the_first_known_one():
+    assert protocol.choose_codec(["msgpack", "binary", "json"]) is protocol.BinaryCodec
+    assert protocol.choose_codec(["msgpack"]) is protocol.DEFAULT_CODEC
+    assert protocol.choose_codec(None) is protocol.JsonCodec
+
+
+def test_large_bodies_are_compressed_and_flagged():
+    obj = {"rows": ["same text again"] * 500}
+    for codec in (protocol.JsonCodec, protocol.BinaryCodec):
+        header, body = protocol.encode_message(obj, codec, compress=True)
+        flags, length = protocol.split_header(header)
+        assert flags == codec.flags | FLAG_ZLIB and length == len(body)
+        assert len(body) < len(codec.encode(obj)) // 10
+        assert protocol.decode_body(flags, body) == obj
+
+
+def test_only_large_compressible_bodies_are_compressed():
+    small_flags, _ = protocol.split_header(protocol.encode_message({"a": 1}, compress=True)[0])
+    assert not small_flags & FLAG_ZLIB
+    noise = {"b": os.urandom(4096)}
+    noise_flags, _ = protocol.split_header(protocol.encode_message(noise, protocol.BinaryCodec, True)[0])
+    assert not noise_flags & FLAG_ZLIB
+    plain_flags, _ = protocol.split_header(protocol.encode_message({"rows": "a" * 5000})[0])
+    assert not plain_flags & FLAG_ZLIB # not negotiated
+
+
+def test_bodies_the_receiver_would_not_inflate_are_sent_plain(monkeypatch):
+    monkeypatch.setattr(protocol, "MAX_INFLATED_SIZE", 2000)
+    flags, _ = protocol.split_header(protocol.encode_message({"rows": "a" * 5000}, compress=True)[0])
+    assert not flags & FLAG_ZLIB
+
+
+def test_zlib_bomb_is_refused():
+    body = zlib.compress(b"[" + b"0," * (protocol.MAX_INFLATED_SIZE // 2) + b"0]")
+    with pytest.raises(FrameError, match="inflates past"):
+        protocol.decode_body(FLAG_ZLIB, body)
+
+
+def test_bad_zlib_data_is_a_frame_error():
+    with pytest.raises(FrameError, match="Bad compressed frame"):
+        protocol.decode_body(FLAG_ZLIB, b"not zlib")
+
+
+def test_choose_compression():
+    assert protocol.choose_compression(["lz4", "zlib"]) == "zlib"
+    assert protocol.choose_compression(["lz4"]) is None
+    assert protocol.choose_compression(None) is None
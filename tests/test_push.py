@@ -0,0 +1,107 @@
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which commands.py imports, needs it
+
+import commands
+import protocol
+import push
+from commands import ClientContext
+from metrics import METRICS
+from push import Broker
+
+
+def client(user_id=None, accept=True):
+    """A ClientContext whose pushes land in ctx.received."""
+    ctx = ClientContext(("127.0.0.1", 0))
+    ctx.user_id = user_id
+    ctx.received = []
+
+    def take(frame):
+        header, body = frame
+        flags, _ = protocol.split_header(header)
+        assert flags & protocol.FLAG_PUSH
+        ctx.received.append(protocol.decode_body(flags, body))
+        return accept
+    ctx.push = take if accept else (lambda frame: False)
+    return ctx
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    fresh = Broker()
+    monkeypatch.setattr(push, "BROKER", fresh)
+    return fresh
+
+
+def test_only_subscribers_get_topic_events(broker):
+    a, b = client(), client()
+    broker.subscribe(a, ["leaderboard"])
+    broker.publish("leaderboard", "score", {"score": 5})
+    assert a.received == [{"event": "score", "data": {"score": 5}}] and b.received == []
+    broker.unsubscribe(a)
+    broker.publish("leaderboard", "score", {"score": 6})
+    assert len(a.received) == 1 and broker.count() == 0
+
+
+def test_user_events_follow_whoever_is_logged_in(broker):
+    ctx = client(user_id=1)
+    broker.subscribe(ctx, ["user"])
+    broker.publish_user(2, "banned", {})
+    ctx.user_id = 2 # same connection, different login
+    broker.publish_user(2, "banned", {})
+    assert ctx.received == [{"event": "banned", "data": {}}]
+
+
+def test_full_connections_miss_the_push(broker):
+    before = METRICS.counters.get("push_dropped", 0)
+    broker.subscribe(client(accept=False), ["leaderboard"])
+    broker.publish("leaderboard", "score", {})
+    assert METRICS.counters.get("push_dropped", 0) == before + 1
+
+
+@pytest.mark.parametrize("topics, logged_in, message", [
+    (["weather"], True, "Unknown topics"),
+    (["user"], False, "Log in"),
+])
+def test_subscribe_is_refused(broker, topics, logged_in, message):
+    ctx = client(user_id=1 if logged_in else None)
+    res = commands.dispatch("SUBSCRIBE", {"topics": topics}, ctx)
+    assert res["status"] == "error" and message in res["message"]
+
+
+def test_subscribe_needs_a_push_capable_connection(broker):
+    assert "not available" in commands.dispatch("SUBSCRIBE", {"topics": ["leaderboard"]})["message"]
+
+
+def test_logout_stops_user_events(broker):
+    ctx = client(user_id=1)
+    assert commands.dispatch("SUBSCRIBE", {"topics": ["user", "leaderboard"]}, ctx)["topics"] == ["user", "leaderboard"]
+    commands.dispatch("LOGOUT", {}, ctx)
+    assert broker.subscriptions(ctx) == ["leaderboard"]
+
+
+def test_a_rolled_back_batch_pushes_nothing(broker, new_player):
+    pid = new_player()
+    ctx = client()
+    broker.subscribe(ctx, ["leaderboard"])
+    save = {"command": "SAVE_SESSION", "payload": {"pid": pid, "diff": 1, "score": 10, "win": True}}
+    bad = {"command": "SAVE_SESSION", "payload": {"pid": 999999999, "diff": 1, "score": 10, "win": True}}
+    assert commands.dispatch("BATCH", {"requests": [save, bad]})["rolled_back"]
+    assert ctx.received == []
+    assert commands.dispatch("BATCH", {"requests": [save]})["status"] == "success"
+    assert [m["data"]["player_id"] for m in ctx.received] == [pid]
+
+
+@pytest.mark.parametrize("in_batch", [False, True])
+def test_a_failing_after_commit_keeps_the_reply(new_player, monkeypatch, in_batch):
+    def broken(topic, event, data):
+        raise RuntimeError("subscriber went away")
+
+    monkeypatch.setattr(push.BROKER, "publish", broken)
+    save = {"pid": new_player(), "diff": 1, "score": 10, "win": True}
+    if in_batch:
+        res = commands.dispatch("BATCH", {"requests": [{"command": "SAVE_SESSION", "payload": save}]})
+        res = res["results"][0]
+    else:
+        res = commands.dispatch("SAVE_SESSION", save)
+    assert res["status"] == "success" and res["session_id"]
@@ -0,0 +1,94 @@
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py needs it
+
+import auth
+import commands
+import refcache
+from network import NetworkClient
+from refcache import ReferenceCache
+
+
+def tables(*levels):
+    return {"achievements": [{"AchievementID": 1, "Name": "First Pot", "Description": "Pot a ball"}],
+            "difficulties": [{"DifficultyID": i, "LevelName": name} for i, name in enumerate(levels, 1)],
+            "pockets": [{"PocketID": 1, "PocketName": "Top Left"}]}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """The reference tables the cache will read; edit db["now"] to change them."""
+    state = {"now": tables("Easy", "Hard"), "reads": 0}
+
+    def read():
+        state["reads"] += 1
+        return state["now"]
+
+    monkeypatch.setattr(auth, "get_reference_tables", read)
+    monkeypatch.setattr(refcache, "CACHE", ReferenceCache())
+    return state
+
+
+def test_same_contents_give_the_same_version(db):
+    one, two = ReferenceCache(), ReferenceCache()
+    assert one.load() and two.load()
+    assert one.version == two.version
+    db["now"] = tables("Easy", "Medium")
+    one.load()
+    assert one.version != two.version
+
+
+def test_tables_are_read_once_per_refresh_interval(db, monkeypatch):
+    cache = refcache.CACHE
+    version, _ = cache.current()
+    cache.current()
+    assert db["reads"] == 1
+    monkeypatch.setattr(refcache, "REFRESH_INTERVAL", -1)
+    assert cache.current()[0] == version and db["reads"] == 2
+
+
+def test_a_failed_reload_keeps_the_old_copy(db):
+    cache = refcache.CACHE
+    cache.load()
+    version = cache.version
+    db["now"] = None
+    assert not cache.load()
+    assert cache.version == version and cache.tables["difficulties"][1]["LevelName"] == "Hard"
+
+
+def test_catalog_is_not_resent_to_a_client_that_has_it(db):
+    res = commands.dispatch("GET_ALL_ACHIEVEMENTS", {})
+    assert res["data"][0]["Name"] == "First Pot"
+    again = commands.dispatch("GET_ALL_ACHIEVEMENTS", {"version": res["version"]})
+    assert again == {"status": "success", "not_modified": True, "version": res["version"]}
+    full = commands.dispatch("GET_REFERENCE_DATA", {"version": "stale"})
+    assert full["data"]["pockets"] == [{"PocketID": 1, "PocketName": "Top Left"}]
+    assert full["version"] == res["version"]
+
+
+def test_level_names_come_from_the_cache(db):
+    rows = refcache.add_level_names([{"DifficultyID": 2}, {"Score": 5}])
+    assert rows == [{"DifficultyID": 2, "LevelName": "Hard"}, {"Score": 5}]
+    db["now"] = tables("Easy", "Hard", "Expert")
+    # An ID the cache has not seen reloads it straight away
+    assert refcache.add_level_names([{"DifficultyID": 3}])[0]["LevelName"] == "Expert"
+    assert db["reads"] == 2
+
+
+def test_history_and_high_scores_carry_level_names(new_player):
+    pid = new_player()
+    auth.save_game_session(pid, 1, 50, True)
+    names = {row["DifficultyID"]: row["LevelName"] for row in auth.get_reference_tables()["difficulties"]}
+    high = commands.dispatch("GET_PLAYER_HIGH_SCORES", {"player_id": pid})["data"]
+    history = commands.dispatch("GET_HISTORY", {"player_id": pid})["data"]
+    assert high[0]["LevelName"] == history[0]["info"]["LevelName"] == names[1]
+
+
+def test_client_fills_in_not_modified_replies():
+    client = NetworkClient.__new__(NetworkClient) # no connection needed
+    client.ref_cache = {}
+    assert client.versioned("GET_ALL_ACHIEVEMENTS") == {}
+    client.unwrap("GET_ALL_ACHIEVEMENTS", {"status": "success", "version": "v1", "data": [1, 2]})
+    assert client.versioned("GET_ALL_ACHIEVEMENTS", {"x": 1}) == {"x": 1, "version": "v1"}
+    res = client.unwrap("GET_ALL_ACHIEVEMENTS", {"status": "success", "not_modified": True, "version": "v1"})
+    assert res["data"] == [1, 2]
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which commands.py imports, needs it
+
+import commands
+import protocol
+import server
+from commands import ClientContext
+from scheduler import Scheduler
+
+
+def make(interactive=(2, 4), auth=(1, 2), bulk=(1, 2)):
+    return Scheduler({"interactive": interactive, "auth": auth, "bulk": bulk})
+
+
+def fill(sched, name, count):
+    return [sched.admit(name) for _ in range(count)]
+
+
+def test_class_is_shed_when_its_queue_is_full():
+    sched = make()
+    admitted = fill(sched, "bulk", 3)
+    assert all(pc is not None for pc in admitted)
+    assert sched.admit("bulk") is None
+    assert sched.pending() == 3
+
+
+def test_release_makes_room_again():
+    sched = make()
+    admitted = fill(sched, "bulk", 3)
+    sched.release(admitted[0])
+    assert sched.admit("bulk") is not None
+
+
+def test_backed_up_interactive_sheds_less_important_classes():
+    sched = make()
+    fill(sched, "interactive", 2 + 2) # workers busy, queue at SHED_PRESSURE
+    assert sched.admit("auth") is not None
+    assert sched.admit("interactive") is not None # queue now past SHED_PRESSURE
+    assert sched.admit("auth") is None
+    assert sched.admit("bulk") is None
+    assert sched.admit("interactive") is not None # still room in its own queue
+
+
+def test_bulk_backlog_never_sheds_interactive():
+    sched = make()
+    fill(sched, "bulk", 3)
+    fill(sched, "auth", 3)
+    assert all(pc is not None for pc in fill(sched, "interactive", 6))
+    assert sched.admit("interactive") is None
+
+
+def test_batch_takes_the_least_urgent_class_of_its_commands():
+    batch = {"requests": [{"command": "SAVE_SESSION"}, {"command": "GET_ALL_USERS"}]}
+    assert commands.priority_of("SAVE_SESSION") == "interactive"
+    assert commands.priority_of("LOGIN") == "auth"
+    assert commands.priority_of("BATCH", batch) == "bulk"
+    assert commands.priority_of("BATCH", {"requests": [{"command": "SAVE_SESSION"}]}) == "interactive"
+    assert commands.priority_of("NOT_A_COMMAND") == "interactive"
+
+
+def test_a_shed_request_gets_a_busy_reply_without_running(monkeypatch):
+    ran = []
+    monkeypatch.setattr(commands, "dispatch", lambda cmd, p, ctx: ran.append(cmd))
+    header, body = server.process_request({"command": "GET_HISTORY", "payload": {}, "id": 4},
+                                          ClientContext(("127.0.0.1", 0)), 0, time.perf_counter(), shed="bulk")
+    reply = protocol.decode_body(0, body)
+    assert reply["code"] == "busy" and reply["retry_after"] == 5.0 and reply["id"] == 4
+    assert ran == []
+
+
+def test_thread_mode_waits_for_a_worker_of_its_class(monkeypatch):
+    running, peak, lock = 0, 0, threading.Lock()
+
+    def slow(cmd, p, ctx):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return {"status": "success"}
+
+    monkeypatch.setattr(commands, "dispatch", slow)
+    sched = server.make_scheduler(bulk_workers=2, bulk_queue=1)
+    replies = []
+
+    def client():
+        _, body = server.run_scheduled(sched, {"command": "GET_ALL_USERS", "payload": {}},
+                                       ClientContext(("127.0.0.1", 0)), 0, time.perf_counter())
+        replies.append(protocol.decode_body(0, body)["status"])
+
+    threads = [threading.Thread(target=client) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak == 2
+    assert sorted(replies) == ["error"] * 2 + ["success"] * 3 # 2 running + 1 waiting, 2 shed
+    assert sched.pending() == 0
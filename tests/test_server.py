@@ -0,0 +1,390 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which server.py imports, needs it
+
+import commands
+import protocol
+import server
+from commands import ClientContext
+from network import NetworkClient
+from protocol import FLAG_BINARY, FLAG_ZLIB
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def connect(port):
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            return socket.create_connection(("127.0.0.1", port), timeout=5)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def run_loop(loop, task):
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+    # Connection handlers are separate tasks, stop them too
+    pending = asyncio.all_tasks(loop)
+    for other in pending:
+        other.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    loop.close()
+
+
+POLICY_OPTIONS = ("max_connections", "max_per_ip", "idle_timeout", "read_timeout",
+                  "write_timeout", "max_send_buffer")
+
+
+@pytest.fixture
+def serve():
+    """
+    serve(**options) starts an AsyncServer on a background event loop and
+    returns it. ConnectionPolicy options go to the policy, the rest to the server.
+    """
+    running = []
+
+    def start(**options):
+        limits = {k: options.pop(k) for k in list(options) if k in POLICY_OPTIONS}
+        srv = server.AsyncServer("127.0.0.1", free_port(), policy=server.ConnectionPolicy(**limits), **options)
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(srv.serve())
+        thread = threading.Thread(target=run_loop, args=(loop, task), daemon=True)
+        thread.start()
+        running.append((loop, task, thread))
+        with connect(srv.port) as probe: # listening and answering
+            send(probe, {"command": "NOT_A_COMMAND"})
+            reply(probe)
+        wait_until(lambda: srv.policy.open == 0)
+        return srv
+
+    yield start
+    for loop, task, thread in running:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(5)
+
+
+def wait_until(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def send(sock, request):
+    sock.sendall(protocol.encode_frame(json.dumps(request).encode('utf-8')))
+
+
+def recv_exactly(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def reply(sock):
+    """The next reply, or None once the server has closed the connection."""
+    try:
+        header = recv_exactly(sock, protocol.HEADER_SIZE)
+    except ConnectionResetError:
+        return None
+    if header is None:
+        return None
+    flags, length = protocol.split_header(header)
+    if length == protocol.LENGTH_MASK:
+        (length,) = protocol.EXT_LENGTH.unpack(recv_exactly(sock, protocol.EXT_LENGTH.size))
+    return protocol.decode_body(flags, recv_exactly(sock, length))
+
+
+def test_async_server_answers_requests(serve):
+    port = serve().port
+    with connect(port) as a, connect(port) as b:
+        send(a, {"command": "NOT_A_COMMAND", "payload": {}})
+        send(b, {"command": "NOT_A_COMMAND", "payload": {}})
+        assert reply(a) == reply(b) == {"status": "error", "message": "Unknown command"}
+
+
+def test_blocking_calls_run_on_a_bounded_pool(serve, monkeypatch):
+    running, peak, lock = 0, 0, threading.Lock()
+
+    def slow_dispatch(cmd, p, ctx):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return {"status": "success", "n": p["n"]}
+
+    monkeypatch.setattr(commands, "dispatch", slow_dispatch)
+    port = serve(db_workers=2).port
+    clients = [connect(port) for _ in range(6)]
+    for n, sock in enumerate(clients):
+        send(sock, {"command": "SLOW", "payload": {"n": n}})
+    assert [reply(sock)["n"] for sock in clients] == list(range(6))
+    assert peak == 2
+    for sock in clients:
+        sock.close()
+
+
+def test_connections_over_the_cap_are_closed(serve):
+    srv = serve(max_connections=1)
+    with connect(srv.port) as first:
+        send(first, {"command": "NOT_A_COMMAND"})
+        assert reply(first)["status"] == "error"
+        with connect(srv.port) as second:
+            assert reply(second) is None
+    wait_until(lambda: srv.policy.open == 0)
+
+
+def test_requests_split_across_reads_are_reassembled(serve):
+    port = serve().port
+    frame = protocol.encode_frame(json.dumps({"command": "NOT_A_COMMAND"}).encode('utf-8'))
+    with connect(port) as sock:
+        for i in range(len(frame)):
+            sock.sendall(frame[i:i + 1])
+            time.sleep(0.001)
+        assert reply(sock)["message"] == "Unknown command"
+
+
+def test_a_bad_frame_body_is_skipped(serve):
+    port = serve().port
+    with connect(port) as sock:
+        sock.sendall(protocol.encode_frame(b"{not json") + protocol.encode_frame(b"[1, 2]"))
+        send(sock, {"command": "NOT_A_COMMAND"})
+        assert reply(sock)["message"] == "Unknown command"
+
+
+def test_oversized_frames_close_the_connection(serve):
+    port = serve().port
+    with connect(port) as sock:
+        sock.sendall(protocol.encode_header(protocol.MAX_FRAME_SIZE + 1))
+        assert reply(sock) is None
+
+
+def test_tagged_requests_are_answered_as_they_finish(serve, monkeypatch):
+    def dispatch(cmd, p, ctx):
+        time.sleep(p["delay"])
+        return {"status": "success"}
+
+    monkeypatch.setattr(commands, "dispatch", dispatch)
+    port = serve().port
+    with connect(port) as sock:
+        send(sock, {"id": "slow", "command": "X", "payload": {"delay": 0.3}})
+        send(sock, {"id": 7, "command": "X", "payload": {"delay": 0}})
+        assert [reply(sock)["id"], reply(sock)["id"]] == [7, "slow"]
+
+
+def test_untagged_requests_are_answered_in_order(serve, monkeypatch):
+    def dispatch(cmd, p, ctx):
+        time.sleep(p["delay"])
+        return {"status": "success", "n": p["n"]}
+
+    monkeypatch.setattr(commands, "dispatch", dispatch)
+    port = serve().port
+    with connect(port) as sock:
+        send(sock, {"command": "X", "payload": {"n": 0, "delay": 0.2}})
+        send(sock, {"command": "X", "payload": {"n": 1, "delay": 0}})
+        first, second = reply(sock), reply(sock)
+        assert (first["n"], second["n"]) == (0, 1)
+        assert "id" not in first
+
+
+def test_hello_switches_the_reply_codec(serve):
+    port = serve().port
+    with connect(port) as sock:
+        send(sock, {"command": "HELLO", "payload": {"codecs": ["msgpack", "binary"]}})
+        assert reply(sock)["codec"] == "binary"
+        send(sock, {"command": "NOT_A_COMMAND"})
+        flags, _ = protocol.split_header(recv_exactly(sock, protocol.HEADER_SIZE))
+        assert flags & FLAG_BINARY
+
+
+def test_parse_request_accepts_both_codecs():
+    request = {"command": "PING", "payload": {}, "id": 4}
+    for codec in (protocol.JsonCodec, protocol.BinaryCodec):
+        header, body = protocol.encode_message(request, codec)
+        assert server.parse_request(protocol.split_header(header)[0], body, "test") == request
+
+
+@pytest.mark.parametrize("flags, body", [
+    (0, b"{not json"),
+    (0, b"[1, 2]"),                                         # not an object
+    (0, b"[" * 100000),                                     # deeper than the recursion limit
+    (FLAG_BINARY, b"\x48\x00\x00\x00\x01\x40\x00\x00\x00\x00\x00"), # list as a dict key
+    (FLAG_BINARY, b"\x48\x00\x00\x00\x01\x48\x00\x00\x00\x00\x00"), # dict as a dict key
+    (FLAG_BINARY, b"\x40\x00\x00\x00\x01" * 100000 + b"\x00"),     # deep binary nesting
+    (FLAG_BINARY, b"\x30\x09short"),
+    (FLAG_ZLIB, b"not zlib"),
+])
+def test_parse_request_drops_malformed_frames(flags, body):
+    assert server.parse_request(flags, body, "test") is None
+
+
+def test_replies_too_large_to_frame_get_a_clear_error(monkeypatch):
+    monkeypatch.setattr(commands, "dispatch", lambda cmd, p, ctx: {"status": "success", "data": "x" * p["n"]})
+    monkeypatch.setattr(protocol, "MAX_BODY_SIZE", protocol.LENGTH_MASK)
+    ctx = ClientContext("test")
+    header, body = server.process_request({"command": "BIG", "payload": {"n": 100}, "id": 3}, ctx)
+    assert protocol.decode_body(0, body)["data"] == "x" * 100
+    header, body = server.process_request({"command": "BIG", "payload": {"n": protocol.LENGTH_MASK}, "id": 3}, ctx)
+    res = protocol.decode_body(protocol.split_header(header)[0], body)
+    assert res["status"] == "error" and res["message"].startswith("Reply too large") and res["id"] == 3
+
+
+def test_zlib_is_negotiated_per_connection(serve, monkeypatch):
+    real_dispatch = commands.dispatch
+    seen = []
+
+    def dispatch(cmd, p, ctx):
+        if cmd == "HELLO":
+            return real_dispatch(cmd, p, ctx)
+        seen.append(p)
+        return {"status": "success", "rows": ["same text again"] * p["n"]}
+
+    monkeypatch.setattr(commands, "dispatch", dispatch)
+    port = serve().port
+    client = NetworkClient(port=port) # asks for binary + zlib
+    assert client.compress and client.codec is protocol.BinaryCodec
+    events = [[1, 1, "3", "POTTED"]] * 500 # compressed on the way in
+    assert client.send("ROWS", {"n": 500, "events": events})["rows"] == ["same text again"] * 500
+    assert seen[-1]["events"] == events
+    client.client.close()
+
+    with connect(port) as sock: # this one never sent HELLO
+        send(sock, {"command": "ROWS", "payload": {"n": 500}})
+        flags, _ = protocol.split_header(recv_exactly(sock, protocol.HEADER_SIZE))
+        assert flags == 0
+
+
+def counted(name):
+    return server.METRICS.counters.get(name, 0)
+
+
+def test_policy_caps_connections_per_address():
+    policy = server.ConnectionPolicy(max_connections=3, max_per_ip=2)
+    before = counted("connections_rejected_per_ip")
+    assert policy.admit(("10.0.0.1", 1)) is None
+    assert policy.admit(("10.0.0.1", 2)) is None
+    assert policy.admit(("10.0.0.1", 3)) == "per_ip"
+    assert policy.admit(("10.0.0.2", 1)) is None
+    assert policy.admit(("10.0.0.3", 1)) == "global"
+    assert counted("connections_rejected_per_ip") == before + 1
+    policy.release(("10.0.0.1", 1))
+    assert policy.admit(("10.0.0.1", 4)) is None
+    for port in (2, 4):
+        policy.release(("10.0.0.1", port))
+    policy.release(("10.0.0.2", 1))
+    assert policy.open == 0 and policy.per_ip == {}
+
+
+def test_connections_over_the_per_ip_cap_are_closed(serve):
+    srv = serve(max_per_ip=1)
+    with connect(srv.port) as first, connect(srv.port) as second:
+        send(first, {"command": "NOT_A_COMMAND"})
+        assert reply(first)["status"] == "error"
+        assert reply(second) is None
+
+
+def test_idle_connections_are_closed(serve):
+    srv = serve(idle_timeout=0.2)
+    before = counted("idle_timeouts")
+    with connect(srv.port) as sock:
+        assert reply(sock) is None
+    assert counted("idle_timeouts") == before + 1
+
+
+def test_waiting_on_a_tagged_request_is_not_idle(serve, monkeypatch):
+    def slow_dispatch(cmd, p, ctx):
+        time.sleep(0.5)
+        return {"status": "success"}
+
+    monkeypatch.setattr(commands, "dispatch", slow_dispatch)
+    srv = serve(idle_timeout=0.2)
+    with connect(srv.port) as sock:
+        send(sock, {"command": "SLOW", "id": 1})
+        assert reply(sock) == {"status": "success", "id": 1}
+
+
+def test_a_frame_trickled_too_slowly_is_dropped(serve):
+    srv = serve(idle_timeout=5, read_timeout=0.2)
+    before = counted("read_timeouts")
+    frame = protocol.encode_frame(json.dumps({"command": "NOT_A_COMMAND"}).encode('utf-8'))
+    with connect(srv.port) as sock:
+        sock.sendall(frame[:3]) # a partial header
+        assert reply(sock) is None
+    assert counted("read_timeouts") == before + 1
+
+
+def test_clients_that_do_not_read_are_dropped(serve, monkeypatch):
+    monkeypatch.setattr(commands, "dispatch", lambda cmd, p, ctx: {"status": "success", "data": "x" * (8 << 20)})
+    srv = serve(max_send_buffer=64 * 1024, write_timeout=0.2)
+    before = counted("slow_consumer_disconnects")
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect(("127.0.0.1", srv.port))
+    with sock:
+        send(sock, {"command": "BIG"})
+        wait_until(lambda: counted("slow_consumer_disconnects") == before + 1)
+    wait_until(lambda: srv.policy.open == 0)
+
+
+def test_thread_mode_applies_the_policy():
+    policy = server.ConnectionPolicy(max_connections=1, idle_timeout=0.2)
+    port = free_port()
+    threading.Thread(target=server.start_server, args=("127.0.0.1", port),
+                     kwargs={"policy": policy}, daemon=True).start()
+    with connect(port) as first:
+        send(first, {"command": "NOT_A_COMMAND"})
+        assert reply(first)["status"] == "error"
+        with connect(port) as second:
+            assert reply(second) is None # over the cap
+        assert reply(first) is None # then idle
+    wait_until(lambda: policy.open == 0)
+
+
+def test_pushes_reach_subscribed_clients(serve, new_player):
+    port = serve().port
+    watcher, player = NetworkClient(port=port), NetworkClient(port=port)
+    scores = []
+    watcher.on("score", scores.append)
+    assert watcher.subscribe(["leaderboard"])["topics"] == ["leaderboard"]
+    pid = new_player()
+    assert player.send("SAVE_SESSION", {"pid": pid, "diff": 1, "score": 42, "win": True})["status"] == "success"
+    wait_until(lambda: watcher.poll() or scores)
+    (score,) = scores
+    assert dict(score, rank=None) == {"player_id": pid, "difficulty": 1, "score": 42, "win": True, "rank": None}
+    assert player.poll() == 0 # never subscribed
+    watcher.client.close()
+    player.client.close()
+
+
+def test_client_records_round_trips_under_the_request_trace(serve, tmp_path):
+    import tracing
+    path = str(tmp_path / "client.trace")
+    client = NetworkClient(port=serve().port, trace_file=path)
+    client.send("NOT_A_COMMAND", {})
+    trace = client.last_trace
+    client.client.close()
+    wait_until(lambda: any(e.get("args", {}).get("trace") == trace for e in tracing.read_events(path)))
+    (rtt,) = [e for e in tracing.read_events(path) if e.get("args", {}).get("trace") == trace]
+    assert rtt["name"] == "rtt NOT_A_COMMAND" and rtt["cat"] == "client"
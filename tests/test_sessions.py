@@ -0,0 +1,166 @@
+import json
+import os
+import secrets
+import threading
+import time
+
+import sessions
+from sessions import SessionStore
+
+
+def test_issued_token_validates():
+    store = SessionStore()
+    token, session = store.issue(5, "alice", "PLAYER")
+    found = store.validate(token)
+    assert found.sid == session.sid
+    assert (found.user_id, found.username, found.role) == (5, "alice", "PLAYER")
+
+
+def test_tampered_and_malformed_tokens_are_refused():
+    store = SessionStore()
+    token, _ = store.issue(5, "alice", "PLAYER")
+    sid, uid, expires, sig = token.split(".")
+    assert store.validate(f"{sid}.6.{expires}.{sig}") is None            # other user
+    assert store.validate(f"{sid}.{uid}.{int(expires) + 60}.{sig}") is None # longer life
+    assert store.validate(token[:-2] + "AA") is None
+    assert SessionStore().validate(token) is None                         # other secret
+    for bad in ("", "a.b.c", "a.b.c.d.e", "x.notanumber.1.sig", None, 12):
+        assert store.validate(bad) is None
+
+
+def test_expired_token_is_refused():
+    store = SessionStore(ttl=-1)
+    token, _ = store.issue(5, "alice", "PLAYER")
+    assert store.validate(token) is None
+
+
+def test_revoke_and_revoke_user():
+    store = SessionStore()
+    first, s1 = store.issue(5, "alice", "PLAYER")
+    second, _ = store.issue(5, "alice", "PLAYER")
+    other, _ = store.issue(6, "bob", "PLAYER")
+    store.revoke(s1.sid)
+    assert store.validate(first) is None and store.validate(second) is not None
+    store.revoke_user(5)
+    assert store.validate(second) is None
+    assert store.validate(other) is not None
+    assert store.active() == 1
+
+
+def test_processes_sharing_a_file_see_each_others_changes(tmp_path):
+    path = str(tmp_path / "sessions.log")
+    a, b = SessionStore(b"k" * 32, path), SessionStore(b"k" * 32, path)
+    token, session = a.issue(5, "alice", "PLAYER")
+    assert b.validate(token).sid == session.sid # picked up by catch_up
+    b.revoke_user(5)
+    assert a.validate(token) is None
+
+
+def test_load_drops_expired_sessions_and_compacts(tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.log")
+    store = SessionStore(b"k" * 32, path)
+    keep, _ = store.issue(5, "alice", "PLAYER")
+    store.issue(6, "bob", "PLAYER")
+    gone, _ = store.issue(6, "bob", "PLAYER")
+    store.revoke_user(6)
+    old = SessionStore(b"k" * 32, path, ttl=-10)
+    old.issue(7, "carol", "PLAYER")
+
+    fresh = SessionStore(b"k" * 32, path)
+    fresh.load()
+    assert fresh.active() == 1
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["uid"] for line in f] == [5]
+    assert fresh.validate(keep) is not None and fresh.validate(gone) is None
+
+    # and a token expires once its time is up, even without a reload
+    monkeypatch.setattr(time, "time", lambda: fresh.sessions[keep.split(".")[0]].expires + 1)
+    assert fresh.validate(keep) is None
+
+
+def test_secret_comes_from_the_key_file(tmp_path, monkeypatch):
+    monkeypatch.delenv(sessions.SECRET_ENV, raising=False)
+    path = str(tmp_path / "sessions.log")
+    assert sessions.load_secret(path) == sessions.load_secret(path)
+    monkeypatch.setenv(sessions.SECRET_ENV, "from-env")
+    assert sessions.load_secret(path) == b"from-env"
+
+
+def test_the_file_is_compacted_while_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "COMPACT_BYTES", 2000)
+    path = str(tmp_path / "sessions.log")
+    store = SessionStore(b"k" * 32, path)
+    keep, _ = store.issue(1, "alice", "PLAYER")
+    for _ in range(100):
+        store.issue(2, "bob", "PLAYER")
+        store.revoke_user(2)
+    assert os.path.getsize(path) < 4000
+    assert store.validate(keep) is not None and store.active() == 1
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["uid"] for line in f][0] == 1
+
+
+def test_other_processes_cope_with_the_replaced_file(tmp_path):
+    path = str(tmp_path / "sessions.log")
+    a, b = SessionStore(b"k" * 32, path), SessionStore(b"k" * 32, path)
+    revoked, _ = a.issue(5, "alice", "PLAYER")
+    kept, _ = a.issue(6, "bob", "PLAYER")
+    assert b.validate(revoked) is not None # b has read the old file
+    a.revoke_user(5)
+    a.compact()
+    assert b.validate(revoked) is None     # the revocation only survives as an absence
+    assert b.validate(kept) is not None
+    late, _ = a.issue(7, "carol", "PLAYER")
+    assert b.validate(late) is not None    # appended to the new file
+    assert b.active() == a.active() == 2
+
+
+def test_appends_are_not_lost_while_another_store_compacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "COMPACT_BYTES", 3000)
+    path = str(tmp_path / "sessions.log")
+    stores = [SessionStore(b"k" * 32, path) for _ in range(3)]
+    tokens = []
+
+    def issue_many(store, uid):
+        for _ in range(60):
+            tokens.append(store.issue(uid, "user", "PLAYER")[0])
+
+    threads = [threading.Thread(target=issue_many, args=(store, uid)) for uid, store in enumerate(stores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    fresh = SessionStore(b"k" * 32, path)
+    assert all(fresh.validate(token) is not None for token in tokens)
+    assert fresh.active() == 180
+
+
+def test_login_resume_and_logout(monkeypatch):
+    import commands
+    monkeypatch.setattr(sessions, "STORE", SessionStore())
+    name = f"resume_{secrets.token_hex(4)}"
+    assert commands.dispatch("REGISTER", {"username": name, "password": "pw"})["success"]
+    login = commands.dispatch("LOGIN", {"username": name, "password": "pw"}, commands.ClientContext("a"))
+    assert login["success"] and login["token"]
+
+    ctx = commands.ClientContext("b")
+    res = commands.dispatch("RESUME", {"token": login["token"]}, ctx)
+    assert res["success"] and (res["player_id"], res["username"]) == (login["player_id"], name)
+    assert ctx.user_id == login["player_id"]
+
+    commands.dispatch("LOGOUT", {}, ctx)
+    assert ctx.user_id is None
+    assert commands.dispatch("RESUME", {"token": login["token"]})["status"] == "error"
+
+
+def test_password_change_revokes_other_sessions_and_reissues(monkeypatch):
+    import commands
+    monkeypatch.setattr(sessions, "STORE", SessionStore())
+    name = f"pwchange_{secrets.token_hex(4)}"
+    commands.dispatch("REGISTER", {"username": name, "password": "pw"})
+    other = commands.dispatch("LOGIN", {"username": name, "password": "pw"})
+    ctx = commands.ClientContext("a")
+    mine = commands.dispatch("LOGIN", {"username": name, "password": "pw"}, ctx)
+    res = commands.dispatch("CHANGE_PASSWORD", {"player_id": mine["player_id"], "new_password": "pw2"}, ctx)
+    assert commands.dispatch("RESUME", {"token": other["token"]})["status"] == "error"
+    assert commands.dispatch("RESUME", {"token": res["token"]})["success"]
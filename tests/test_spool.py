@@ -0,0 +1,187 @@
+import itertools
+import os
+
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py needs it
+
+import auth
+import commands
+import spool
+from spool import Spool, SpoolFull
+
+_ids = itertools.count()
+
+
+@pytest.fixture
+def session(new_player):
+    """(player id, game session id) of a fresh game to hang events on."""
+    pid = new_player()
+    return pid, auth.save_game_session(pid, 1, 10, True)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "events.spool")
+
+
+def opened(path, spool_id):
+    sp = Spool(path, spool_id)
+    sp.open()
+    sp.load_checkpoint()
+    return sp
+
+
+def new_id():
+    return f"test:{os.getpid()}:{next(_ids)}"
+
+
+def events_in(query, sid):
+    return query("SELECT COUNT(*) FROM GameEvent WHERE GameSessionID = %s", (sid,))[0][0]
+
+
+def test_appended_events_reach_the_database(query, session, path):
+    pid, sid = session
+    sp = opened(path, new_id())
+    assert sp.checkpoint == 0
+    seqs = [sp.append(sid, [(pid, 1, "3", "POTTED"), (pid, None, None, "SHOT")]) for _ in range(3)]
+    assert seqs == [1, 2, 3] and sp.pending_rows == 6
+    assert events_in(query, sid) == 0 # spooled, not flushed yet
+    assert sp.flush_once() and not sp.flush_once()
+    assert events_in(query, sid) == 6
+    assert sp.checkpoint == 3 and auth.get_spool_checkpoint(sp.spool_id) == 3
+
+
+def test_nothing_is_spooled_before_the_checkpoint_is_known(session, path):
+    pid, sid = session
+    sp = Spool(path, new_id())
+    sp.open()
+    with pytest.raises(SpoolFull):
+        sp.append(sid, [(pid, None, None, "SHOT")])
+
+
+def test_pending_limit_sends_writers_to_the_database(session, path, monkeypatch):
+    pid, sid = session
+    monkeypatch.setattr(spool, "MAX_PENDING_ROWS", 3)
+    sp = opened(path, new_id())
+    sp.append(sid, [(pid, None, None, "SHOT")] * 3)
+    with pytest.raises(SpoolFull):
+        sp.append(sid, [(pid, None, None, "SHOT")])
+
+
+def test_restart_replays_only_what_was_not_flushed(query, session, path):
+    pid, sid = session
+    spool_id = new_id()
+    sp = opened(path, spool_id)
+    sp.append(sid, [(pid, None, None, "SHOT")] * 2)
+    sp.flush_once()
+    sp.append(sid, [(pid, None, None, "FOUL")] * 3)
+    os.close(sp.fd) # "crash" with the second record spooled but not flushed
+
+    again = Spool(path, spool_id)
+    again.open()
+    assert [r[0] for r in again.pending] == [1, 2] # the whole file is read back...
+    again.load_checkpoint()
+    assert [r[0] for r in again.pending] == [2]    # ...and what the DB has is dropped
+    again.flush_once()
+    assert events_in(query, sid) == 5
+    assert again.append(sid, [(pid, None, None, "SHOT")]) == 3
+
+
+def test_torn_tail_is_cut_off(session, path):
+    pid, sid = session
+    sp = opened(path, new_id())
+    sp.append(sid, [(pid, None, None, "SHOT")])
+    os.write(sp.fd, spool.encode_record(2, [sid, None, [[pid, None, None, "FOUL"]]])[:-4])
+    os.close(sp.fd)
+    good = os.path.getsize(path)
+
+    records, intact = spool.read_records(path)
+    assert [seq for seq, _ in records] == [1] and intact < good
+    again = Spool(path, sp.spool_id)
+    again.open()
+    assert os.path.getsize(path) == intact
+    assert again.next_seq == 2
+
+
+def test_compact_keeps_the_sequence_going(query, session, path, monkeypatch):
+    pid, sid = session
+    monkeypatch.setattr(spool, "COMPACT_BYTES", 1)
+    spool_id = new_id()
+    sp = opened(path, spool_id)
+    for _ in range(5):
+        sp.append(sid, [(pid, None, None, "SHOT")])
+    sp.compact()
+    assert len(spool.read_records(path)[0]) == 5 # not while anything is pending
+    sp.flush_once()
+    sp.compact()
+    assert spool.read_records(path)[0] == [(5, None)]
+    assert sp.append(sid, [(pid, None, None, "SHOT")]) == 6 # fd reopened on the new file
+    os.close(sp.fd)
+
+    again = opened(path, spool_id)
+    assert [r[0] for r in again.pending] == [6]
+    again.flush_once()
+    assert events_in(query, sid) == 6
+
+
+def test_lost_file_never_reuses_flushed_numbers(session, path):
+    pid, sid = session
+    spool_id = new_id()
+    sp = opened(path, spool_id)
+    sp.append(sid, [(pid, None, None, "SHOT")] * 2)
+    sp.flush_once()
+    os.close(sp.fd)
+    os.remove(path)
+    again = opened(path, spool_id)
+    assert again.append(sid, [(pid, None, None, "SHOT")]) == 2
+
+
+def test_rows_the_database_refuses_are_dropped_alone(query, session, path):
+    pid, sid = session
+    sp = opened(path, new_id())
+    sp.append(sid, [(pid, None, None, "SHOT")])
+    sp.append(999999999, [(pid, None, None, "SHOT")]) # no such session: foreign key error
+    sp.append(sid, [(pid, None, None, "FOUL")])
+    assert sp.flush_once()
+    assert events_in(query, sid) == 2
+    assert sp.checkpoint == 3 and sp.pending_rows == 0
+
+
+# --- SAVE_EVENTS inside an atomic BATCH ---
+
+def game(pid):
+    return {"requests": [
+        {"command": "SAVE_SESSION", "payload": {"pid": pid, "diff": 1, "score": 10, "win": True}},
+        {"command": "SAVE_EVENTS", "payload": {"session_id": {"$ref": "0.session_id"},
+                                               "events": [[pid, 1, "3", "POTTED"]]}}]}
+
+
+def test_events_are_spooled_once_the_batch_commits(session, path, monkeypatch):
+    pid, _ = session
+    monkeypatch.setattr(spool, "SPOOL", opened(path, new_id()))
+    res = commands.dispatch("BATCH", game(pid))
+    assert res["status"] == "success" and res["results"][1]["spooled"]
+    assert spool.SPOOL.pending_rows == 1
+
+    failing = game(pid)
+    failing["requests"].append({"command": "SAVE_SESSION",
+                                "payload": {"pid": 999999999, "diff": 1, "score": 10, "win": True}})
+    assert commands.dispatch("BATCH", failing)["rolled_back"]
+    assert spool.SPOOL.pending_rows == 1 # the rolled-back game spooled nothing
+
+
+def test_a_failing_spool_does_not_fail_a_committed_batch(query, session, path, monkeypatch):
+    pid, _ = session
+    sp = opened(path, new_id())
+
+    def broken(session_id, events):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(sp, "append", broken)
+    monkeypatch.setattr(spool, "SPOOL", sp)
+    res = commands.dispatch("BATCH", game(pid))
+    assert res["status"] == "success"
+    sid = res["results"][0]["session_id"]
+    assert query("SELECT COUNT(*) FROM GameSession WHERE GameSessionID = %s", (sid,))[0][0] == 1
+    assert events_in(query, sid) == 1 # written directly instead
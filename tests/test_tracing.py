@@ -0,0 +1,91 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py, which server.py imports, needs it
+
+import server
+import tracing
+from commands import ClientContext
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    """Turns span recording on for the test, into the returned path."""
+    path = str(tmp_path / "server.trace")
+    tracing.configure(path)
+    yield path
+    tracing.configure(None)
+
+
+def spans(path, trace, count):
+    """The "X" events of `trace`, once at least `count` of them are written."""
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            found = [e for e in tracing.read_events(path) if e["ph"] == "X" and e["args"]["trace"] == trace]
+        except (OSError, ValueError): # not created yet, or a batch half written
+            found = []
+        if len(found) >= count:
+            return found
+        assert time.monotonic() < deadline, f"only {len(found)} spans"
+        time.sleep(0.01)
+
+
+def run(request):
+    return server.process_request(request, ClientContext(("127.0.0.1", 0)), 0, time.perf_counter())
+
+
+def test_a_traced_request_records_each_stage(trace_file, new_player):
+    trace = tracing.new_id()
+    run({"command": "GET_HISTORY", "payload": {"player_id": new_player()}, "trace": trace})
+    found = spans(trace_file, trace, 5)
+    names = [e["name"] for e in found]
+    for stage in ("queue", "dispatch", "checkout", "execute", "encode", "request GET_HISTORY"):
+        assert stage in names
+    sql = [e for e in found if e["cat"] == "db" and e["name"] == "execute"]
+    assert sql and all(e["args"]["sql"].startswith(("SELECT", "CALL")) for e in sql)
+    whole = next(e for e in found if e["name"] == "request GET_HISTORY")
+    assert all(e["ts"] >= whole["ts"] for e in found if e is not whole)
+
+
+def test_batch_sub_commands_get_their_own_spans(trace_file):
+    trace = tracing.new_id()
+    run({"command": "BATCH", "payload": {"mode": "best_effort", "requests": [
+        {"command": "GET_ALL_ACHIEVEMENTS", "payload": {}}, {"command": "STATS", "payload": {}}]},
+        "trace": trace})
+    names = [e["name"] for e in spans(trace_file, trace, 4)]
+    assert "GET_ALL_ACHIEVEMENTS" in names and "STATS" in names
+
+
+def test_untraced_requests_record_nothing(trace_file):
+    run({"command": "STATS", "payload": {}})
+    traced = tracing.new_id()
+    run({"command": "STATS", "payload": {}, "trace": traced})
+    spans(trace_file, traced, 1)
+    events = tracing.read_events(trace_file)
+    assert all(e["args"]["trace"] == traced for e in events if e["ph"] == "X")
+
+
+@pytest.mark.parametrize("trace", [None, 7, "", "x" * 65])
+def test_odd_trace_ids_are_ignored(trace_file, trace):
+    assert tracing.trace_of({"trace": trace}) is None
+
+
+def test_nothing_is_traced_while_tracing_is_off():
+    assert tracing.trace_of({"trace": "abc"}) is None
+    tracing.begin("abc")
+    assert tracing.current() is None
+
+
+def test_merge_keeps_one_trace(tmp_path):
+    client, srv = tmp_path / "client.trace", tmp_path / "server.trace"
+    client.write_text('[\n{"name":"process_name","ph":"M","pid":1,"tid":0,"args":{}},\n'
+                      '{"name":"rtt LOGIN","ph":"X","ts":30,"args":{"trace":"a"}},\n')
+    srv.write_text('[\n{"name":"dispatch","ph":"X","ts":20,"args":{"trace":"a"}},\n'
+                   '{"name":"dispatch","ph":"X","ts":10,"args":{"trace":"b"}},\n')
+    out = tmp_path / "merged.json"
+    tracing.main(["merge", str(client), str(srv), "-o", str(out), "--trace", "a"])
+    merged = json.loads(out.read_text())
+    assert [e["name"] for e in merged] == ["process_name", "dispatch", "rtt LOGIN"]
@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip("mysql.connector") # auth.py needs it
+
+import auth
+import commands
+
+NAMES = ["pg_x", "pgAx", "pg%x", "pg%", "pg!x", "pg!!", "pg|x", "pg|", "PGb", "pgz"]
+
+
+@pytest.fixture
+def odd_names(new_player):
+    """Users whose names contain LIKE wildcards, the escape character and the cursor separator."""
+    for i, name in enumerate(NAMES):
+        new_player(name, "ADMIN" if i % 4 == 0 else "PLAYER")
+
+
+def everyone(query):
+    return query("SELECT u.UserID, u.Username, u.Role, ps.PlayerID IS NOT NULL, "
+                       "COALESCE(ps.GamesPlayed, 0), COALESCE(ps.Wins, 0) "
+                       "FROM User u LEFT JOIN PlayerStats ps ON ps.PlayerID = u.UserID")
+
+
+def expected(users, sort, search, role):
+    rows = [u for u in users if (not search or u[1].lower().startswith(search.lower())) and (not role or u[2] == role)]
+    if sort == "name":
+        rows.sort(key=lambda u: u[1])
+    elif sort == "newest":
+        rows.sort(key=lambda u: -u[0])
+    else:
+        column = 4 if sort == "games" else 5
+        rows.sort(key=lambda u: (not u[3], -u[column] if u[3] else 0, -u[0]))
+    return [u[0] for u in rows]
+
+
+def walk(limit, **query):
+    """Every page of GET_USERS, following "next"; returns (user ids, pages)."""
+    ids, after, pages = [], None, 0
+    while True:
+        res = commands.dispatch("GET_USERS", dict(query, limit=limit, after=after))
+        assert res["status"] == "success", res
+        ids += [u["UserID"] for u in res["data"]]
+        pages += 1
+        after = res.get("next")
+        if not after:
+            return ids, pages
+
+
+def test_pages_match_brute_force(query, odd_names):
+    users = everyone(query)
+    for sort in auth.USER_SORTS:
+        for search in (None, "bench1", "pg", "PG", "pg_", "pg%", "pg!", "pg!!", "pg|", "nomatch"):
+            for role in (None, "PLAYER", "ADMIN"):
+                want = expected(users, sort, search, role)
+                for limit in (1, 3, 50):
+                    got, pages = walk(limit, sort=sort, search=search, role=role)
+                    assert got == want, (sort, search, role, limit)
+                    assert pages == max(1, -(-len(want) // limit))
+
+
+def test_page_rows_carry_stats(new_player):
+    pid = new_player("pgstats")
+    auth.save_game_session(pid, 1, 10, True)
+    auth.save_game_session(pid, 1, 10, False)
+    res = commands.dispatch("GET_USERS", {"search": "pgstats"})
+    assert [(u["Username"], u["Role"], u["GamesPlayed"], u["Wins"]) for u in res["data"]] == [("pgstats", "PLAYER", 2, 1)]
+    assert "next" not in res
+
+
+@pytest.mark.parametrize("sort, cursor, after", [
+    ("name", "name|a|b", ("a|b",)),
+    ("newest", "newest|12", (12,)),
+    ("games", "games|stats|4|12", ("stats", 4, 12)),
+    ("wins", "wins|rest|12", ("rest", 12)),
+])
+def test_cursor_round_trip(sort, cursor, after):
+    assert commands.parse_users_cursor(sort, cursor) == after
+    assert commands.users_cursor(sort, after) == cursor
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"sort": "bogus"}, "sort must be"),
+    ({"role": "OWNER"}, "role must be"),
+    ({"sort": "games", "after": "name|x"}, "Invalid users cursor"),
+    ({"sort": "newest", "after": "newest|x"}, "Invalid users cursor"),
+    ({"sort": "wins", "after": "wins|stats|1"}, "Invalid users cursor"),
+    ({"sort": "games", "after": "games|rest|-3"}, "Invalid users cursor"),
+    ({"after": "name|"}, "Invalid users cursor"),
+])
+def test_bad_requests(payload, message):
+    res = commands.dispatch("GET_USERS", payload)
+    assert res["status"] == "error" and message in res["message"]
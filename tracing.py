@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+
+# --- REQUEST TRACING ---
+# Shows where one request's time went: network, server queueing, the
+# command, each SQL statement, encoding.
+#
+# NetworkClient puts a trace id in every request envelope:
+#   {"command": "BATCH", "payload": {...}, "id": 7, "trace": "9f2c..."}
+# A server started with --trace-file records spans for requests that carry
+# one: decode, queue (waiting for a worker), dispatch, every cursor call,
+# commit/rollback, encode, and the whole request. A client given a
+# trace_file records the round trip of each request under the same id.
+#
+# Spans are written in Chrome trace-event format (a JSON array with one
+# "X" event per span) to be opened in chrome://tracing or ui.perfetto.dev.
+# Timestamps are wall-clock microseconds, so client and server files line
+# up; merge them (and optionally pick one trace) with
+#   python tracing.py merge client.trace server.trace -o merged.json --trace 9f2c...
+#
+# With tracing off, the server pays one attribute lookup per span site.
+# Files are appended to by a background thread, like logger.py; spans are
+# dropped, not waited for, when it falls behind. Prefork workers share one
+# file (one write() per batch on an O_APPEND file).
+
+QUEUE_SIZE = 50000
+SQL_CHARS = 200 # statement text kept per SQL span
+
+WRITER = None # TraceWriter while tracing is on in this process
+_local = threading.local()
+
+
+def new_id():
+    return secrets.token_hex(8)
+
+
+class TraceWriter:
+    def __init__(self, path, process_name):
+        self.path = path
+        self.process_name = process_name
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.fd = None
+        self.pid = None
+        self.named_threads = set()
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def add(self, event):
+        if self.pid != os.getpid(): # first span in this process (or after a fork)
+            self.start()
+        tid = threading.get_ident()
+        if tid not in self.named_threads:
+            self.named_threads.add(tid)
+            self.put({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                      "args": {"name": threading.current_thread().name}})
+        event["pid"] = self.pid
+        event["tid"] = tid
+        self.put(event)
+
+    def span(self, name, seconds, cat, trace, args):
+        now = time.time()
+        args["trace"] = trace
+        self.add({"name": name, "cat": cat, "ph": "X", "ts": round((now - seconds) * 1e6),
+                  "dur": round(seconds * 1e6), "args": args})
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.queue = queue.Queue(QUEUE_SIZE)
+            self.named_threads = set()
+            try: # whoever creates the file opens the JSON array
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+                os.write(fd, b"[\n")
+            except FileExistsError:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            self.fd = fd
+            self.queue.put_nowait({"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                                   "args": {"name": f"{self.process_name} ({self.pid})"}})
+            threading.Thread(target=self.run, args=(self.queue, fd), name="trace-writer", daemon=True).start()
+
+    @staticmethod
+    def run(events, fd):
+        while True:
+            batch = [events.get()]
+            while len(batch) < 512:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            # Trailing commas are fine: the trace viewers accept an
+            # unterminated array, and merge() tidies it up
+            data = "".join(json.dumps(e, default=str, separators=(",", ":")) + ",\n" for e in batch)
+            try:
+                os.write(fd, data.encode("utf-8"))
+            except OSError:
+                pass
+
+
+def configure(path, process_name="server"):
+    """Turns on span recording for this process (and its prefork children)."""
+    global WRITER
+    WRITER = TraceWriter(path, process_name) if path else None
+
+
+def trace_of(request):
+    """The request's trace id if we are recording and it looks sane, else None."""
+    trace = request.get('trace') if WRITER is not None else None
+    if isinstance(trace, str) and 0 < len(trace) <= 64:
+        return trace
+    return None
+
+
+def begin(trace_id):
+    """Marks this thread as working on trace_id; spans recorded until end() belong to it."""
+    _local.trace = trace_id if WRITER is not None else None
+
+
+def end():
+    _local.trace = None
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+def record(name, seconds, cat="server", trace=None, **args):
+    """Records a span of `seconds` that ended just now, for `trace` or this thread's trace."""
+    trace = trace or current()
+    if WRITER is not None and trace is not None:
+        WRITER.span(name, seconds, cat, trace, args)
+
+
+def sql_text(args):
+    """Statement text for an SQL span (no parameters, so no user data)."""
+    if args and isinstance(args[0], str):
+        return " ".join(args[0].split())[:SQL_CHARS]
+    return None
+
+
+class span:
+    """with tracing.span("encode"): ... records a span if this thread is tracing."""
+    __slots__ = ("name", "args", "started")
+
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+        self.started = None
+
+    def __enter__(self):
+        if current() is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.started is not None:
+            record(self.name, time.perf_counter() - self.started, **self.args)
+
+
+# --- MERGE ---
+
+def read_events(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip().rstrip(",")
+    if not text.startswith("["):
+        text = "[" + text
+    if not text.endswith("]"):
+        text += "]"
+    return json.loads(text)
+
+
+def merge(paths, trace=None):
+    """Events from several trace files in one list, optionally only one trace id."""
+    events = []
+    for path in paths:
+        events.extend(read_events(path))
+    if trace:
+        events = [e for e in events if e.get("ph") == "M" or e.get("args", {}).get("trace") == trace]
+    events.sort(key=lambda e: e.get("ts", 0))
+    return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pool Game trace files")
+    sub = parser.add_subparsers(dest="action", required=True)
+    m = sub.add_parser("merge", help="combine client and server trace files")
+    m.add_argument("files", nargs="+")
+    m.add_argument("-o", "--output", default="merged.json")
+    m.add_argument("--trace", help="keep only this trace id")
+    args = parser.parse_args(argv)
+
+    events = merge(args.files, args.trace)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(events, f)
+    print(f"{len(events)} events written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()